@@ -3,7 +3,6 @@ import logging
 import numpy as np
 import face_recognition
 import os
-import gc
 import time
 import sys
 from io import BytesIO
@@ -26,9 +25,9 @@ logger.addHandler(handler)
 
 # Constants
 FACE_MATCH_THRESHOLD = 0.5
-GC_INTERVAL = 30
 MAX_RETRIES = 3
 RETRY_WAIT = 2000  # in milliseconds
+VIDEO_SOURCE = os.getenv('VIDEO_SOURCE', '0')  # Camera index, stream URL or video file
 
 # Initialize Firebase Admin SDK
 def initialize_firebase():
@@ -101,10 +100,10 @@ def load_known_people_images_from_firebase():
     logger.info("Finished loading known people images.")
     return known_encodings
 
-# Function to process a single frame and recognize faces
-def process_frame(frame, known_encodings):
+# Function to process a single frame and recognize faces (converted into rgb_frame when given)
+def process_frame(frame, known_encodings, rgb_frame=None):
     try:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
         face_locations = face_recognition.face_locations(rgb_frame)
         face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
 
@@ -186,8 +185,8 @@ def speak_name(name):
 # Function to retry initializing the webcam
 @retry(stop_max_attempt_number=MAX_RETRIES, wait_fixed=RETRY_WAIT)
 def initialize_webcam():
-    logger.info("Initializing webcam...")
-    video_capture = cv2.VideoCapture(0)
+    logger.info(f"Initializing video source {VIDEO_SOURCE}...")
+    video_capture = cv2.VideoCapture(int(VIDEO_SOURCE) if VIDEO_SOURCE.isdigit() else VIDEO_SOURCE)
     video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
     video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
     
@@ -206,16 +205,21 @@ def process_video(video_capture):
             logger.error("Failed to open video capture.")
             return
         
-        frame_counter = 0
         logger.info("Starting video processing...")
 
+        # Every frame is read and converted into the same two buffers instead of new arrays
+        frame = None
+        rgb_frame = None
+
         while True:
-            ret, frame = video_capture.read()
+            ret, frame = video_capture.read(frame) if frame is not None else video_capture.read()
             if not ret:
                 logger.warning("Frame not retrieved, stopping video stream.")
                 break
 
-            recognized_faces = process_frame(frame, known_encodings)
+            if rgb_frame is None or rgb_frame.shape != frame.shape:
+                rgb_frame = np.empty_like(frame)
+            recognized_faces = process_frame(frame, known_encodings, rgb_frame)
             detected_names = {name for (_, _, _, _, name) in recognized_faces}
 
             if detected_names and detected_names != previous_names:
@@ -258,11 +262,6 @@ def process_video(video_capture):
                 logger.info("Stopping video stream on 'q' press.")
                 break
 
-            frame_counter += 1
-            if frame_counter % GC_INTERVAL == 0:
-                gc.collect()
-                logger.info("Garbage collection performed.")
-
     except Exception as e:
         logger.error(f"Error processing video: {e}")
 
@@ -270,7 +269,6 @@ def process_video(video_capture):
         video_capture.release()
         cv2.destroyAllWindows()
         logger.info("Video capture released.")
-        gc.collect()
 
 if __name__ == "__main__":
     logger.info("Starting face recognition system...")
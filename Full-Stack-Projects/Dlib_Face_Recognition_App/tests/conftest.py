@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The server imports its modules as `logics.*` and `logger_config` from web_server_flask/
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_server_flask')
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
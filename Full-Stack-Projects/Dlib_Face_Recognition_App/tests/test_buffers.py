@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+from logics.buffers import BufferPool, resize_frame, convert_color
+
+SHAPE = (4, 6, 3)
+
+
+def test_released_buffers_are_reused():
+    pool = BufferPool(size=2)
+    first = pool.acquire(SHAPE)
+    first_id = id(first)
+    del first
+
+    assert id(pool.acquire(SHAPE)) == first_id
+    assert pool.stats()['allocated'] == 1
+    assert pool.stats()['reused'] == 1
+
+
+def test_buffers_in_use_are_not_handed_out_twice():
+    pool = BufferPool(size=2)
+    first = pool.acquire(SHAPE)
+    view = first[1:]
+    del first
+    second = pool.acquire(SHAPE)
+
+    assert second is not view.base
+    assert pool.stats()['buffers'] == 2
+
+
+def test_pool_overflow_allocates_temporary_buffers():
+    pool = BufferPool(size=1)
+    held = [pool.acquire(SHAPE) for _ in range(3)]
+
+    assert len({id(buffer) for buffer in held}) == 3
+    assert pool.stats()['buffers'] == 1
+    assert pool.stats()['overflow'] == 2
+
+
+def test_memory_cap_limits_the_pool():
+    pool = BufferPool(size=8, max_mb=100 / (1024 * 1024))
+    held = [pool.acquire(SHAPE) for _ in range(3)]  # 72 bytes each
+
+    assert pool.stats()['buffers'] == 1
+    assert pool.bytes == held[0].nbytes
+
+
+def test_shapes_and_dtypes_are_pooled_separately():
+    pool = BufferPool(size=2, max_shapes=2)
+    pool.acquire(SHAPE)
+    pool.acquire(SHAPE, np.float32)
+    pool.acquire((2, 2))
+
+    assert pool.stats()['shapes'] == 2
+    assert (SHAPE, np.dtype(np.uint8).str) not in pool._buffers
+
+
+def test_disabled_pool_always_allocates():
+    pool = BufferPool(size=0)
+    pool.acquire(SHAPE)
+    pool.acquire(SHAPE)
+
+    assert pool.stats()['buffers'] == 0
+    assert pool.allocated == 0 and pool.reused == 0
+
+
+def test_resize_and_convert_write_into_pooled_buffers():
+    pool = BufferPool(size=2)
+    frame = np.arange(2 * 4 * 3, dtype=np.uint8).reshape(2, 4, 3)
+
+    half = resize_frame(frame, 0.5, pool=pool)
+    rgb = convert_color(frame, cv2.COLOR_BGR2RGB, pool=pool)
+
+    assert half.shape == (1, 2, 3)
+    np.testing.assert_array_equal(rgb, frame[:, :, ::-1])
+    assert pool.stats()['shapes'] == 2
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from logics.detection import DetectionScaler, scale_locations, MIN_DETECTION_SCALE
+
+
+def test_scale_locations_maps_boxes_back_and_clips():
+    assert scale_locations([(10, 20, 30, 5)], 0.5, (50, 30)) == [(20, 30, 50, 10)]
+
+
+def test_fixed_scale_is_clamped():
+    assert DetectionScaler(scale='0.1').scale_for((480, 640)) == MIN_DETECTION_SCALE
+    assert DetectionScaler(scale='2').scale_for((480, 640)) == 1.0
+
+
+def test_auto_scale_starts_at_max_side():
+    scaler = DetectionScaler(scale='auto', max_side=640)
+
+    assert scaler.scale_for((480, 640)) == 1.0
+    assert scaler.scale_for((1080, 1920)) == pytest.approx(640 / 1920)
+    assert scaler.scale_for((4000, 6000)) == MIN_DETECTION_SCALE
+
+
+def test_auto_scale_steps_down_over_budget_per_size_bucket():
+    scaler = DetectionScaler(scale='auto', max_side=640, latency_budget_ms=10)
+    for _ in range(5):
+        scaler.scale_for((1080, 1920))
+        scaler.observe((1080, 1920), 0.1)
+
+    assert scaler.scale_for((1080, 1920)) < 640 / 1920
+    assert scaler.scale_for((1079, 1910)) == scaler.scale_for((1080, 1920))
+    assert scaler.scale_for((480, 640)) == 1.0
+
+
+def test_auto_scale_tables_stay_bounded():
+    scaler = DetectionScaler(scale='auto', max_side=640)
+    rng = np.random.default_rng(0)
+    for height, width in rng.integers(16, 20000, size=(2000, 2)):
+        scaler.observe((height, width), scaler.scale_for((height, width)) * 0.01)
+
+    assert len(scaler._auto_scales) <= 640 / MIN_DETECTION_SCALE / 64
+    assert len(scaler._latency) == len(scaler._auto_scales)
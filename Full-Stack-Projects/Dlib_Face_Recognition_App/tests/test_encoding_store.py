@@ -0,0 +1,90 @@
+import os
+import json
+import numpy as np
+import pytest
+from logics.encoding_store import EncodingStore, MANIFEST_NAME
+
+
+def encoding(value, dim=4):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def test_round_trip(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('known_people/ann/1.jpg', 'f1', 'ann', '1.jpg', encoding(1))
+    store.put('known_people/ann/2.jpg', 'f2', 'ann', '2.jpg', None)
+    store.save(keep=['known_people/ann/1.jpg', 'known_people/ann/2.jpg'])
+
+    loaded = EncodingStore(str(tmp_path), dim=4).load()
+
+    assert loaded.generation == 1 and len(loaded) == 2
+    np.testing.assert_array_equal(loaded.get('known_people/ann/1.jpg', 'f1'), encoding(1))
+    assert loaded.get('known_people/ann/2.jpg', 'f2') is None
+
+
+def test_changed_or_unknown_blobs_miss(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', encoding(1))
+    store.save(keep=['a'])
+
+    with pytest.raises(KeyError):
+        store.get('a', 'f2')
+    with pytest.raises(KeyError):
+        store.get('b', 'f1')
+
+
+def test_pending_entries_are_served_before_save(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', [1, 2, 3, 4])
+
+    np.testing.assert_array_equal(store.get('a', 'f1'), [1, 2, 3, 4])
+    assert not os.path.exists(tmp_path / MANIFEST_NAME)
+
+
+def test_save_drops_missing_blobs_and_the_previous_generation(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', encoding(1))
+    store.put('b', 'f1', 'bob', 'b.jpg', encoding(2))
+    store.save(keep=['a', 'b'])
+    store.save(keep=['b'])
+
+    assert store.generation == 2
+    assert sorted(os.listdir(tmp_path)) == ['encodings-2.npy', MANIFEST_NAME]
+    with pytest.raises(KeyError):
+        store.get('a', 'f1')
+    np.testing.assert_array_equal(store.get('b', 'f1'), encoding(2))
+
+
+def test_save_without_changes_keeps_the_generation(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', encoding(1))
+    store.save(keep=['a'])
+    store.save(keep=['a'])
+
+    assert store.generation == 1
+
+
+def test_incompatible_or_corrupt_stores_load_empty(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', encoding(1))
+    store.save(keep=['a'])
+
+    assert len(EncodingStore(str(tmp_path), dim=8).load()) == 0
+
+    os.remove(tmp_path / 'encodings-1.npy')
+    assert len(EncodingStore(str(tmp_path), dim=4).load()) == 0
+
+    (tmp_path / MANIFEST_NAME).write_text('{not json')
+    assert len(EncodingStore(str(tmp_path), dim=4).load()) == 0
+
+
+def test_manifest_lists_rows_and_no_face_entries(tmp_path):
+    store = EncodingStore(str(tmp_path), dim=4)
+    store.put('a', 'f1', 'ann', 'a.jpg', None)
+    store.put('b', 'f1', 'bob', 'b.jpg', encoding(2))
+    store.save(keep=['a', 'b'])
+
+    with open(tmp_path / MANIFEST_NAME) as f:
+        entries = json.load(f)['entries']
+    assert entries['a']['row'] == -1
+    assert entries['b'] == {'person': 'bob', 'filename': 'b.jpg', 'fingerprint': 'f1', 'row': 0}
@@ -0,0 +1,112 @@
+from collections import namedtuple
+import numpy as np
+import pytest
+from logics.enrollment import EnrollmentPipeline
+from logics.storage import LocalStorage, KNOWN_PEOPLE_PREFIX, group_by_person, split_person_path
+
+Job = namedtuple('Job', ['filename', 'content'])
+
+JOBS = [Job('1.jpg', b'\x01\x02'), Job('2.PNG', b'\x03'), Job('1.jpeg', b''), Job('broken.jpg', b'broken')]
+
+
+def encode_bytes(img_bytes):
+    """
+    Stand-in encoder: no face in empty images, a broken image raises.
+    """
+    if img_bytes == b'broken':
+        raise ValueError("not an image")
+    return np.frombuffer(img_bytes, dtype=np.uint8).astype(np.float32) if img_bytes else None
+
+
+def fetch_content(job):
+    if job.content is None:
+        raise FileNotFoundError(job.filename)
+    return job.content
+
+
+@pytest.fixture
+def storage(tmp_path):
+    files = {
+        'ann/1.jpg': b'\x01\x02',
+        'ann/2.PNG': b'\x03',
+        'bob/1.jpeg': b'',
+        'bob/notes.txt': b'not an image',
+        'carl/broken.jpg': b'broken',
+        'loose.jpg': b'\x09',
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(content)
+    return LocalStorage(str(tmp_path))
+
+
+def test_split_person_path():
+    assert split_person_path('ann/1.JPG') == ('ann', '1.JPG')
+    assert split_person_path('ann/') is None
+    assert split_person_path('ann/readme.md') is None
+    assert split_person_path('1.jpg') is None
+
+
+def test_local_storage_lists_person_images(storage):
+    images = storage.list_images()
+
+    assert sorted(image.name for image in images) == [
+        KNOWN_PEOPLE_PREFIX + name for name in ('ann/1.jpg', 'ann/2.PNG', 'bob/1.jpeg', 'carl/broken.jpg')]
+    people = group_by_person(images)
+    assert sorted(people) == ['ann', 'bob', 'carl']
+    assert [image.filename for image in people['ann']] == ['1.jpg', '2.PNG']
+    assert storage.download(people['ann'][0]) == b'\x01\x02'
+
+
+def test_local_storage_fingerprint_follows_the_content(storage, tmp_path):
+    before = {image.name: image.fingerprint for image in storage.list_images()}
+    (tmp_path / 'ann' / '1.jpg').write_bytes(b'\x01\x02\x03')
+    after = {image.name: image.fingerprint for image in storage.list_images()}
+
+    changed = [name for name in before if before[name] != after[name]]
+    assert changed == [KNOWN_PEOPLE_PREFIX + 'ann/1.jpg']
+
+
+@pytest.mark.parametrize('use_processes', [False, True])
+def test_pipeline_encodes_every_image(use_processes):
+    pipeline = EnrollmentPipeline(encode_bytes, fetch=fetch_content, download_workers=2, encode_workers=2,
+                                  use_processes=use_processes, max_in_flight=2)
+
+    results = {result.job.filename: result for result in pipeline.run(JOBS)}
+
+    assert sorted(results) == ['1.jpeg', '1.jpg', '2.PNG', 'broken.jpg']
+    np.testing.assert_array_equal(results['1.jpg'].encoding, [1, 2])
+    assert results['1.jpeg'].encoding is None and results['1.jpeg'].error is None
+    assert isinstance(results['broken.jpg'].error, Exception)
+
+    report = pipeline.report()
+    assert report['download']['items'] == 4 and report['download']['bytes'] == 9
+    assert report['encode']['items'] == 3 and report['encode']['errors'] == 1
+
+
+def test_pipeline_reports_download_errors():
+    jobs = [Job('1.jpg', None)] + JOBS[1:]
+    pipeline = EnrollmentPipeline(encode_bytes, fetch=fetch_content, use_processes=False)
+
+    errors = [result for result in pipeline.run(jobs) if result.error is not None]
+
+    assert sorted(result.job.filename for result in errors) == ['1.jpg', 'broken.jpg']
+    assert pipeline.download_stats.errors == 1
+
+
+def test_pipeline_without_jobs():
+    pipeline = EnrollmentPipeline(encode_bytes, fetch=fetch_content, use_processes=False)
+
+    assert list(pipeline.run([])) == []
+    assert pipeline.report()['download']['items'] == 0
+
+
+def test_pipeline_runs_on_storage_listings(storage):
+    pipeline = EnrollmentPipeline(encode_bytes, fetch=storage.download, use_processes=False)
+
+    results = {result.job.name: result for result in pipeline.run(storage.list_images())}
+
+    assert len(results) == 4
+    np.testing.assert_array_equal(results[KNOWN_PEOPLE_PREFIX + 'ann/1.jpg'].encoding, [1, 2])
+    assert isinstance(results[KNOWN_PEOPLE_PREFIX + 'carl/broken.jpg'].error, ValueError)
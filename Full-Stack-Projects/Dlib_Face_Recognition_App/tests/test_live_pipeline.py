@@ -0,0 +1,112 @@
+import gevent
+import numpy as np
+from logics.live_pipeline import LatestSlot, FrameRing, StageTimer, LivePipeline
+
+
+def test_latest_slot_keeps_the_newest_item():
+    slot = LatestSlot()
+    slot.put('a')
+    slot.put('b')
+
+    assert slot.depth == 1
+    assert slot.get(timeout=0) == 'b'
+    assert slot.dropped == 1
+    assert slot.depth == 0
+
+
+def test_latest_slot_get_times_out():
+    assert LatestSlot().get(timeout=0.01) is None
+
+
+def test_latest_slot_wakes_a_waiting_consumer():
+    slot = LatestSlot()
+    consumer = gevent.spawn(slot.get, 1)
+    gevent.sleep(0)
+    slot.put('frame')
+
+    assert consumer.get(timeout=1) == 'frame'
+    assert slot.dropped == 0
+
+
+def test_frame_ring_reads_in_order():
+    ring = FrameRing(size=4)
+    ring.publish('f1')
+    ring.publish('f2')
+
+    assert ring.read_after(0) == (2, 'f2')
+    ring.publish('f3')
+    assert ring.read_after(2) == (3, 'f3')
+    assert ring.skipped == 0
+
+
+def test_frame_ring_skips_a_slow_reader_to_the_newest_frame():
+    ring = FrameRing(size=2)
+    for frame in ('f1', 'f2', 'f3', 'f4', 'f5'):
+        ring.publish(frame)
+
+    assert ring.read_after(1) == (5, 'f5')
+    assert ring.skipped == 3
+
+
+def test_frame_ring_read_times_out_without_a_new_frame():
+    ring = FrameRing()
+    ring.publish('f1')
+
+    assert ring.read_after(1, timeout=0.01) == (1, None)
+
+
+def test_frame_ring_wakes_waiting_readers():
+    ring = FrameRing()
+    readers = [gevent.spawn(ring.read_after, 0, 1) for _ in range(3)]
+    gevent.sleep(0)
+    ring.publish('f1')
+
+    assert [reader.get(timeout=1) for reader in readers] == [(1, 'f1')] * 3
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    timer.record(0.002)
+    timer.record(0.004)
+
+    assert timer.as_dict() == {'count': 2, 'avg_ms': 3.0, 'last_ms': 4.0, 'max_ms': 4.0}
+
+
+class FailingCapture:
+    """
+    A capture whose reads start raising after `frames` good frames.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def read(self, frame=None):
+        if self.frames == 0:
+            raise RuntimeError("device unplugged")
+        self.frames -= 1
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def test_capture_errors_stop_the_pipeline():
+    capture = FailingCapture(frames=2)
+    pipeline = LivePipeline(lambda: capture, recognize=lambda frame: [], annotate=lambda frame, faces: frame,
+                            max_fps=0, run_blocking=lambda func, *args: func(*args))
+    pipeline.start()
+    reader = gevent.spawn(list, pipeline.frames(timeout=0.05))
+
+    with gevent.Timeout(2):
+        while pipeline.running:
+            gevent.sleep(0.01)
+        reader.join()
+
+    assert pipeline.stopped_at is not None
+    assert reader.successful()
+    pipeline.stop()
+    assert capture.released
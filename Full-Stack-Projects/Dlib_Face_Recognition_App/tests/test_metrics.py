@@ -0,0 +1,91 @@
+import pytest
+from logics.metrics import Registry
+
+
+def test_counter_text_format():
+    registry = Registry()
+    faces = registry.counter('faces_total', 'Faces seen.', ['result'])
+    faces.inc(result='known')
+    faces.inc(2, result='unknown')
+
+    assert registry.render() == (
+        '# HELP faces_total Faces seen.\n'
+        '# TYPE faces_total counter\n'
+        'faces_total{result="known"} 1\n'
+        'faces_total{result="unknown"} 2\n'
+    )
+
+
+def test_histogram_text_format():
+    registry = Registry()
+    latency = registry.histogram('stage_seconds', 'Stage latency.', ['stage'], buckets=(0.1, 1.0))
+    latency.observe(0.05, stage='detect')
+    latency.observe(0.5, stage='detect')
+    latency.observe(2, stage='detect')
+
+    assert registry.render() == (
+        '# HELP stage_seconds Stage latency.\n'
+        '# TYPE stage_seconds histogram\n'
+        'stage_seconds_bucket{stage="detect",le="0.1"} 1\n'
+        'stage_seconds_bucket{stage="detect",le="1"} 2\n'
+        'stage_seconds_bucket{stage="detect",le="+Inf"} 3\n'
+        'stage_seconds_sum{stage="detect"} 2.55\n'
+        'stage_seconds_count{stage="detect"} 3\n'
+    )
+
+
+def test_gauges_and_label_escaping():
+    registry = Registry()
+    registry.gauge('queue_depth', 'Queued jobs.', lambda: 3)
+    registry.gauge('pool_jobs_total', 'Jobs per pool.', lambda: {('a"b\\c',): 4}, ['pool'], kind='counter')
+
+    assert registry.render().splitlines() == [
+        '# HELP queue_depth Queued jobs.',
+        '# TYPE queue_depth gauge',
+        'queue_depth 3',
+        '# HELP pool_jobs_total Jobs per pool.',
+        '# TYPE pool_jobs_total counter',
+        'pool_jobs_total{pool="a\\"b\\\\c"} 4',
+    ]
+
+
+def test_failing_gauge_is_reported_as_a_comment():
+    registry = Registry()
+    registry.gauge('broken', 'Always fails.', lambda: 1 / 0)
+
+    assert registry.render().splitlines()[-1] == '# broken unavailable: ZeroDivisionError'
+
+
+def test_histogram_timer_observes_its_block():
+    registry = Registry()
+    latency = registry.histogram('stage_seconds', 'Stage latency.', ['stage'])
+    with latency.time(stage='encode'):
+        pass
+
+    assert latency.count(stage='encode') == 1
+    assert latency.count(stage='detect') == 0
+
+
+def test_drain_and_merge_carry_values_between_registries():
+    worker, parent = Registry(), Registry()
+    worker_jobs = worker.counter('jobs_total', 'Jobs.', ['queue'])
+    worker_wait = worker.histogram('wait_seconds', 'Wait.', ['queue'], buckets=(1.0,))
+    parent_jobs = parent.counter('jobs_total', 'Jobs.', ['queue'])
+    parent_wait = parent.histogram('wait_seconds', 'Wait.', ['queue'], buckets=(1.0,))
+    worker_jobs.inc(queue='video')
+    worker_wait.observe(0.5, queue='video')
+    parent_jobs.inc(queue='video')
+
+    parent.merge(worker.drain())
+
+    assert parent_jobs.value(queue='video') == 2
+    assert parent_wait.count(queue='video') == 1
+    assert worker.drain() == {}
+
+
+def test_duplicate_names_are_rejected():
+    registry = Registry()
+    registry.counter('jobs_total', 'Jobs.')
+
+    with pytest.raises(ValueError):
+        registry.counter('jobs_total', 'Jobs again.')
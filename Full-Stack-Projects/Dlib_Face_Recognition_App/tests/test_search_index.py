@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+from logics.search_index import ExactIndex, IVFIndex, create_index, recall_at_k, estimate_recall
+
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_exact_search_returns_nearest_ids_in_order():
+    index = ExactIndex(2)
+    index.add([10, 11, 12], [[0, 0], [1, 0], [5, 0]])
+
+    distances, ids = index.search([[0.9, 0]], k=2)
+
+    assert ids.tolist() == [[11, 10]]
+    np.testing.assert_allclose(distances, [[0.1, 0.9]], atol=1e-6)
+
+
+def test_exact_search_pads_missing_neighbours():
+    index = ExactIndex(2)
+    index.add([7], [[1, 1]])
+
+    distances, ids = index.search([[1, 1], [0, 0]], k=3)
+
+    assert ids[:, 0].tolist() == [7, 7]
+    assert (ids[:, 1:] == -1).all()
+    assert np.isinf(distances[:, 1:]).all()
+
+
+def test_exact_search_on_empty_index():
+    distances, ids = ExactIndex(4).search(random_vectors(2, dim=4), k=1)
+
+    assert ids.tolist() == [[-1], [-1]]
+    assert np.isinf(distances).all()
+
+
+def test_remove_hides_vectors_and_reuses_slots():
+    index = ExactIndex(2)
+    index.add([1, 2], [[0, 0], [3, 3]])
+    index.remove([1, 99])
+
+    assert len(index) == 1 and 1 not in index
+    _, ids = index.search([[0, 0]], k=2)
+    assert ids.tolist() == [[2, -1]]
+
+    index.add([3], [[0.1, 0]])
+    assert index._high_water == 2
+    _, ids = index.search([[0, 0]], k=1)
+    assert ids.tolist() == [[3]]
+
+
+def test_add_replaces_an_existing_id():
+    index = ExactIndex(2)
+    index.add([1], [[0, 0]])
+    index.add([1], [[4, 4]])
+
+    ids, vectors = index.vectors()
+    assert ids.tolist() == [1]
+    assert vectors.tolist() == [[4, 4]]
+
+
+def test_add_rejects_mismatched_lengths():
+    with pytest.raises(ValueError):
+        ExactIndex(2).add([1, 2], [[0, 0]])
+
+
+def test_cosine_metric_ignores_vector_length():
+    index = ExactIndex(2, metric='cosine')
+    index.add([1, 2], [[10, 0], [0, 1]])
+
+    distances, ids = index.search([[1, 0.1]], k=1)
+
+    assert ids.tolist() == [[1]]
+    assert distances[0, 0] == pytest.approx(1 - 1 / np.sqrt(1.01), abs=1e-6)
+
+
+def test_attach_wraps_read_only_vectors_and_copies_on_write():
+    vectors = random_vectors(5, dim=4)
+    vectors.flags.writeable = False
+    index = ExactIndex(4)
+    index.attach(vectors)
+
+    assert len(index) == 5
+    _, ids = index.search(vectors[3], k=1)
+    assert ids.tolist() == [[3]]
+
+    index.add([5], random_vectors(1, dim=4, seed=1))
+    assert len(index) == 6
+    assert not vectors.flags.writeable
+
+    with pytest.raises(ValueError):
+        index.attach(vectors)
+
+
+def test_ivf_falls_back_to_exact_until_trained():
+    index = IVFIndex(16, min_train_size=100)
+    index.add(np.arange(50), random_vectors(50))
+
+    assert not index.is_trained
+    assert recall_at_k(index, random_vectors(20, seed=1), k=5) == 1.0
+
+
+def test_ivf_trains_and_keeps_recall():
+    vectors = random_vectors(400)
+    index = IVFIndex(16, nlist=8, nprobe=8, min_train_size=200)
+    index.add(np.arange(400), vectors)
+
+    assert index.is_trained
+    assert len(index.centroids) == 8
+    # Probing every cell is an exact search
+    assert recall_at_k(index, random_vectors(50, seed=1), k=3) == 1.0
+
+    index.nprobe = 2
+    assert 0.5 < estimate_recall(index, sample_size=100, k=1) <= 1.0
+
+
+def test_ivf_removed_vectors_leave_their_cells():
+    vectors = random_vectors(300)
+    index = IVFIndex(16, nlist=4, nprobe=4, min_train_size=200)
+    index.add(np.arange(300), vectors)
+    index.remove([5])
+
+    _, ids = index.search(vectors[5], k=1)
+    assert ids[0, 0] != 5
+    assert sum(len(cell) for cell in index._cells) == 299
+
+
+def test_create_index_backends():
+    assert create_index(8, backend='exact').kind == 'exact'
+    assert create_index(8, backend='IVF').kind == 'ivf'
+    with pytest.raises(ValueError):
+        create_index(8, backend='hnsw')
+
+
+def test_recall_of_an_empty_index():
+    assert recall_at_k(ExactIndex(4), random_vectors(3, dim=4)) == 1.0
+    assert estimate_recall(ExactIndex(4)) == 1.0
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pytest
+from logics.gallery import ENCODING_DIM, UNKNOWN_NAME
+from logics.shared_gallery import SharedGallery, publish_known_people, storage_signature, KEEP_GENERATIONS
+from logics.storage import LocalStorage
+
+
+def known_encodings(*names):
+    rng = np.random.default_rng(0)
+    return {name: [(rng.normal(size=ENCODING_DIM).astype(np.float32), f'{name}.jpg')] for name in names}
+
+
+def add_image(root, person, filename, content=b'jpeg'):
+    os.makedirs(root / person, exist_ok=True)
+    (root / person / filename).write_bytes(content)
+
+
+def test_publish_and_attach(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    encodings = known_encodings('ann', 'bob')
+
+    assert shared.publish(encodings, signature='sig') == 1
+    pointer, gallery = shared.attach()
+
+    assert pointer['generation'] == 1 and pointer['size'] == 2 and pointer['signature'] == 'sig'
+    assert gallery.names == ['ann', 'bob']
+    assert gallery.filenames == ['ann.jpg', 'bob.jpg']
+    (bob, _), (stranger, _) = gallery.match(np.stack([encodings['bob'][0][0], np.zeros(ENCODING_DIM)]), 0.5)
+    assert (bob, stranger) == ('bob', UNKNOWN_NAME)
+
+
+def test_attached_matrix_is_read_only(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    shared.publish(known_encodings('ann'))
+    _, gallery = shared.attach()
+
+    assert not gallery.index._vectors.flags.writeable
+
+
+def test_attach_only_returns_newer_generations(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    assert shared.attach() is None
+
+    shared.publish(known_encodings('ann'))
+    assert shared.attach(newer_than=1) is None
+    shared.publish(known_encodings('ann', 'bob'))
+    pointer, gallery = shared.attach(newer_than=1)
+    assert pointer['generation'] == 2 and len(gallery) == 2
+
+
+def test_old_generations_are_pruned(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    for _ in range(KEEP_GENERATIONS + 2):
+        generation = shared.publish(known_encodings('ann'))
+
+    kept = sorted(name for name in os.listdir(tmp_path) if name.startswith('gallery-') and name.endswith('.npy'))
+    assert kept == [f'gallery-{g}.npy' for g in range(generation - KEEP_GENERATIONS + 1, generation + 1)]
+
+
+def test_empty_gallery_is_published(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    shared.publish({})
+    pointer, gallery = shared.attach()
+
+    assert pointer['size'] == 0
+    assert len(gallery) == 0
+
+
+def test_incompatible_pointer_is_ignored(tmp_path):
+    (tmp_path / 'current.json').write_text('{"version": 99, "dim": 128, "generation": 3}')
+
+    assert SharedGallery(str(tmp_path)).current() is None
+
+
+def test_publish_known_people_skips_unchanged_storage(tmp_path):
+    images = tmp_path / 'known_people'
+    add_image(images, 'ann', '1.jpg')
+    storage = LocalStorage(str(images))
+    shared = SharedGallery(str(tmp_path / 'gallery'))
+    loads = []
+
+    def load():
+        loads.append(1)
+        return known_encodings('ann')
+
+    assert publish_known_people(shared, storage, load)
+    assert publish_known_people(shared, storage, load)
+    assert len(loads) == 1
+    assert shared.current()['signature'] == storage_signature(storage)
+
+    add_image(images, 'bob', '1.jpg')
+    assert publish_known_people(shared, storage, load)
+    assert len(loads) == 2 and shared.current()['generation'] == 2
+
+    assert publish_known_people(shared, storage, load, force=True)
+    assert len(loads) == 3
+
+
+def test_failed_load_keeps_the_current_gallery_until_storage_changes(tmp_path):
+    images = tmp_path / 'known_people'
+    add_image(images, 'ann', '1.jpg')
+    storage = LocalStorage(str(images))
+    shared = SharedGallery(str(tmp_path / 'gallery'))
+    shared.publish(known_encodings('ann'), signature='old')
+    loads = []
+
+    def failing_load():
+        loads.append(1)
+        raise RuntimeError("storage unavailable")
+
+    with pytest.raises(RuntimeError):
+        publish_known_people(shared, storage, failing_load)
+    assert not publish_known_people(shared, storage, failing_load)
+    assert len(loads) == 1
+    assert shared.current()['generation'] == 1
+
+    with pytest.raises(RuntimeError):
+        publish_known_people(shared, storage, failing_load, force=True)
+    assert len(loads) == 2
+
+    add_image(images, 'ann', '2.jpg')
+    assert publish_known_people(shared, storage, lambda: known_encodings('ann'))
+    assert shared.failed_signature is None
+    assert shared.current()['generation'] == 2
+
+
+def test_empty_storage_publishes_an_empty_gallery(tmp_path):
+    os.makedirs(tmp_path / 'known_people')
+    shared = SharedGallery(str(tmp_path / 'gallery'))
+
+    assert publish_known_people(shared, LocalStorage(str(tmp_path / 'known_people')), dict)
+    assert shared.current()['size'] == 0
+
+
+def test_only_one_process_holds_the_reload_lock(tmp_path):
+    shared = SharedGallery(str(tmp_path))
+    with shared.reload_lock() as first:
+        with SharedGallery(str(tmp_path)).reload_lock() as second:
+            assert first and not second
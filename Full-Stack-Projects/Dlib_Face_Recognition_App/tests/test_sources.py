@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+from logics.buffers import BufferPool, read_frame
+from logics.sources import LoopingCapture, open_video_source
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (32, 24))
+    if not writer.isOpened():
+        pytest.skip("OpenCV was built without an MJPG writer")
+    for value in (0, 120, 240):
+        writer.write(np.full((24, 32, 3), value, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_file_sources_loop(video_path):
+    capture = open_video_source(video_path)
+    assert isinstance(capture, LoopingCapture)
+
+    levels = []
+    for _ in range(5):
+        ret, frame = capture.read()
+        assert ret
+        levels.append(int(round(frame.mean(), -1)))
+    capture.release()
+
+    assert levels == [0, 120, 240, 0, 120]
+
+
+def test_looping_capture_reads_into_pooled_buffers(video_path):
+    pool = BufferPool(size=2)
+    capture = open_video_source(video_path)
+    buffer = pool.acquire((24, 32, 3))
+
+    for _ in range(5):  # Past the end of the file and around again
+        ret, frame = read_frame(capture, buffer)
+        assert ret
+        assert frame is buffer
+    capture.release()
@@ -0,0 +1,98 @@
+import time
+import cv2
+import numpy as np
+import pytest
+from logics.stream_output import (OutputProfile, StreamRate, parse_output_profile, adaptive_steps, encode_jpeg,
+                                  ADAPTIVE_MIN_QUALITY, ADAPTIVE_MIN_FPS, ADAPTIVE_DOWN_HOLD, ADAPTIVE_UP_HOLD)
+
+DEFAULT = OutputProfile(1.0, 80, 0, False)
+
+
+def test_parse_output_profile_defaults():
+    assert parse_output_profile({}, DEFAULT) == DEFAULT
+
+
+def test_parse_output_profile_values():
+    profile = parse_output_profile({'scale': '0.333', 'quality': '60', 'fps': '12.5', 'adaptive': 'on'}, DEFAULT)
+
+    assert profile == OutputProfile(0.33, 60, 12.5, True)
+
+
+@pytest.mark.parametrize('args', [
+    {'scale': 'big'},
+    {'scale': '0'},
+    {'scale': '1.5'},
+    {'quality': '5'},
+    {'quality': '101'},
+    {'quality': '7.5'},
+    {'fps': '-1'},
+])
+def test_parse_output_profile_rejects_bad_values(args):
+    with pytest.raises(ValueError):
+        parse_output_profile(args, DEFAULT)
+
+
+def test_adaptive_steps_lower_quality_then_frame_rate():
+    steps = adaptive_steps(80, 20)
+
+    assert steps[0] == (80, 20)
+    assert steps[-1] == (ADAPTIVE_MIN_QUALITY, ADAPTIVE_MIN_FPS)
+    assert [quality for quality, _ in steps] == sorted((quality for quality, _ in steps), reverse=True)
+    assert [fps for _, fps in steps] == sorted((fps for _, fps in steps), reverse=True)
+
+
+def test_stream_rate_uses_the_default_fps_without_a_cap():
+    assert StreamRate(DEFAULT, default_fps=15).fps == 15
+    assert StreamRate(DEFAULT._replace(max_fps=5), default_fps=15).fps == 5
+
+
+def test_stream_rate_paces_frames():
+    rate = StreamRate(DEFAULT._replace(max_fps=10))
+    assert rate.delay() == 0.0
+
+    now = time.monotonic()
+    rate.record_send(now, now)
+    rate.record_send(now, now)
+    assert 0.05 < rate.delay() <= 0.1
+
+
+def test_uncapped_stream_rate_never_waits():
+    rate = StreamRate(DEFAULT)
+    now = time.monotonic()
+    rate.record_send(now, now)
+
+    assert rate.delay() == 0.0
+
+
+def test_adaptive_rate_steps_down_on_backlog_and_back_up_when_drained():
+    rate = StreamRate(DEFAULT._replace(max_fps=10, adaptive=True))
+    start = time.monotonic() + ADAPTIVE_DOWN_HOLD
+
+    rate.record_send(start, start + 0.09)  # Most of the 100 ms frame interval
+    assert rate.step == 1
+    assert rate.quality < 80
+
+    rate.record_send(start + 0.5, start + 0.5)  # Drained, but still within the hold time
+    assert rate.step == 1
+
+    later = start + ADAPTIVE_UP_HOLD + 1
+    rate.record_send(later, later)
+    assert rate.step == 0
+    assert rate.as_dict()['quality'] == 80
+
+
+def test_fixed_rate_never_adapts():
+    rate = StreamRate(DEFAULT._replace(max_fps=10))
+    start = time.monotonic() + ADAPTIVE_DOWN_HOLD
+    rate.record_send(start, start + 1)
+
+    assert rate.steps == [(80, 10)]
+    assert rate.backlog is None
+
+
+def test_encode_jpeg_scales_the_frame():
+    frame = np.zeros((40, 60, 3), dtype=np.uint8)
+
+    decoded = cv2.imdecode(np.frombuffer(encode_jpeg(frame, scale=0.5, quality=50), np.uint8), cv2.IMREAD_COLOR)
+
+    assert decoded.shape == (20, 30, 3)
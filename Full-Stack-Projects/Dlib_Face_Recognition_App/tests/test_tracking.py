@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from logics.tracking import FaceTracker, box_iou
+
+FRAME = np.zeros((48, 64, 3), dtype=np.uint8)
+BOX = (10, 30, 30, 10)
+
+
+class FakeRecognizer:
+    """
+    Detects the same boxes on every frame and names faces from a queue.
+    """
+
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = list(names)
+        self.detect_calls = 0
+        self.identified = 0
+
+    def detect(self, frame):
+        self.detect_calls += 1
+        return list(self.boxes)
+
+    def identify(self, frame, boxes):
+        self.identified += len(boxes)
+        return [self.names.pop(0) if self.names else 'Unknown' for _ in boxes]
+
+
+def test_box_iou():
+    assert box_iou(BOX, BOX) == 1.0
+    assert box_iou(BOX, (40, 60, 45, 50)) == 0.0
+    assert box_iou((0, 10, 10, 0), (0, 20, 10, 10)) == 0.0
+    assert box_iou((0, 10, 10, 0), (0, 15, 10, 5)) == pytest.approx(50 / 150)
+
+
+def test_off_mode_detects_and_identifies_every_frame():
+    recognizer = FakeRecognizer([BOX], ['ann'] * 3)
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='off')
+
+    for _ in range(3):
+        assert tracker.update(FRAME) == [(*BOX, 'ann')]
+    assert recognizer.detect_calls == 3 and recognizer.identified == 3
+
+
+def test_iou_mode_detects_on_the_interval_and_reuses_identities():
+    recognizer = FakeRecognizer([BOX], ['ann'])
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='iou', detect_interval=3,
+                          reidentify_interval=10)
+
+    results = [tracker.update(FRAME) for _ in range(7)]
+
+    assert all(result == [(*BOX, 'ann')] for result in results)
+    assert recognizer.detect_calls == 3  # Frames 1, 4 and 7
+    assert recognizer.identified == 1
+    assert tracker.stats()['detection_ratio'] == pytest.approx(3 / 7, abs=1e-3)
+
+
+def test_known_faces_are_reidentified_after_the_interval():
+    recognizer = FakeRecognizer([BOX], ['ann', 'bob'])
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='iou', detect_interval=1,
+                          reidentify_interval=2)
+
+    names = [tracker.update(FRAME)[0][4] for _ in range(3)]
+
+    assert names == ['ann', 'ann', 'bob']
+    assert recognizer.identified == 2
+
+
+def test_unknown_faces_are_identified_on_every_detection():
+    recognizer = FakeRecognizer([BOX], [])
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='iou', detect_interval=1)
+
+    for _ in range(3):
+        tracker.update(FRAME)
+    assert recognizer.identified == 3
+
+
+def test_scene_change_forces_a_detection():
+    recognizer = FakeRecognizer([BOX], ['ann'])
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='iou', detect_interval=100)
+
+    tracker.update(FRAME)
+    tracker.update(FRAME)
+    assert recognizer.detect_calls == 1
+
+    tracker.update(np.full_like(FRAME, 255))
+    assert recognizer.detect_calls == 2
+
+
+def test_new_boxes_start_new_tracks():
+    recognizer = FakeRecognizer([BOX], ['ann', 'bob'])
+    tracker = FaceTracker(recognizer.detect, recognizer.identify, mode='iou', detect_interval=1,
+                          reidentify_interval=10)
+    tracker.update(FRAME)
+
+    recognizer.boxes = [BOX, (10, 60, 30, 40)]
+    assert tracker.update(FRAME) == [(*BOX, 'ann'), (10, 60, 30, 40, 'bob')]
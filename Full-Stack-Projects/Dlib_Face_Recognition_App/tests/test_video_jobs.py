@@ -0,0 +1,46 @@
+import pytest
+
+# video_jobs pulls in the dlib-backed recognition module
+pytest.importorskip('face_recognition')
+
+from logics.video_jobs import plan_segments, build_timeline  # noqa: E402
+
+
+def test_plan_segments_splits_by_duration():
+    assert plan_segments(250, fps=10, segment_seconds=10) == [(0, 100), (100, 200), (200, None)]
+
+
+def test_plan_segments_last_segment_is_open_ended():
+    assert plan_segments(100, fps=10, segment_seconds=10) == [(0, None)]
+    assert plan_segments(101, fps=10, segment_seconds=10) == [(0, 100), (100, None)]
+
+
+def test_plan_segments_without_a_frame_count():
+    assert plan_segments(0, fps=25) == [(0, None)]
+
+
+def test_plan_segments_at_least_one_frame_each():
+    assert plan_segments(3, fps=1, segment_seconds=0.1) == [(0, 1), (1, 2), (2, None)]
+
+
+def test_build_timeline():
+    faces_by_frame = {
+        10: [(1, 5, 6, 2, 'bob')],
+        0: [(1, 5, 6, 2, 'ann'), (7, 9, 9, 7, 'Unknown')],
+        20: [(1, 5, 6, 2, 'ann')],
+    }
+
+    timeline, identities = build_timeline(faces_by_frame, fps=4)
+
+    assert [entry['frame'] for entry in timeline] == [0, 10, 20]
+    assert [entry['time'] for entry in timeline] == [0.0, 2.5, 5.0]
+    assert timeline[0]['faces'][0] == {'top': 1, 'right': 5, 'bottom': 6, 'left': 2, 'name': 'ann'}
+    assert identities == {
+        'ann': {'first_seen': 0.0, 'last_seen': 5.0, 'frames': 2},
+        'Unknown': {'first_seen': 0.0, 'last_seen': 0.0, 'frames': 1},
+        'bob': {'first_seen': 2.5, 'last_seen': 2.5, 'frames': 1},
+    }
+
+
+def test_build_timeline_of_a_video_without_faces():
+    assert build_timeline({}, fps=30) == ([], {})
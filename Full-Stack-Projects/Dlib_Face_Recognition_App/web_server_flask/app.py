@@ -4,15 +4,32 @@ monkey.patch_all()
 
 import os
 import sys
-import gc
+import json
 import time
+import base64
+import hmac
 import cv2
 import warnings
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_file, render_template, Response
+from datetime import datetime
+from functools import partial
+from flask import Flask, jsonify, request, send_file, render_template, Response, stream_with_context
 from flask_cors import CORS
-from flask_socketio import SocketIO
-from logics.face_recognition import load_known_people_images_from_firebase, recognize_faces_in_image, annotate_image, process_frame
+from flask_socketio import SocketIO, join_room, leave_room
+from logics.face_recognition import recognize_image, annotate_decoded_image, create_frame_tracker, track_frame
+from logics.firebase import known_people_storage, load_known_people_images_from_firebase
+from logics.gallery import GalleryIndex
+from logics.shared_gallery import SharedGallery, publish_known_people, SHARED_GALLERY_DIR, SHARED_GALLERY_POLL_INTERVAL
+from logics.search_index import estimate_recall
+from logics.live_pipeline import LivePipeline, run_in_thread
+from logics.sources import SourceRegistry, parse_video_sources, open_video_source, VIDEO_SOURCES
+from logics.workers import RecognitionPool, RecognitionBusy, FairScheduler
+from logics.stream_output import parse_output_profile
+from logics.metrics import REGISTRY, STAGE_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from logics.profiler import (SamplingProfiler, ProfilerBusy, request_timing, PROFILER_ENABLED, PROFILER_MAX_SECONDS,
+                             PROFILER_INTERVAL_MS)
+from logics.video_jobs import VideoJobStore, VideoJobRunner, VIDEO_JOB_WORKERS, TIMELINE_FILE, VIDEO_FILE, DONE
+from logics.batch import (spool_archive, iter_archive_images, recognize_batch_image, recognize_many, json_lines,
+                          multipart_images, face_to_dict, BatchTooLarge, ARCHIVE_TYPES, BATCH_BOUNDARY)
 from io import BytesIO
 from logger_config import setup_logger
 
@@ -37,39 +54,133 @@ logger = setup_logger()
 # Logging and Warning Configuration
 warnings.filterwarnings("ignore", message=".*urllib3 v2 only supports OpenSSL 1.1.1+.*")
 
+# Gallery Reload Configuration
+GALLERY_RELOAD_INTERVAL = int(os.getenv('GALLERY_RELOAD_INTERVAL', 300))  # Seconds between storage checks (0 disables)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # Required in the X-Admin-Token header (admin routes are refused without it)
+
+# Upload Configuration
+UPLOAD_RESPONSE_FORMATS = ('json', 'jpeg', 'both')
+
+# Video Job Configuration
+VIDEO_JOBS_DIR = os.getenv('VIDEO_JOBS_DIR', os.path.join(UPLOAD_FOLDER, 'jobs'))
+
+# Live Stream Configuration
+LIVE_MAX_FPS = int(os.getenv('LIVE_MAX_FPS', 30))  # Upper bound on the webcam capture rate
+
 # Global Variables
-known_encodings = {}
-loaded_images = False
-streaming = False
-video_capture = None
+gallery = GalleryIndex.from_known_encodings({})
+gallery_status = {'generation': 0, 'loaded_at': None}
 detected_names = set()
-uploaded_videos = {}
 lock = gevent.lock.Semaphore()
 
+# Gallery shared by all gunicorn workers through memory-mapped files
+shared_gallery = SharedGallery(SHARED_GALLERY_DIR)
+
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def load_known_encodings():
+def attach_gallery():
+    """
+    Swap in the shared gallery if a newer generation has been published.
+
+    The encodings stay in the memory-mapped file shared by every worker;
+    the new gallery is published with a single reference assignment, so
+    in-flight recognition calls keep the gallery they started with and live
+    streams keep running.
+
+    Returns:
+        bool: True if a new generation was attached.
     """
-    Load known face encodings from Firebase Storage. This function is called
-    once on server startup to cache known face encodings in memory.
+    global gallery
+    try:
+        published = shared_gallery.attach(newer_than=gallery_status['generation'])
+    except Exception as e:
+        logger.error(f"Error attaching shared gallery: {e}")
+        return False
+    if published is None:
+        return False
+
+    pointer, new_gallery = published
+    gallery = new_gallery  # Atomic swap
+    gallery_status['generation'] = pointer['generation']
+    gallery_status['loaded_at'] = pointer['published_at']
+    logger.info(f"Attached gallery generation {pointer['generation']} ({len(new_gallery)} encodings).")
+    if new_gallery.index.kind != 'exact':
+        logger.info(f"{new_gallery.index.kind} search recall@1 vs exact: {estimate_recall(new_gallery.index):.3f}")
+    return True
+
+def reload_gallery(force=True):
     """
-    global known_encodings, loaded_images
-    if loaded_images:
-        logger.info("Known encodings already loaded.")
-        return
-    with lock:
-        if not loaded_images:
-            logger.info("Loading known encodings...")
-            try:
-                known_encodings.update(load_known_people_images_from_firebase())
-                loaded_images = True
-                logger.info("Loaded known encodings successfully.")
-            except Exception as e:
-                logger.error(f"Error loading known encodings: {e}")
-
-# Load known encodings on startup
-load_known_encodings()
+    Load known face encodings and publish them as a new shared generation.
+
+    Unchanged images are served from the encoding cache, so only new or
+    changed images are downloaded and encoded. Only one process reloads at
+    a time; every worker then attaches the new generation.
+
+    Returns:
+        bool: True if the published gallery is up to date, False if another
+        reload was already running or loading failed.
+    """
+    if not lock.acquire(blocking=False):
+        logger.info("Gallery reload already in progress.")
+        return False
+
+    try:
+        with shared_gallery.reload_lock() as acquired:
+            if not acquired:
+                logger.info("Another worker is reloading the gallery.")
+                return False
+            if not publish_known_people(shared_gallery, known_people_storage,
+                                        load_known_people_images_from_firebase, force=force):
+                return False
+        attach_gallery()
+    except Exception as e:
+        logger.error(f"Error loading known encodings: {e}")
+        return False
+    finally:
+        lock.release()
+    return True
+
+def watch_known_people():
+    """
+    Background greenlet that reloads the gallery whenever images are added,
+    changed or removed under known_people/. Only one worker lists storage.
+    """
+    while True:
+        gevent.sleep(GALLERY_RELOAD_INTERVAL)
+        try:
+            if shared_gallery.lead():
+                reload_gallery(force=False)
+        except Exception as e:
+            logger.error(f"Error checking known people for changes: {e}")
+
+def follow_shared_gallery():
+    """
+    Background greenlet that attaches generations published by other processes.
+    """
+    while True:
+        gevent.sleep(SHARED_GALLERY_POLL_INTERVAL)
+        attach_gallery()
+
+# Load known encodings on startup: the gunicorn master usually published them
+# already, otherwise the first worker to take the lead loads them
+if shared_gallery.lead():
+    reload_gallery(force=False)
+attach_gallery()
+gevent.spawn(follow_shared_gallery)
+if GALLERY_RELOAD_INTERVAL > 0:
+    gevent.spawn(watch_known_people)
+
+# Recognition runs on worker processes (or threads) so dlib never blocks the event loop
+recognition_pool = RecognitionPool().start()
+
+# Offline video analysis jobs run on their own worker processes, forked on the first job
+video_job_pool = RecognitionPool(workers=VIDEO_JOB_WORKERS, mode='process', queue_size=0, name='video_jobs')
+video_jobs = VideoJobStore(VIDEO_JOBS_DIR)
+video_job_runner = VideoJobRunner(video_jobs, video_job_pool, SHARED_GALLERY_DIR).start()
+
+# On-demand stack sampling of this worker (/admin/profile); idle until a profile is requested
+profiler = SamplingProfiler()
 
 @app.route('/')
 def index():
@@ -93,6 +204,27 @@ def handle_disconnect():
     """
     logger.info(f'Client disconnected: {request.sid}')
 
+@socketio.on('join_source')
+def handle_join_source(data):
+    """
+    Subscribe the client to recognition events of one video source.
+    """
+    source_id = (data or {}).get('source_id')
+    if source_id not in video_sources:
+        socketio.emit('response', {'error': 'Unknown video source'}, to=request.sid)
+        return
+    join_room(source_id)
+    logger.info(f'Client {request.sid} joined source {source_id}')
+
+@socketio.on('leave_source')
+def handle_leave_source(data):
+    """
+    Unsubscribe the client from recognition events of one video source.
+    """
+    source_id = (data or {}).get('source_id')
+    if source_id in video_sources:
+        leave_room(source_id)
+
 @app.route('/favicon.ico')
 def favicon():
     """
@@ -100,11 +232,38 @@ def favicon():
     """
     return send_file(os.path.join(app.root_path, 'static', 'favicon.ico'))
 
+def submit_without_waiting(func, *args):
+    """
+    Run a recognition job, failing fast with RecognitionBusy when the pool is full.
+    """
+    return recognition_pool.run(func, *args, block=False)
+
+def with_server_timing(response, timing):
+    """
+    Add the Server-Timing header of `timing` to a response, if it recorded one.
+    """
+    header = timing.header()
+    if header:
+        response.headers['Server-Timing'] = header
+    return response
+
 @app.route('/upload_image', methods=['POST'])
 def upload_image():
     """
-    Handle image upload, perform face recognition, and return the annotated image.
+    Handle image upload and perform face recognition.
+
+    The `format` query or form parameter selects the response: `jpeg` (the
+    default) returns the annotated image, `json` only the recognized faces
+    (boxes, names, distances) and skips annotation entirely, `both` returns
+    the faces together with the base64-encoded annotated image. The upload
+    is decoded once and the decoded image is shared by recognition and
+    annotation. With SERVER_TIMING enabled, the response carries a
+    Server-Timing header breaking the request down into its stages.
     """
+    response_format = request.values.get('format', 'jpeg').lower()
+    if response_format not in UPLOAD_RESPONSE_FORMATS:
+        return jsonify({'error': 'Unsupported format, use json, jpeg or both'}), 400
+
     if 'imageFile' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -112,19 +271,110 @@ def upload_image():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    timing = request_timing()
     try:
-        image_data = file.read()
-        recognized_faces = recognize_faces_in_image(image_data, known_encodings)
-        annotated_image_data = annotate_image(image_data, recognized_faces)
-        return Response(annotated_image_data, mimetype='image/jpeg')
+        with timing.time('read'):
+            image_data = file.read()
+        with timing.time('recognize', 'detection, encoding and matching'):
+            faces, img = recognize_image(image_data, gallery, keep_image=response_format != 'json',
+                                         run=timing.wrap('worker', submit_without_waiting, 'queue, detection and encoding'))
+        if response_format == 'json':
+            return with_server_timing(jsonify({'faces': [face_to_dict(face) for face in faces]}), timing)
+
+        with timing.time('annotate'):
+            annotated_image_data = run_in_thread(annotate_decoded_image, img, [face[:5] for face in faces])
+        if response_format == 'jpeg':
+            return with_server_timing(Response(annotated_image_data, mimetype='image/jpeg'), timing)
+        return with_server_timing(jsonify({
+            'faces': [face_to_dict(face) for face in faces],
+            'image': base64.b64encode(annotated_image_data).decode('ascii')
+        }), timing)
+    except RecognitionBusy as e:
+        logger.warning(f"Rejecting image upload: {e}")
+        return jsonify({'error': 'Server busy, try again later'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         return jsonify({'error': 'Error processing image', 'details': str(e)}), 500
 
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    """
+    Recognize many images in one request, sent either as several `imageFiles`
+    parts of a multipart form or as a zip/tar archive request body.
+
+    Images are recognized in parallel on the recognition pool and results
+    are streamed back as they finish: one JSON line per image
+    (`?format=json`, the default) or the annotated images as the parts of a
+    multipart/mixed response (`?format=jpeg`).
+    """
+    response_format = request.args.get('format', 'json').lower()
+    if response_format not in ('json', 'jpeg'):
+        return jsonify({'error': 'Unsupported format, use json or jpeg'}), 400
+
+    archive = None
+    if request.mimetype in ARCHIVE_TYPES:
+        try:
+            # Read the raw body: archives may be far larger than MAX_CONTENT_LENGTH
+            archive = spool_archive(request.environ['wsgi.input'])
+            images = iter_archive_images(archive)
+        except BatchTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            archive.close()
+            return jsonify({'error': str(e)}), 400
+    else:
+        files = request.files.getlist('imageFiles')
+        if not files:
+            return jsonify({'error': 'No imageFiles parts or archive body'}), 400
+        images = ((file.filename, file.read()) for file in files)
+
+    current = gallery  # One gallery generation for the whole batch
+
+    def recognize(filename, image_data):
+        return recognize_batch_image(filename, image_data, current, run=recognition_pool.run,
+                                     annotate=response_format == 'jpeg')
+
+    def stream_results():
+        try:
+            results = recognize_many(images, recognize, recognition_pool.workers)
+            if response_format == 'jpeg':
+                yield from multipart_images(results)
+            else:
+                yield from json_lines(results)
+        except Exception as e:
+            # A corrupt archive entry ends the batch; results sent so far stand
+            logger.error(f"Error reading batch: {e}")
+            if response_format == 'json':
+                yield json.dumps({'error': f"Error reading batch: {e}"}) + '\n'
+        finally:
+            if archive is not None:
+                archive.close()
+
+    if response_format == 'jpeg':
+        return Response(stream_with_context(stream_results()), mimetype=f'multipart/mixed; boundary={BATCH_BOUNDARY}')
+    return Response(stream_with_context(stream_results()), mimetype='application/x-ndjson')
+
+def create_video_job(file):
+    """
+    Save an uploaded video as a new analysis job and queue it.
+    """
+    job = video_jobs.create(file.filename, file.save)
+    video_job_runner.submit(job['id'])
+    logger.info(f"Queued video job {job['id']} for {job['filename']}")
+    return job
+
+def video_job_status(job):
+    """
+    Job state plus the URLs of its results.
+    """
+    job_id = job['id']
+    return dict(job, status_url=f"/video_jobs/{job_id}", stream_url=f"/video_jobs/{job_id}/stream",
+                timeline_url=f"/video_jobs/{job_id}/timeline", video_url=f"/video_jobs/{job_id}/video")
+
 @app.route('/upload_video', methods=['POST'])
 def upload_video():
     """
-    Handle video upload, save it to the server, and return the URL for streaming.
+    Handle video upload, queue it for analysis, and return the URL for streaming the annotated result.
     """
     if 'videoFile' not in request.files:
         logger.error('No file part in request')
@@ -135,69 +385,109 @@ def upload_video():
         logger.error('No selected file')
         return jsonify({'error': 'No selected file'}), 400
 
-    video_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    logger.info(f"Saving uploaded video to {video_path}")
+    try:
+        job = create_video_job(file)
+        return jsonify({'video_url': f"/stream_video/{job['id']}", 'job_id': job['id'], 'status_url': f"/video_jobs/{job['id']}"})
+    except Exception as e:
+        logger.error(f"Error saving video: {e}")
+        return jsonify({'error': 'Error saving video', 'details': str(e)}), 500
+
+@app.route('/video_jobs', methods=['POST'])
+def submit_video_job():
+    """
+    Queue an uploaded video for offline analysis.
+    """
+    file = request.files.get('videoFile')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No videoFile part'}), 400
 
     try:
-        file.save(video_path)
-        uploaded_videos[video_path] = datetime.now()
-        logger.info(f"Uploaded video: {video_path}")
-        return jsonify({'video_url': f"/stream_video/{file.filename}"})
+        job = create_video_job(file)
+        return jsonify(video_job_status(job)), 202
     except Exception as e:
         logger.error(f"Error saving video: {e}")
         return jsonify({'error': 'Error saving video', 'details': str(e)}), 500
 
-@app.route('/stream_video/<video_name>')
-def stream_video(video_name):
+@app.route('/video_jobs')
+def list_video_jobs():
+    """
+    List all video jobs with their status and progress.
+    """
+    return jsonify({'jobs': [video_job_status(job) for job in video_jobs.list()]})
+
+@app.route('/video_jobs/<job_id>')
+def get_video_job(job_id):
     """
-    Stream an uploaded video with face recognition annotations.
+    Report the status and progress of one video job.
     """
-    video_path = os.path.join(UPLOAD_FOLDER, video_name)
-    if not os.path.exists(video_path):
+    job = video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Video job not found'}), 404
+    return jsonify(video_job_status(job))
+
+@app.route('/video_jobs/<job_id>/timeline')
+def get_video_job_timeline(job_id):
+    """
+    Return the per-frame identity timeline of a finished video job.
+    """
+    job = video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Video job not found'}), 404
+    timeline_path = video_jobs.file(job_id, TIMELINE_FILE)
+    if not os.path.exists(timeline_path):
+        return jsonify({'error': 'Timeline not ready', 'status': job['status']}), 409
+    return send_file(timeline_path, mimetype='application/json')
+
+@app.route('/video_jobs/<job_id>/video')
+def get_video_job_video(job_id):
+    """
+    Download the annotated video of a finished video job.
+    """
+    job = video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Video job not found'}), 404
+    video_path = video_jobs.file(job_id, VIDEO_FILE)
+    if job['status'] != DONE or not os.path.exists(video_path):
+        return jsonify({'error': 'Annotated video not available', 'status': job['status']}), 409
+    return send_file(video_path, mimetype='video/mp4', as_attachment=True,
+                     download_name=f"{os.path.splitext(job['filename'])[0]}_annotated.mp4")
+
+@app.route('/stream_video/<job_id>')
+@app.route('/video_jobs/<job_id>/stream')
+def stream_video(job_id):
+    """
+    Stream the annotated frames of a video job as MJPEG at the video's frame rate.
+
+    Frames are rendered once by the job; a viewer that connects while the
+    job is still running waits for them, and replays only read the file.
+    """
+    job = video_jobs.get(job_id)
+    if job is None:
         return jsonify({'error': 'Video not found'}), 404
-    return Response(stream_annotated_video(video_path), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(replay_video_job(job_id), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def stream_annotated_video(video_path):
+def replay_video_job(job_id):
     """
-    Generator function to stream video frames with face recognition annotations.
+    Generator yielding the rendered frames of a job, paced at its frame rate.
     """
+    frame_interval = None
+    next_frame_at = time.monotonic()
     try:
-        if video_path not in uploaded_videos:
-            raise ValueError("Video not found or expired.")
-
-        if datetime.now() - uploaded_videos[video_path] > timedelta(hours=1):
-            os.remove(video_path)
-            del uploaded_videos[video_path]
-            logger.info(f"Video {video_path} has expired and has been deleted.")
-            return
-
-        video_capture = cv2.VideoCapture(video_path)
-        if not video_capture.isOpened():
-            raise ValueError("Error opening video stream")
-
-        while True:
-            ret, frame = video_capture.read()
-            if not ret:
-                break
-
-            recognized_faces = process_frame(frame, known_encodings)
-            frame = annotate_frame(frame, recognized_faces)
+        for frame in video_jobs.iter_frames(job_id):
+            if frame_interval is None:
+                frame_interval = 1.0 / (video_jobs.get(job_id).get('fps') or 25.0)
+            gevent.sleep(max(0.0, next_frame_at - time.monotonic()))
+            next_frame_at = max(next_frame_at, time.monotonic() - frame_interval) + frame_interval
             yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-
-            gc.collect()
-    except ValueError as ve:
-        logger.error(f"ValueError: {ve}")
     except Exception as e:
-        logger.error(f"Error processing video: {e}")
-    finally:
-        if video_capture:
-            video_capture.release()
-        gc.collect()
+        logger.error(f"Error replaying video job {job_id}: {e}")
 
 def annotate_frame(frame, recognized_faces):
     """
-    Annotate video frame with rectangles and labels for recognized faces.
+    Annotate video frame (in place) with rectangles and labels for recognized faces.
+    Encoding is left to each viewer's output profile.
     """
+    start = time.perf_counter()
     for (top, right, bottom, left, name) in recognized_faces:
         # Define colors based on the recognized name
         rectangle_color, text_color = ((0, 0, 255), (255, 255, 255)) if name == 'Unknown' else ((0, 255, 0), (255, 255, 255))
@@ -225,159 +515,282 @@ def annotate_frame(frame, recognized_faces):
         
         # Logging for each annotated face
         # logger.debug(f"Annotated face: {name} at position: ({left}, {top}), ({right}, {bottom})")
-    
-    try:
-        # Encode the frame to JPEG format
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            raise ValueError("Frame encoding failed")
-        
-        # logger.info("Frame successfully encoded to JPEG format")
-        return buffer.tobytes()
-    except Exception as e:
-        logger.error(f"Error annotating frame: {e}")
-        return None
 
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage='annotate')
+    return frame
 
-@app.route('/video_feed')
-def video_feed():
+
+@app.route('/video_feed', defaults={'source_id': None})
+@app.route('/video_feed/<source_id>')
+def video_feed(source_id):
     """
-    Endpoint to stream real-time video feed from the webcam with face recognition annotations.
+    Endpoint to stream a real-time video feed (the default source when none is given) with face recognition annotations.
+
+    Query arguments set this viewer's output: `scale` (0.1-1), `quality`
+    (JPEG, 10-100), `fps` (cap, 0 for none) and `adaptive` (follow the
+    viewer's connection). Viewers with the same output share encoded frames.
     """
-    if not streaming:
+    if source_id is not None and source_id not in video_sources:
+        return jsonify({'error': 'Unknown video source'}), 404
+
+    try:
+        profile = parse_output_profile(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    camera = video_sources.get(source_id)
+    if not camera.running:
         logger.warning('Streaming not available. Returning 503 response.')
         return jsonify({'error': 'Streaming not available'}), 503
     
     try:
         logger.info('Starting video feed stream.')
-        response = Response(process_video(), mimetype='multipart/x-mixed-replace; boundary=frame')
+        response = Response(process_video(camera, profile), mimetype='multipart/x-mixed-replace; boundary=frame')
         logger.info('Video feed stream started successfully.')
         return response
     except Exception as e:
         logger.error(f"Error starting video feed stream: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-def process_video():
+def create_source_pipeline(source_id, uri):
     """
-    Process real-time video frames from the webcam and perform face recognition.
+    Build the live pipeline of one video source.
+
+    Capture, recognition and annotate+encode run as separate stages, so the
+    stream always shows the freshest frame and frames that recognition
+    cannot keep up with are dropped instead of queued. Recognition jobs of
+    all sources share the worker pool through the fair scheduler.
     """
-    global streaming, video_capture, previous_names
     previous_names = set()
-    video_capture = None
-
+    tracker = create_frame_tracker(lambda: gallery, run=partial(recognition_scheduler.run, source_id))
+    # The default source also notifies clients that did not join a source room
+    room = None if source_id == video_sources.default else source_id
+
+    def emit_names(recognized_faces):
+        nonlocal previous_names
+        detected_names = {name for (_, _, _, _, name) in recognized_faces}
+        if detected_names and detected_names != previous_names:
+            previous_names = detected_names
+            socketio.emit('persons_recognized', {'names': list(previous_names), 'source_id': source_id}, to=room)
+
+    return LivePipeline(
+        open_capture=partial(open_video_source, uri),
+        recognize=lambda frame: track_frame(frame, tracker),
+        annotate=annotate_frame,
+        on_faces=emit_names,
+        max_fps=LIVE_MAX_FPS
+    )
+
+# Video sources, each with one pipeline shared by all of its viewers
+recognition_scheduler = FairScheduler(recognition_pool)
+video_sources = SourceRegistry(parse_video_sources(VIDEO_SOURCES), create_source_pipeline)
+
+def process_video(camera, profile):
+    """
+    Stream a shared video source to one viewer as multipart JPEG frames.
+    """
     try:
-        video_capture = cv2.VideoCapture(0)
-        video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-        if not video_capture.isOpened():
-            logger.error("Failed to open video capture device.")
-            return
-
-        frame_counter = 0
-        gc_interval = 30
-        frame_rate = 30  # Target frame rate (frames per second)
-        frame_time = 1.0 / frame_rate
-
-        logger.info("Video capture started.")
-        
-        while streaming:
-            start_time = time.time()
-            ret, frame = video_capture.read()
-            if not ret:
-                logger.warning("Frame not retrieved, stopping video stream.")
-                break
-
-            recognized_faces = process_frame(frame, known_encodings)
-            detected_names = {name for (_, _, _, _, name) in recognized_faces}
-
-            if detected_names:
-                if detected_names != previous_names:
-                    # logger.info(f"Detected names changed. Previous: {previous_names}, Current: {detected_names}")
-                    previous_names = detected_names
-                    socketio.emit('persons_recognized', {'names': list(previous_names)})
-                    gevent.sleep(0.1)
-            #     else:
-            #         logger.debug(f"Detected names unchanged: {detected_names}")
-            # else:
-            #     logger.debug("No faces detected.")
-
-            frame = annotate_frame(frame, recognized_faces)
+        for frame in camera.subscribe(profile):
             yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-
-            frame_counter += 1
-            if frame_counter % gc_interval == 0:
-                gc.collect()
-                # logger.debug("Garbage collection performed.")
-
-            elapsed_time = time.time() - start_time
-            sleep_time = max(0, frame_time - elapsed_time)
-            time.sleep(sleep_time)
-    
-    except cv2.error as e:
-        logger.error(f"OpenCV error: {e}")
     except Exception as e:
-        logger.error(f"Error processing video: {e}")
-    finally:
-        if video_capture:
-            video_capture.release()
-            logger.info("Video capture released.")
-        gc.collect()
-        logger.debug("Garbage collection performed in finally block.")
+        logger.error(f"Error streaming video: {e}")
 
-@app.route('/start_video_feed', methods=['POST'])
-def start_video_feed():
+@app.route('/video_sources')
+def list_video_sources():
     """
-    Start the real-time video feed from the webcam.
+    Per-source state, FPS, queue depth, latency and drop counters.
     """
-    global streaming, video_capture
-    
-    if streaming:
+    stats = video_sources.stats()
+    for source_id, source_stats in stats.items():
+        source_stats['recognition'] = recognition_scheduler.stats(source_id)
+    return jsonify({'default': video_sources.default, 'sources': stats})
+
+@app.route('/start_video_feed', methods=['POST'], defaults={'source_id': None})
+@app.route('/start_video_feed/<source_id>', methods=['POST'])
+def start_video_feed(source_id):
+    """
+    Start the real-time video feed of a source (the default source when none is given).
+    """
+    if source_id is not None and source_id not in video_sources:
+        return jsonify({'error': 'Unknown video source'}), 404
+
+    camera = video_sources.get(source_id)
+    if camera.running:
         logger.warning("Video feed is already running.")
         return jsonify({'status': 'already_started'}), 400
 
     try:
-        video_capture = cv2.VideoCapture(0)
-        video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        streaming = True
-        logger.info("Started video feed.")
+        camera.start()
+        logger.info(f"Started video feed {source_id or video_sources.default}.")
         return jsonify({'status': 'started'})
     except Exception as e:
         logger.error(f"Error starting video feed: {e}")
         return jsonify({'error': 'Failed to start video feed'}), 500
 
-@app.route('/stop_video_feed', methods=['POST'])
-def stop_video_feed():
+@app.route('/stop_video_feed', methods=['POST'], defaults={'source_id': None})
+@app.route('/stop_video_feed/<source_id>', methods=['POST'])
+def stop_video_feed(source_id):
     """
-    Stop the real-time video feed from the webcam.
+    Stop the real-time video feed of a source (the default source when none is given).
     """
-    global streaming, video_capture
+    if source_id is not None and source_id not in video_sources:
+        return jsonify({'error': 'Unknown video source'}), 404
 
-    if not streaming:
+    camera = video_sources.get(source_id)
+    if not camera.running:
         logger.warning("Video feed is not running.")
         return jsonify({'status': 'already_stopped'}), 400
 
     try:
-        streaming = False
-        if video_capture:
-            video_capture.release()
-            video_capture = None
-        logger.info("Stopped video feed.")
+        camera.stop()
+        logger.info(f"Stopped video feed {source_id or video_sources.default}.")
         return jsonify({'status': 'stopped'})
     except Exception as e:
         logger.error(f"Error stopping video feed: {e}")
         return jsonify({'error': 'Failed to stop video feed'}), 500
 
+if not ADMIN_TOKEN:
+    logger.warning("ADMIN_TOKEN is not set: /admin routes are refused until it is.")
+
+def admin_error():
+    """
+    The error response for an admin request, or None if its X-Admin-Token
+    matches ADMIN_TOKEN. Without a configured token every admin request is refused.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin routes are disabled; set ADMIN_TOKEN'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/admin/reload_gallery', methods=['POST'])
+def admin_reload_gallery():
+    """
+    Rebuild the gallery in the background and swap it in when ready.
+    """
+    error = admin_error()
+    if error:
+        return error
+    if lock.locked():
+        return jsonify({'status': 'already_reloading'}), 409
+
+    gevent.spawn(reload_gallery)
+    logger.info("Gallery reload requested.")
+    return jsonify({'status': 'reloading', 'generation': gallery_status['generation']}), 202
+
+@app.route('/admin/gallery')
+def admin_gallery():
+    """
+    Report the currently published gallery.
+    """
+    error = admin_error()
+    if error:
+        return error
+
+    current = gallery
+    return jsonify({
+        'generation': gallery_status['generation'],
+        'loaded_at': gallery_status['loaded_at'],
+        'reloading': lock.locked(),
+        'worker_pid': os.getpid(),
+        'backend': current.index.kind,
+        'encodings': len(current),
+        'people': len(current.names)
+    })
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """
+    Sample the stacks of this worker for `seconds` (default 10) every
+    `interval_ms` and return them as a collapsed-stack file for flamegraph tools.
+    """
+    if not PROFILER_ENABLED:
+        return jsonify({'error': 'Profiler disabled'}), 404
+    error = admin_error()
+    if error:
+        return error
+
+    try:
+        seconds = float(request.values.get('seconds', 10))
+        interval_ms = float(request.values.get('interval_ms', PROFILER_INTERVAL_MS))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not 0 < seconds <= PROFILER_MAX_SECONDS or interval_ms < 1:
+        return jsonify({'error': f'seconds must be between 0 and {PROFILER_MAX_SECONDS:g}, interval_ms at least 1'}), 400
+
+    try:
+        collapsed = profiler.run(seconds, interval_ms / 1000.0)
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(collapsed, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{os.getpid()}.collapsed',
+        'X-Profile-Samples': str(profiler.samples),
+    })
+
+def pool_metric(read):
+    """
+    Gauge function reading one value of every worker pool.
+    """
+    return lambda: {(pool.name,): read(pool) for pool in (recognition_pool, video_job_pool)}
+
+def source_metric(read):
+    """
+    Gauge function reading one value of every video source from its stats.
+    """
+    def collect():
+        values = {}
+        for source_id, stats in video_sources.stats().items():
+            for labels, value in read(stats).items():
+                values[(source_id,) + labels] = value
+        return values
+    return collect
+
+# Values read when /metrics is scraped; the hot paths record their histograms directly
+REGISTRY.gauge('face_recognition_gallery_encodings', 'Encodings in the attached gallery.', lambda: len(gallery))
+REGISTRY.gauge('face_recognition_gallery_generation', 'Attached shared gallery generation.',
+               lambda: gallery_status['generation'])
+REGISTRY.gauge('face_recognition_active_streams', 'Video sources currently streaming.',
+               lambda: sum(broadcaster.running for broadcaster in video_sources.broadcasters.values()))
+REGISTRY.gauge('face_recognition_stream_viewers', 'Connected viewers per video source.',
+               source_metric(lambda stats: {(): stats['viewers']}), ['source'])
+REGISTRY.gauge('face_recognition_dropped_frames_total', 'Frames dropped per video source and stage.',
+               source_metric(lambda stats: {
+                   ('inference',): stats.get('dropped_before_inference', 0),
+                   ('annotate',): stats.get('dropped_before_annotate', 0),
+                   ('viewer',): stats.get('frames_skipped_by_viewers', 0),
+               }), ['source', 'stage'], kind='counter')
+REGISTRY.gauge('face_recognition_pool_workers', 'Workers per pool.', pool_metric(lambda pool: pool.workers), ['pool'])
+REGISTRY.gauge('face_recognition_pool_in_flight', 'Jobs running or waiting per pool.',
+               pool_metric(lambda pool: pool.in_flight()), ['pool'])
+REGISTRY.gauge('face_recognition_pool_utilization', 'Share of the workers of a pool busy with a job.',
+               pool_metric(lambda pool: min(pool.in_flight(), pool.workers) / pool.workers), ['pool'])
+REGISTRY.gauge('face_recognition_pool_busy_seconds_total', 'Time jobs spent admitted to a pool.',
+               pool_metric(lambda pool: pool.busy_seconds), ['pool'], kind='counter')
+REGISTRY.gauge('face_recognition_pool_jobs_total', 'Pool jobs by outcome.',
+               lambda: {(pool.name, outcome): getattr(pool, outcome)
+                        for pool in (recognition_pool, video_job_pool)
+                        for outcome in ('completed', 'failed', 'rejected')}, ['pool', 'outcome'], kind='counter')
+REGISTRY.gauge('face_recognition_scheduler_dropped_total', 'Recognition jobs dropped per video source.',
+               lambda: {(source_id,): count for source_id, count in recognition_scheduler.dropped.items()},
+               ['source'], kind='counter')
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus text exposition of this worker's metrics.
+    """
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/health')
 def health_check():
     """
     Health check endpoint to verify the service status.
     """
     try:
-        status = 'healthy' if streaming else 'unhealthy'
+        status = 'healthy' if video_sources.running else 'unhealthy'
         response = {
             'status': status,
+            'recognition': recognition_pool.stats(),
             'timestamp': datetime.utcnow().isoformat()
         }
         logger.info("Health check successful.")
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+from logics.firebase import known_people_storage, load_known_people_images_from_firebase
+from logics.shared_gallery import SharedGallery, publish_known_people
+from logics.batch import iter_directory_images, recognize_batch_image, recognize_many, write_annotated
+from logics.workers import RecognitionPool, RECOGNITION_WORKERS
+from logger_config import setup_logger
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recognize faces in every image below a directory.")
+    parser.add_argument('input_dir', help="Directory of images (searched recursively)")
+    parser.add_argument('--output', help="Write JSON lines here instead of stdout")
+    parser.add_argument('--annotated-dir', help="Also save annotated images to this directory")
+    parser.add_argument('--workers', type=int, default=RECOGNITION_WORKERS, help="Recognition processes (default: one per core)")
+    return parser.parse_args()
+
+
+def load_gallery():
+    """
+    Attach the shared gallery, publishing it first if storage changed since it was built.
+    """
+    shared_gallery = SharedGallery()
+    with shared_gallery.reload_lock() as acquired:
+        if acquired:
+            try:
+                publish_known_people(shared_gallery, known_people_storage, load_known_people_images_from_firebase)
+            except Exception as e:
+                logger.error(f"Could not publish the known people, using the current gallery: {e}")
+    published = shared_gallery.attach()
+    if published is None:
+        raise SystemExit("No known people gallery could be loaded.")
+    return published[1]
+
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.input_dir):
+        raise SystemExit(f"Not a directory: {args.input_dir}")
+
+    gallery = load_gallery()
+    recognition_pool = RecognitionPool(workers=args.workers).start()
+
+    def recognize(filename, image_data):
+        return recognize_batch_image(filename, image_data, gallery, run=recognition_pool.run,
+                                     annotate=args.annotated_dir is not None)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    images = failed = 0
+    try:
+        for result, annotated in recognize_many(iter_directory_images(args.input_dir), recognize, recognition_pool.workers):
+            images += 1
+            failed += 'error' in result
+            if annotated is not None:
+                result['annotated'] = write_annotated(args.annotated_dir, result['filename'], annotated)
+            output.write(json.dumps(result) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        recognition_pool.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Recognized {images} images ({failed} failed) in {elapsed:.1f}s "
+                f"({images / elapsed if elapsed else 0.0:.1f} images/s).")
+
+
+if __name__ == '__main__':
+    main()
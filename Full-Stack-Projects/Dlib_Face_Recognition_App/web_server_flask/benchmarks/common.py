@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+import cv2
+import numpy as np
+from logger_config import setup_logger
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Sample images and video shipped with the app
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Assets'))
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+REPORT_VERSION = 1
+
+
+def parse_sizes(value):
+    return tuple(int(size) for size in value.split(',') if size.strip())
+
+
+def synthetic_gallery(size, dim, seed=0, scale=0.09, normalize=False):
+    """
+    Random encodings standing in for `size` enrolled identities, one row
+    each. `scale` mimics the spread of real encodings (dlib encodings have
+    components of roughly +-0.1); FaceNet embeddings are `normalize`d.
+
+    Returns:
+        tuple: `(matrix, labels)`.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(0.0, scale, (size, dim)).astype(np.float32)
+    if normalize:
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix, [f'person{i:06d}' for i in range(size)]
+
+
+def synthetic_queries(matrix, count, seed=1, noise=0.02, known_share=0.5, scale=0.09):
+    """
+    Query encodings for one frame: part of them are noisy copies of gallery
+    rows (should match), the rest random (should come out Unknown).
+    """
+    rng = np.random.default_rng(seed)
+    known = int(round(count * known_share)) if len(matrix) else 0
+    rows = matrix[rng.integers(0, len(matrix), known)] if known else np.empty((0, matrix.shape[1]), np.float32)
+    queries = np.vstack([
+        rows + rng.normal(0.0, noise, rows.shape),
+        rng.normal(0.0, scale, (count - known, matrix.shape[1])),
+    ]).astype(np.float32)
+    return queries
+
+
+def sample_images(directory=ASSETS_DIR):
+    """
+    `(name, bytes)` of every JPEG/PNG sample image.
+    """
+    images = []
+    for filename in sorted(os.listdir(directory)):
+        if os.path.splitext(filename)[1].lower() in ('.jpg', '.jpeg', '.png'):
+            with open(os.path.join(directory, filename), 'rb') as f:
+                images.append((filename, f.read()))
+    return images
+
+
+def sample_video(directory=ASSETS_DIR):
+    return os.path.join(directory, 'Video.mp4')
+
+
+def read_frames(video_path, count):
+    """
+    Decode up to `count` frames of a video into memory.
+    """
+    capture = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        raise IOError(f"Could not read frames from {video_path}")
+    return frames
+
+
+def summarize(samples, items=1):
+    """
+    Latency percentiles of `samples` (seconds) and the throughput they imply.
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    mean = total / len(ordered)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(1000 * mean, 4),
+        'p50_ms': round(1000 * percentile(50), 4),
+        'p95_ms': round(1000 * percentile(95), 4),
+        'min_ms': round(1000 * ordered[0], 4),
+        'max_ms': round(1000 * ordered[-1], 4),
+        'per_second': round(items * len(ordered) / total, 2) if total else None,
+    }
+
+
+def measure(func, repeat=20, warmup=2, items=1):
+    """
+    Time `repeat` calls of `func()` after `warmup` untimed ones. `items`
+    is how many units (frames, faces, images) one call processes.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Report:
+    """
+    Benchmark results of one run, written as JSON so runs can be compared.
+
+    Every result is identified by its `name` and `params`; with a baseline
+    report, results present in both get the baseline mean and the relative
+    change (negative is faster).
+    """
+
+    def __init__(self, suite, args):
+        self.meta = {
+            'version': REPORT_VERSION,
+            'suite': suite,
+            'started_at': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'args': args,
+        }
+        self.results = []
+
+    def add(self, name, stats, **params):
+        result = {'name': name, 'params': params}
+        result.update(stats)
+        self.results.append(result)
+        logger.info(f"{name} {params}: mean {stats.get('mean_ms')} ms, p95 {stats.get('p95_ms')} ms, "
+                    f"{stats.get('per_second')}/s")
+        return result
+
+    def compare(self, baseline):
+        previous = {(result['name'], json.dumps(result['params'], sort_keys=True)): result
+                    for result in baseline.get('results', [])}
+        for result in self.results:
+            old = previous.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+            if old and old.get('mean_ms') and result.get('mean_ms') is not None:
+                result['baseline_mean_ms'] = old['mean_ms']
+                result['change'] = round(result['mean_ms'] / old['mean_ms'] - 1.0, 4)
+
+    def write(self, path=None):
+        document = {'meta': self.meta, 'results': self.results}
+        if path:
+            with open(path, 'w') as f:
+                json.dump(document, f, indent=2)
+            logger.info(f"Wrote {len(self.results)} results to {path}.")
+        else:
+            json.dump(document, sys.stdout, indent=2)
+            sys.stdout.write('\n')
@@ -0,0 +1,281 @@
+import gevent
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+from gevent.pool import Pool
+from logics.gallery import GalleryIndex, ENCODING_DIM
+from logics.stream_output import encode_jpeg
+from benchmarks.common import (Report, measure, summarize, synthetic_gallery, synthetic_queries, sample_images,
+                               sample_video, read_frames, parse_sizes, logger, ASSETS_DIR, DEFAULT_SIZES)
+
+GROUPS = ('match', 'image', 'frame', 'annotate', 'end_to_end')
+BACKENDS = ('exact', 'ivf')
+
+# Same as FACE_MATCH_THRESHOLD in logics/face_recognition.py, which is only
+# imported by the groups that need dlib so the match group runs without it
+FACE_MATCH_THRESHOLD = 0.5
+
+
+def bench_match(report, args):
+    """
+    GalleryIndex.match (the batched successor of get_face_name) against
+    synthetic galleries, for every size and search backend.
+    """
+    for size in args.sizes:
+        matrix, labels = synthetic_gallery(size, ENCODING_DIM, seed=args.seed)
+        queries = synthetic_queries(matrix, args.faces, seed=args.seed + 1)
+        for backend in BACKENDS:
+            start = time.perf_counter()
+            gallery = GalleryIndex.from_matrix(matrix, labels, backend=backend)
+            build_seconds = time.perf_counter() - start
+            stats = measure(lambda: gallery.match(queries, FACE_MATCH_THRESHOLD), args.repeat, items=len(queries))
+            stats['build_ms'] = round(1000 * build_seconds, 2)
+            # IVF falls back to an exact scan below SEARCH_MIN_TRAIN_SIZE encodings
+            stats['trained'] = getattr(gallery.index, 'is_trained', None)
+            report.add('match', stats, gallery_size=size, backend=backend, faces=len(queries))
+
+
+def bench_image(report, args, images, gallery):
+    """
+    recognize_faces_in_image: decode, detect, encode and match one upload.
+    """
+    from logics.face_recognition import recognize_faces_in_image
+
+    for name, image_data in images:
+        report.add('recognize_faces_in_image',
+                   measure(lambda: recognize_faces_in_image(image_data, gallery), args.repeat),
+                   image=name, gallery_size=len(gallery))
+
+
+def bench_frame(report, args, frames, gallery):
+    """
+    process_frame over consecutive frames of the sample video.
+    """
+    from logics.face_recognition import process_frame
+
+    frame_iter = iter(())
+
+    def next_frame():
+        nonlocal frame_iter
+        frame = next(frame_iter, None)
+        if frame is None:
+            frame_iter = iter(frames)
+            frame = next(frame_iter)
+        return process_frame(frame, gallery)
+
+    height, width = frames[0].shape[:2]
+    report.add('process_frame', measure(next_frame, args.repeat),
+               resolution=f'{width}x{height}', gallery_size=len(gallery))
+
+
+def bench_annotate(report, args, images, frames, gallery):
+    """
+    Drawing and JPEG encoding: annotate_decoded_image for uploads, and the
+    stream output profiles for live frames.
+    """
+    from logics.face_recognition import recognize_faces_in_image, annotate_decoded_image, decode_image
+
+    for name, image_data in images:
+        faces = [face[:5] for face in recognize_faces_in_image(image_data, gallery)]
+        img = decode_image(image_data)
+        report.add('annotate_decoded_image',
+                   measure(lambda: annotate_decoded_image(img.copy(), faces), args.repeat),
+                   image=name, faces=len(faces))
+
+    frame = frames[0]
+    for scale, quality in ((1.0, 80), (0.5, 80), (1.0, 50), (0.5, 50)):
+        report.add('encode_jpeg', measure(lambda: encode_jpeg(frame, scale, quality), args.repeat),
+                   scale=scale, quality=quality)
+
+
+def configure_app_environment(args):
+    """
+    Point the app at an empty local known people directory and a private
+    shared gallery, so importing it needs neither Firebase nor a camera.
+    """
+    workdir = tempfile.mkdtemp(prefix='face-benchmark-')
+    for name in ('known_people', 'gallery', 'jobs', 'encodings'):
+        os.makedirs(os.path.join(workdir, name))
+    os.environ['KNOWN_PEOPLE_DIR'] = os.path.join(workdir, 'known_people')
+    os.environ['SHARED_GALLERY_DIR'] = os.path.join(workdir, 'gallery')
+    os.environ['VIDEO_JOBS_DIR'] = os.path.join(workdir, 'jobs')
+    os.environ['ENCODING_CACHE_DIR'] = os.path.join(workdir, 'encodings')
+    os.environ['GALLERY_RELOAD_INTERVAL'] = '0'
+    return workdir
+
+
+def publish_synthetic_gallery(size, seed):
+    """
+    Publish a synthetic gallery the way the gunicorn master publishes the
+    real one; the app attaches it on import.
+    """
+    from logics.shared_gallery import SharedGallery, storage_signature
+    from logics.storage import LocalStorage
+
+    matrix, labels = synthetic_gallery(size, ENCODING_DIM, seed=seed)
+    known_encodings = {label: [(row, f'{label}.jpg')] for label, row in zip(labels, matrix)}
+    SharedGallery(os.environ['SHARED_GALLERY_DIR']).publish(
+        known_encodings, storage_signature(LocalStorage(os.environ['KNOWN_PEOPLE_DIR'])))
+
+
+def bench_upload_image(report, args, client, images):
+    """
+    /upload_image throughput at the configured concurrency, per response format.
+    """
+    for name, image_data in images:
+        for response_format in ('json', 'jpeg'):
+            samples, statuses = [], {}
+
+            def upload():
+                start = time.perf_counter()
+                response = client.post(f'/upload_image?format={response_format}',
+                                       data={'imageFile': (io.BytesIO(image_data), name)},
+                                       content_type='multipart/form-data')
+                response.get_data()
+                samples.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            pool = Pool(args.concurrency)
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                pool.spawn(upload)
+            pool.join()
+            elapsed = time.perf_counter() - start
+
+            stats = summarize(samples)
+            stats['per_second'] = round(len(samples) / elapsed, 2)
+            stats['status_codes'] = {str(code): count for code, count in sorted(statuses.items())}
+            report.add('upload_image', stats, image=name, format=response_format, concurrency=args.concurrency)
+
+
+def bench_video(report, args, client, app_module):
+    """
+    /upload_video analysis speed, then /stream_video replay of the result.
+    """
+    video_path = sample_video(args.assets)
+    with open(video_path, 'rb') as f:
+        video_data = f.read()
+
+    start = time.perf_counter()
+    response = client.post('/upload_video', data={'videoFile': (io.BytesIO(video_data), os.path.basename(video_path))},
+                           content_type='multipart/form-data')
+    job_id = response.get_json()['job_id']
+    job = None
+    while time.perf_counter() - start < args.video_timeout:
+        job = client.get(f'/video_jobs/{job_id}').get_json()
+        if job['status'] in ('done', 'failed'):
+            break
+        gevent.sleep(0.2)
+    analysis_seconds = time.perf_counter() - start
+    if job is None or job['status'] != 'done':
+        logger.error(f"Video job {job_id} did not finish: {job}")
+        return
+
+    frames = job.get('frames_rendered') or job.get('frames_total') or 0
+    report.add('upload_video', {
+        'runs': 1, 'mean_ms': round(1000 * analysis_seconds, 2),
+        'per_second': round(frames / analysis_seconds, 2) if analysis_seconds else None,
+        'frames': frames, 'video_fps': job.get('fps'),
+    }, video=os.path.basename(video_path), workers=app_module.video_job_pool.workers)
+
+    # The replay is paced at the video's frame rate, so per_second is bounded by it
+    start = time.perf_counter()
+    response = client.get(f'/stream_video/{job_id}', buffered=False)
+    first_frame, received, samples, last = None, 0, [], start
+    for chunk in response.response:
+        if not chunk.startswith(b'--frame'):
+            continue
+        now = time.perf_counter()
+        first_frame = first_frame or now - start
+        samples.append(now - last)
+        last = now
+        received += 1
+        if args.stream_frames and received >= args.stream_frames:
+            break
+    response.close()
+
+    stats = summarize(samples[1:] or samples)
+    stats['frames'] = received
+    stats['first_frame_ms'] = round(1000 * first_frame, 2) if first_frame is not None else None
+    stats['per_second'] = round(received / (last - start), 2) if last > start else None
+    report.add('stream_video', stats, video=os.path.basename(video_path), video_fps=job.get('fps'))
+
+
+def bench_end_to_end(report, args, images):
+    """
+    Full requests through the Flask app in this process, against a
+    published synthetic gallery and real recognition workers.
+    """
+    configure_app_environment(args)
+    publish_synthetic_gallery(args.e2e_gallery_size, args.seed)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    try:
+        bench_upload_image(report, args, client, images)
+        bench_video(report, args, client, app_module)
+    finally:
+        app_module.recognition_pool.close()
+        app_module.video_job_pool.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the face recognition hot paths and endpoints.")
+    parser.add_argument('--only', default=','.join(GROUPS), help=f"Comma-separated groups: {', '.join(GROUPS)}")
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES, help="Gallery sizes for the match group")
+    parser.add_argument('--gallery-size', type=int, default=1000, help="Gallery size for the image, frame and annotate groups")
+    parser.add_argument('--e2e-gallery-size', type=int, default=1000, help="Gallery size published for the end-to-end group")
+    parser.add_argument('--faces', type=int, default=4, help="Faces per frame matched in the match group")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per measurement")
+    parser.add_argument('--frames', type=int, default=60, help="Video frames cycled through by the frame group")
+    parser.add_argument('--requests', type=int, default=40, help="Uploads per end-to-end measurement")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent end-to-end uploads")
+    parser.add_argument('--stream-frames', type=int, default=0, help="Stop reading /stream_video after this many frames (0 reads all)")
+    parser.add_argument('--video-timeout', type=float, default=600, help="Seconds to wait for the video job")
+    parser.add_argument('--assets', default=ASSETS_DIR, help="Directory with the sample images and Video.mp4")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Previous JSON report to compare against")
+    args = parser.parse_args()
+    args.only = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = set(args.only) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    report = Report('dlib', {key: value for key, value in vars(args).items()})
+
+    images = sample_images(args.assets)
+    matrix, labels = synthetic_gallery(args.gallery_size, ENCODING_DIM, seed=args.seed)
+    gallery = GalleryIndex.from_matrix(matrix, labels)
+
+    if 'match' in args.only:
+        bench_match(report, args)
+    if 'image' in args.only:
+        bench_image(report, args, images, gallery)
+    if 'frame' in args.only or 'annotate' in args.only:
+        frames = read_frames(sample_video(args.assets), args.frames)
+        if 'frame' in args.only:
+            bench_frame(report, args, frames, gallery)
+        if 'annotate' in args.only:
+            bench_annotate(report, args, images, frames, gallery)
+    if 'end_to_end' in args.only:
+        bench_end_to_end(report, args, images)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report.compare(json.load(f))
+    report.write(args.output)
+
+
+if __name__ == '__main__':
+    main()
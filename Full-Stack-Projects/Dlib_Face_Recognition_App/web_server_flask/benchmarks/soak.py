@@ -0,0 +1,193 @@
+import gevent
+from gevent import monkey
+monkey.patch_all()
+
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+from logics.gallery import GalleryIndex, ENCODING_DIM
+from logics.face_recognition import process_frame
+from logics.live_pipeline import LivePipeline, run_in_thread
+from logics.stream_output import StreamRate, OutputProfile, STREAM_JPEG_QUALITY
+from logics.buffers import FRAME_BUFFERS, BUFFER_POOL_SIZE, read_frame
+from benchmarks.common import Report, synthetic_gallery, sample_video, logger, ASSETS_DIR
+
+MB = 1024 * 1024
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class LoopingCapture:
+    """
+    cv2.VideoCapture of a video file that starts over at its end, so a
+    soak can run longer than the sample video.
+    """
+
+    def __init__(self, path):
+        self.capture = cv2.VideoCapture(path)
+        self.rewinds = 0
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self, image=None):
+        ret, frame = read_frame(self.capture, image)
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.rewinds += 1
+            ret, frame = read_frame(self.capture, image)
+        return ret, frame
+
+    def release(self):
+        self.capture.release()
+
+
+def rss_mb():
+    """
+    Resident set size of this process. Outside Linux only the peak is
+    available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / MB
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (MB if sys.platform == 'darwin' else 1024)
+
+
+def growth_per_1000_frames(samples, warmup):
+    """
+    Least-squares slope of RSS over frames after `warmup` frames, in MB
+    per 1000 frames. Flat memory is close to 0.
+    """
+    points = [(frames, rss) for frames, rss in samples if frames >= warmup]
+    if len(points) < 2 or points[0][0] == points[-1][0]:
+        return None
+    frames, rss = np.array(points, dtype=np.float64).T
+    return round(1000 * np.polyfit(frames, rss, 1)[0], 4)
+
+
+def gc_collections():
+    return [generation['collections'] for generation in gc.get_stats()]
+
+
+def draw_faces(frame, recognized_faces):
+    """
+    In-place drawing like the app's annotate_frame.
+    """
+    for (top, right, bottom, left, name) in recognized_faces:
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    return frame
+
+
+def watch(pipeline, profile, counts):
+    """
+    One viewer reading the pipeline's output until it stops.
+    """
+    for jpeg in pipeline.frames(StreamRate(profile, pipeline.max_fps)):
+        counts['frames'] += 1
+        counts['bytes'] += len(jpeg)
+
+
+def soak(report, args, gallery):
+    """
+    Run the live pipeline (capture, recognition, annotation and one
+    encode per viewer profile) over the looping sample video and sample
+    RSS as frames go by.
+    """
+    capture = LoopingCapture(args.video)
+    pipeline = LivePipeline(
+        open_capture=lambda: capture,
+        recognize=lambda frame: run_in_thread(process_frame, frame, gallery),
+        annotate=draw_faces,
+        max_fps=args.fps,
+    )
+
+    gc_before = gc_collections()
+    pipeline.start()
+    viewers = []
+    for scale in args.scales:
+        counts = {'scale': scale, 'frames': 0, 'bytes': 0}
+        viewers.append((gevent.spawn(watch, pipeline, OutputProfile(scale, args.quality, 0, False), counts), counts))
+
+    samples = [(0, rss_mb())]
+    start = time.perf_counter()
+    next_report = start + args.log_interval
+    try:
+        while pipeline.running:
+            gevent.sleep(args.sample_interval)
+            frames = pipeline.ring.sequence
+            samples.append((frames, rss_mb()))
+            if time.perf_counter() >= next_report:
+                next_report += args.log_interval
+                logger.info(f"Soak: {frames} frames, RSS {samples[-1][1]:.1f} MB.")
+            if frames >= args.frames or (args.seconds and time.perf_counter() - start >= args.seconds):
+                break
+    finally:
+        pipeline.stop()
+        gevent.killall([greenlet for greenlet, _ in viewers], timeout=5)
+    gc_after = gc_collections()
+
+    frames = pipeline.ring.sequence
+    stats = pipeline.stats()
+    end_to_end = stats['stages']['end_to_end']
+    rss = [value for _, value in samples]
+    report.add('soak', {
+        'runs': frames,
+        'mean_ms': end_to_end['avg_ms'],
+        'max_ms': end_to_end['max_ms'],
+        'per_second': stats['fps'],
+        'seconds': round(time.perf_counter() - start, 1),
+        'video_rewinds': capture.rewinds,
+        'rss_start_mb': round(samples[0][1], 1),
+        'rss_end_mb': round(rss[-1], 1),
+        'rss_max_mb': round(max(rss), 1),
+        'rss_growth_mb_per_1000_frames': growth_per_1000_frames(samples, args.warmup),
+        'gc_collections': [after - before for before, after in zip(gc_before, gc_after)],
+        'buffers': FRAME_BUFFERS.stats(),
+        'viewers': [{'scale': counts['scale'], 'frames': counts['frames'], 'megabytes': round(counts['bytes'] / MB, 1)}
+                    for _, counts in viewers],
+        'rss_samples': [[frames, round(value, 2)] for frames, value in samples],
+    }, frames=args.frames, seconds=args.seconds, buffer_pool_size=BUFFER_POOL_SIZE, gallery_size=len(gallery))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Long-running live pipeline soak that tracks memory (RSS) per frame.")
+    parser.add_argument('--frames', type=int, default=10000, help="Stop after this many annotated frames")
+    parser.add_argument('--seconds', type=float, default=0, help="Also stop after this many seconds (0 for no limit)")
+    parser.add_argument('--warmup', type=int, default=300, help="Frames left out of the RSS growth estimate")
+    parser.add_argument('--fps', type=float, default=0, help="Capture rate cap (0 runs as fast as possible)")
+    parser.add_argument('--scales', type=lambda value: [float(scale) for scale in value.split(',')], default=[1.0, 0.5],
+                        help="Output scale of each simulated viewer")
+    parser.add_argument('--quality', type=int, default=STREAM_JPEG_QUALITY, help="JPEG quality of the viewers")
+    parser.add_argument('--gallery-size', type=int, default=1000, help="Synthetic gallery size")
+    parser.add_argument('--sample-interval', type=float, default=0.5, help="Seconds between two RSS samples")
+    parser.add_argument('--log-interval', type=float, default=30, help="Seconds between two progress lines")
+    parser.add_argument('--video', default=sample_video(ASSETS_DIR), help="Video looped as the live source")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Previous JSON report to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = Report('dlib-soak', {key: value for key, value in vars(args).items()})
+
+    matrix, labels = synthetic_gallery(args.gallery_size, ENCODING_DIM, seed=args.seed)
+    soak(report, args, GalleryIndex.from_matrix(matrix, labels))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report.compare(json.load(f))
+    report.write(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,16 @@
+import os
+import sys
+import subprocess
 import multiprocessing
 
-# Number of worker processes
-workers = 1
+# Number of worker processes (0 = one per core). All workers attach to one
+# memory-mapped copy of the gallery, see logics/shared_gallery.py
+workers = int(os.getenv('GUNICORN_WORKERS', 1)) or multiprocessing.cpu_count()
+
+# Split the cores between the recognition pools of the workers unless set explicitly
+os.environ.setdefault('RECOGNITION_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+# Same for the video job pools, which get half the cores in total
+os.environ.setdefault('VIDEO_JOB_WORKERS', str(max(1, multiprocessing.cpu_count() // 2 // workers)))
 
 # Use 'gevent' worker class for asynchronous workers
 worker_class = 'gevent'
@@ -12,9 +21,6 @@ timeout = 86400  # 24 hours in seconds
 # Keep an idle connection open for 2 seconds
 keepalive = 2
 
-# Restart workers after a certain number of requests to prevent memory leaks
-max_requests = 1000
-
 # Logging configuration
 accesslog = '-'  # Log to stdout
 errorlog = '-'   # Log to stderr
@@ -23,6 +29,13 @@ loglevel = 'info'  # Logging level: debug, info, warning, error, critical
 # Bind to localhost on port 8000
 bind = 'localhost:8000'
 
+# Load known people once and publish the shared gallery before any worker starts.
+# It runs in a child process so the master never holds Firebase clients or dlib models.
+def on_starting(server):
+    result = subprocess.run([sys.executable, '-m', 'logics.shared_gallery'])
+    if result.returncode != 0:
+        server.log.error("Publishing the shared gallery failed; the workers will load it themselves.")
+
 # Function to retrieve bind information
 def get_bind():
     return bind
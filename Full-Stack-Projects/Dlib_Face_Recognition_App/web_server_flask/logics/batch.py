@@ -0,0 +1,193 @@
+import os
+import math
+import json
+import tarfile
+import zipfile
+import tempfile
+from gevent.pool import Pool
+from logger_config import setup_logger
+from logics.face_recognition import recognize_image, annotate_decoded_image
+from logics.live_pipeline import run_in_thread
+from logics.storage import ALLOWED_EXTENSIONS
+from logics.workers import run_inline
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Batch recognition configuration
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', 2 * 1024 ** 3))  # Largest accepted archive
+BATCH_MAX_IMAGE_BYTES = int(os.getenv('BATCH_MAX_IMAGE_BYTES', 16 * 1024 * 1024))  # Largest image inside an archive
+BATCH_SPOOL_BYTES = 16 * 1024 * 1024  # Archives up to this size stay in memory, larger ones go to disk
+BATCH_BOUNDARY = 'image'
+ARCHIVE_TYPES = {
+    'application/zip', 'application/x-zip-compressed', 'application/x-tar',
+    'application/gzip', 'application/x-gzip', 'application/x-gtar', 'application/octet-stream',
+}
+
+
+class BatchTooLarge(ValueError):
+    """
+    Raised when an uploaded archive exceeds BATCH_MAX_BYTES.
+    """
+
+
+def is_image_name(name):
+    return os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def spool_archive(stream, limit=BATCH_MAX_BYTES):
+    """
+    Copy a request body into a temporary file (kept in memory while small)
+    so zip archives, which need random access, can be read.
+
+    Raises:
+        BatchTooLarge: If the body is larger than `limit` bytes.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    size = 0
+    while True:
+        chunk = stream.read(1024 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            spool.close()
+            raise BatchTooLarge(f"Archive is larger than {limit} bytes")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def iter_archive_images(archive):
+    """
+    Open a zip or (compressed) tar file object and return an iterator of
+    `(name, image_data)` for its images. Entries that are not images or are
+    too large are skipped.
+
+    Raises:
+        ValueError: If the data is neither a zip nor a tar archive.
+    """
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        return _iter_zip_images(zipfile.ZipFile(archive))
+
+    archive.seek(0)
+    try:
+        return _iter_tar_images(tarfile.open(fileobj=archive, mode='r:*'))
+    except tarfile.TarError as e:
+        raise ValueError(f"Unsupported archive: {e}") from e
+
+
+def _iter_zip_images(zf):
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                logger.warning(f"Skipping {info.filename}: larger than {BATCH_MAX_IMAGE_BYTES} bytes.")
+                continue
+            yield info.filename, zf.read(info)
+
+
+def _iter_tar_images(tf):
+    with tf:
+        for member in tf:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            if member.size > BATCH_MAX_IMAGE_BYTES:
+                logger.warning(f"Skipping {member.name}: larger than {BATCH_MAX_IMAGE_BYTES} bytes.")
+                continue
+            yield member.name, tf.extractfile(member).read()
+
+
+def iter_directory_images(path):
+    """
+    Yield `(relative_path, image_data)` for every image below a local directory.
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if not is_image_name(filename):
+                continue
+            file_path = os.path.join(root, filename)
+            with open(file_path, 'rb') as f:
+                yield os.path.relpath(file_path, path), f.read()
+
+
+def face_to_dict(face):
+    top, right, bottom, left, name, distance = face
+    return {
+        'top': int(top), 'right': int(right), 'bottom': int(bottom), 'left': int(left),
+        'name': name,
+        # No known encodings at all leaves the distance infinite
+        'distance': round(float(distance), 4) if math.isfinite(distance) else None,
+    }
+
+
+def recognize_batch_image(filename, image_data, known_encodings, run=run_inline, annotate=False):
+    """
+    Recognize one image of a batch. Failures are reported in the result
+    instead of raised, so one bad image does not end the batch.
+
+    Returns:
+        tuple: `(result, annotated)` where `result` is a JSON-ready dict and
+        `annotated` the annotated JPEG bytes (None unless `annotate` is set).
+    """
+    try:
+        # The image is decoded once; annotation draws on the decoded array on a native thread
+        faces, img = recognize_image(image_data, known_encodings, run=run, keep_image=annotate)
+        annotated = run_in_thread(annotate_decoded_image, img, [face[:5] for face in faces]) if annotate else None
+    except Exception as e:
+        logger.error(f"Error recognizing batch image {filename}: {e}")
+        return {'filename': filename, 'error': str(e)}, None
+    return {'filename': filename, 'faces': [face_to_dict(face) for face in faces]}, annotated
+
+
+def recognize_many(images, recognize, concurrency):
+    """
+    Run `recognize(filename, image_data)` over `images` with up to
+    `concurrency` images in flight, yielding results as they finish (not in
+    input order). Images are read from the iterable only as slots free up.
+    """
+    pool = Pool(max(1, concurrency))
+    try:
+        for result in pool.imap_unordered(lambda image: recognize(*image), images, maxsize=concurrency):
+            yield result
+    finally:
+        # The consumer went away (e.g. the client disconnected): stop the remaining jobs
+        pool.kill()
+
+
+def json_lines(results):
+    """
+    Format batch results as newline-delimited JSON.
+    """
+    for result, _ in results:
+        yield json.dumps(result) + '\n'
+
+
+def multipart_images(results, boundary=BATCH_BOUNDARY):
+    """
+    Format batch results as the parts of a multipart/mixed body: the
+    annotated JPEG of every image, or its JSON result when it failed.
+    """
+    for result, annotated in results:
+        filename = result['filename'].replace('"', '').replace('\r', '').replace('\n', '')
+        if annotated is None:
+            headers, body = 'Content-Type: application/json', json.dumps(result).encode()
+        else:
+            headers, body = f"Content-Type: image/jpeg\r\nX-Faces: {json.dumps(result['faces'])}", annotated
+        yield (f'--{boundary}\r\n{headers}\r\nContent-Disposition: attachment; filename="{filename}"\r\n\r\n'.encode()
+               + body + b'\r\n')
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def write_annotated(output_dir, filename, annotated):
+    """
+    Save an annotated JPEG under `output_dir`, mirroring the input layout.
+    """
+    output_path = os.path.join(output_dir, os.path.splitext(filename)[0] + '.jpg')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'wb') as f:
+        f.write(annotated)
+    return output_path
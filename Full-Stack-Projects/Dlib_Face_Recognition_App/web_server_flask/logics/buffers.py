@@ -0,0 +1,138 @@
+import os
+import sys
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+try:
+    # The pool is shared by greenlets and native thread pool threads, so it needs a real lock
+    from gevent.monkey import get_original
+    allocate_lock = get_original('_thread', 'allocate_lock')
+except ImportError:
+    from _thread import allocate_lock
+
+# Frame buffer reuse configuration
+BUFFER_POOL_SIZE = int(os.getenv('BUFFER_POOL_SIZE', 16))  # Buffers kept per frame shape (0 disables reuse)
+BUFFER_POOL_MAX_MB = float(os.getenv('BUFFER_POOL_MAX_MB', 512))  # Upper bound on the memory the pool keeps
+BUFFER_POOL_SHAPES = 8  # Shapes kept before the least recently used one is dropped
+
+
+def _free_refcount():
+    # References to a pooled buffer nobody else holds, measured the way acquire() checks them
+    buffers = [np.empty(0)]
+    return sys.getrefcount(buffers[0])
+
+
+FREE_REFCOUNT = _free_refcount()
+
+
+class BufferPool:
+    """
+    Reusable numpy arrays for the per-frame destination buffers (captured
+    frames, color conversions, resizes, drawing overlays).
+
+    Frames are megabytes each; allocating and freeing several of them per
+    frame churns the allocator and lets RSS creep up through
+    fragmentation, which is what the forced gc.collect() calls used to
+    paper over. The pool keeps up to `size` arrays per shape and dtype and
+    hands out one that nothing else references. A buffer returns to the
+    pool by itself when its last outside reference (a pipeline slot, the
+    frame ring, an encoder, a view of it) goes away, so buffers can cross
+    stages and threads without release calls. When every buffer of a shape
+    is in use, or the pool already holds `max_mb`, a temporary array is
+    allocated instead.
+    """
+
+    def __init__(self, size=BUFFER_POOL_SIZE, max_mb=BUFFER_POOL_MAX_MB, max_shapes=BUFFER_POOL_SHAPES):
+        self.size = size
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_shapes = max_shapes
+        self._buffers = OrderedDict()  # (shape, dtype) -> [arrays]
+        self._lock = allocate_lock()
+        self.bytes = 0
+        self.allocated = 0
+        self.reused = 0
+        self.overflow = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A worker process starts with its own buffers and a lock no other thread can hold
+        self._buffers = OrderedDict()
+        self._lock = allocate_lock()
+        self.bytes = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        An uninitialized array of `shape` and `dtype` that nothing else uses.
+        """
+        shape = tuple(shape)
+        if self.size <= 0:
+            return np.empty(shape, dtype)
+
+        key = (shape, np.dtype(dtype).str)
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers is None:
+                buffers = self._buffers[key] = []
+                if len(self._buffers) > self.max_shapes:
+                    _, dropped = self._buffers.popitem(last=False)
+                    self.bytes -= sum(buffer.nbytes for buffer in dropped)
+            else:
+                self._buffers.move_to_end(key)
+
+            for index in range(len(buffers)):
+                if sys.getrefcount(buffers[index]) == FREE_REFCOUNT:
+                    self.reused += 1
+                    return buffers[index]
+
+            buffer = np.empty(shape, dtype)
+            if len(buffers) < self.size and self.bytes + buffer.nbytes <= self.max_bytes:
+                buffers.append(buffer)
+                self.bytes += buffer.nbytes
+                self.allocated += 1
+            else:
+                self.overflow += 1
+            return buffer
+
+    def like(self, frame):
+        return self.acquire(frame.shape, frame.dtype)
+
+    def stats(self):
+        return {
+            'shapes': len(self._buffers),
+            'buffers': sum(len(buffers) for buffers in self._buffers.values()),
+            'megabytes': round(self.bytes / (1024 * 1024), 1),
+            'allocated': self.allocated,
+            'reused': self.reused,
+            'overflow': self.overflow,
+        }
+
+
+# Shared by the request handlers, the live pipelines and (after fork) each recognition worker
+FRAME_BUFFERS = BufferPool()
+
+
+def read_frame(capture, frame=None):
+    """
+    `capture.read()` into `frame` when one is given. OpenCV allocates a new
+    array instead if the size of the stream changed.
+    """
+    return capture.read(frame) if frame is not None else capture.read()
+
+
+def resize_frame(frame, scale, interpolation=cv2.INTER_AREA, pool=FRAME_BUFFERS):
+    """
+    Resize a frame by `scale` into a pooled buffer.
+    """
+    height, width = frame.shape[:2]
+    size = (max(1, int(width * scale + 0.5)), max(1, int(height * scale + 0.5)))
+    resized = pool.acquire((size[1], size[0]) + frame.shape[2:], frame.dtype)
+    return cv2.resize(frame, size, dst=resized, interpolation=interpolation)
+
+
+def convert_color(frame, code, pool=FRAME_BUFFERS):
+    """
+    `cv2.cvtColor` for same-shape conversions (e.g. BGR to RGB) into a pooled buffer.
+    """
+    return cv2.cvtColor(frame, code, dst=pool.like(frame))
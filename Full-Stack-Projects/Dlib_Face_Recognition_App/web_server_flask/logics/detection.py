@@ -0,0 +1,93 @@
+import os
+import time
+from logics.buffers import resize_frame
+
+# Detection resolution: a fixed scale factor (e.g. 0.5) or 'auto'
+DETECTION_SCALE = os.getenv('DETECTION_SCALE', '1.0').lower()
+DETECTION_MAX_SIDE = int(os.getenv('DETECTION_MAX_SIDE', 640))  # Starting long side in auto mode
+DETECTION_LATENCY_BUDGET_MS = float(os.getenv('DETECTION_LATENCY_BUDGET_MS', 80))
+MIN_DETECTION_SCALE = 0.25
+SIZE_BUCKET = 64  # Frame sizes share a scale when their long sides round to the same multiple
+
+
+def scale_locations(face_locations, scale, frame_shape):
+    """
+    Map `(top, right, bottom, left)` boxes found on a resized frame back to full resolution.
+    """
+    height, width = frame_shape[:2]
+    return [
+        (max(0, int(round(top / scale))), min(width, int(round(right / scale))),
+         min(height, int(round(bottom / scale))), max(0, int(round(left / scale))))
+        for (top, right, bottom, left) in face_locations
+    ]
+
+
+class DetectionScaler:
+    """
+    Pick the resolution face detection runs at.
+
+    In fixed mode every frame is detected at `scale`. In auto mode the
+    starting scale brings the long side of the frame down to `max_side`,
+    then an exponential moving average of detection latency steps the scale
+    down when it exceeds the latency budget and back up when there is
+    plenty of headroom. Scale and latency are tracked per size bucket (the
+    long side rounded to SIZE_BUCKET pixels, up to the size only the minimum
+    scale fits), so large uploads do not shrink the scale a webcam is
+    detected at and arbitrary upload sizes keep the tables small.
+    """
+
+    def __init__(self, scale=DETECTION_SCALE, max_side=DETECTION_MAX_SIDE,
+                 latency_budget_ms=DETECTION_LATENCY_BUDGET_MS, smoothing=0.2):
+        self.auto = str(scale) == 'auto'
+        self.fixed_scale = 1.0 if self.auto else min(1.0, max(MIN_DETECTION_SCALE, float(scale)))
+        self.max_side = max_side
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.smoothing = smoothing
+        self._auto_scales = {}  # Current auto scale per size bucket
+        self._latency = {}  # Detection latency average per size bucket
+
+    def _bucket(self, frame_shape):
+        # Frames too large to reach max_side even at the minimum scale all share the last bucket
+        long_side = min(max(frame_shape[:2]), self.max_side / MIN_DETECTION_SCALE)
+        return max(1, int(round(long_side / SIZE_BUCKET))) * SIZE_BUCKET
+
+    def scale_for(self, frame_shape):
+        if not self.auto:
+            return self.fixed_scale
+        key = self._bucket(frame_shape)
+        if key not in self._auto_scales:
+            self._auto_scales[key] = min(1.0, max(MIN_DETECTION_SCALE, self.max_side / key))
+        return self._auto_scales[key]
+
+    def observe(self, frame_shape, seconds):
+        """
+        Feed back the latency of one detection (auto mode only).
+        """
+        if not self.auto:
+            return
+        key = self._bucket(frame_shape)
+        latency = self._latency.get(key)
+        latency = seconds if latency is None else (1 - self.smoothing) * latency + self.smoothing * seconds
+        self._latency[key] = latency
+
+        scale = self._auto_scales.get(key, 1.0)
+        if latency > self.latency_budget:
+            scale *= 0.85
+        elif latency < 0.5 * self.latency_budget:
+            scale *= 1.1
+        self._auto_scales[key] = min(1.0, max(MIN_DETECTION_SCALE, scale))
+
+    def detect(self, rgb_frame, locate):
+        """
+        Run `locate(image) -> face_locations` on a downscaled copy of the frame
+        and return the boxes in full-resolution coordinates.
+        """
+        scale = self.scale_for(rgb_frame.shape)
+        start = time.perf_counter()
+        if scale < 1.0:
+            small = resize_frame(rgb_frame, scale)
+            face_locations = scale_locations(locate(small), scale, rgb_frame.shape)
+        else:
+            face_locations = locate(rgb_frame)
+        self.observe(rgb_frame.shape, time.perf_counter() - start)
+        return face_locations
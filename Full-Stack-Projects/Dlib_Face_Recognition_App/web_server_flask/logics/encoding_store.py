@@ -0,0 +1,149 @@
+import os
+import json
+import numpy as np
+from logger_config import setup_logger
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+STORE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+class EncodingStore:
+    """
+    Persistent, content-addressed cache of face encodings.
+
+    Layout on disk:
+        manifest.json          version, dimension, generation and one entry
+                               per source blob (person, filename, fingerprint, row)
+        encodings-<gen>.npy    float32 matrix with one row per encoded blob,
+                               loaded memory-mapped
+
+    A new generation is written next to the old one and published by
+    atomically replacing the manifest, so a reader never sees a half-written
+    store. Blobs whose image contained no face are cached with row -1 so
+    they are not downloaded again until they change.
+    """
+
+    def __init__(self, path, dim=128):
+        self.path = path
+        self.dim = dim
+        self.generation = 0
+        self._entries = {}
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._pending = {}
+
+    def _matrix_path(self, generation):
+        return os.path.join(self.path, f'encodings-{generation}.npy')
+
+    def load(self):
+        """
+        Load the manifest and memory-map the current encoding matrix.
+        A missing, corrupt or outdated store is treated as empty.
+        """
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return self
+
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != STORE_VERSION or manifest.get('dim') != self.dim:
+                logger.warning(f"Ignoring encoding store at {self.path} with incompatible version/dimension.")
+                return self
+
+            generation = manifest['generation']
+            matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+            if matrix.shape[1:] != (self.dim,):
+                raise ValueError(f"Unexpected matrix shape {matrix.shape}")
+
+            self.generation = generation
+            self._entries = manifest['entries']
+            self._matrix = matrix
+            logger.info(f"Loaded encoding store generation {generation} with {len(self._entries)} entries.")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading encoding store at {self.path}: {e}")
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, blob_name, fingerprint):
+        """
+        Return the cached encoding for `blob_name`, or None if the image has no face.
+
+        Raises:
+            KeyError: If the blob is not cached or its fingerprint changed.
+        """
+        if blob_name in self._pending:
+            entry, encoding = self._pending[blob_name]
+            if entry['fingerprint'] == fingerprint:
+                return encoding
+            raise KeyError(blob_name)
+
+        entry = self._entries.get(blob_name)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            raise KeyError(blob_name)
+        return None if entry['row'] < 0 else self._matrix[entry['row']]
+
+    def put(self, blob_name, fingerprint, person_name, filename, encoding):
+        """
+        Stage a freshly computed encoding (None for "no face found").
+        """
+        entry = {'person': person_name, 'filename': filename, 'fingerprint': fingerprint}
+        if encoding is not None:
+            encoding = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        self._pending[blob_name] = (entry, encoding)
+
+    def save(self, keep):
+        """
+        Write a new generation containing only the blobs named in `keep`.
+        Entries for blobs that no longer exist are dropped.
+        """
+        keep = set(keep)
+        entries, rows = {}, []
+
+        for blob_name in sorted(keep):
+            if blob_name in self._pending:
+                entry, encoding = self._pending[blob_name]
+                entry = dict(entry)
+            elif blob_name in self._entries:
+                entry = dict(self._entries[blob_name])
+                encoding = None if entry['row'] < 0 else self._matrix[entry['row']]
+            else:
+                continue
+
+            entry['row'] = -1 if encoding is None else len(rows)
+            if encoding is not None:
+                rows.append(encoding)
+            entries[blob_name] = entry
+
+        dropped = len(set(self._entries) - keep)
+        if not self._pending and not dropped:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        generation = self.generation + 1
+        matrix = np.vstack(rows).astype(np.float32) if rows else np.empty((0, self.dim), dtype=np.float32)
+
+        matrix_tmp = self._matrix_path(generation) + '.tmp'
+        with open(matrix_tmp, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(matrix_tmp, self._matrix_path(generation))
+
+        manifest = {'version': STORE_VERSION, 'dim': self.dim, 'generation': generation, 'entries': entries}
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+        previous = self._matrix_path(self.generation)
+        self.generation = generation
+        self._entries = entries
+        self._matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+        self._pending = {}
+        if os.path.exists(previous):
+            os.remove(previous)
+
+        logger.info(f"Saved encoding store generation {generation}: {len(entries)} entries, {dropped} dropped.")
@@ -0,0 +1,159 @@
+import os
+import time
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from logger_config import setup_logger
+from logics.metrics import STAGE_SECONDS
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Outcome of one job. `encoding` is None when no face was found, `error` is
+# set when the download or the encoder failed.
+EnrollmentResult = namedtuple('EnrollmentResult', ['job', 'encoding', 'error'])
+
+
+def fetch_blob(job):
+    """
+    Download a storage blob (or any object exposing `download_as_bytes`).
+    """
+    return job.source.download_as_bytes()
+
+
+def _timed_encode(encode, img_bytes):
+    start = time.perf_counter()
+    encoding = encode(img_bytes)
+    return encoding, time.perf_counter() - start
+
+
+class StageStats:
+    """
+    Item count, bytes and busy time of one pipeline stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.bytes = 0
+        self.busy_seconds = 0.0
+
+    def record(self, seconds, nbytes=0):
+        self.items += 1
+        self.bytes += nbytes
+        self.busy_seconds += seconds
+
+    def as_dict(self, wall_seconds):
+        return {
+            'items': self.items,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'items_per_second': round(self.items / wall_seconds, 2) if wall_seconds else 0.0,
+            'mb_per_second': round(self.bytes / wall_seconds / 1e6, 2) if wall_seconds else 0.0,
+        }
+
+
+class EnrollmentPipeline:
+    """
+    Overlapping download + encode pipeline for gallery enrollment.
+
+    Jobs are downloaded on a thread pool with bounded I/O concurrency and
+    encoded on a process pool sized to the cores (or on threads when
+    `use_processes` is False, e.g. for encoders that hold a model in memory).
+    At most `max_in_flight` images are held in memory at a time and results
+    are yielded as soon as each image is encoded.
+
+    Args:
+        encode: Picklable callable turning image bytes into an encoding (or None).
+        fetch: Callable returning the image bytes of a job.
+        download_workers: Number of concurrent downloads.
+        encode_workers: Number of encoder workers (defaults to the CPU count).
+        use_processes: Encode on a process pool instead of threads.
+    """
+
+    def __init__(self, encode, fetch=fetch_blob, download_workers=8, encode_workers=None,
+                 use_processes=True, max_in_flight=None):
+        self.encode = encode
+        self.fetch = fetch
+        self.download_workers = download_workers
+        self.encode_workers = encode_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.max_in_flight = max_in_flight or 2 * (self.download_workers + self.encode_workers)
+        self.download_stats = StageStats('download')
+        self.encode_stats = StageStats('encode')
+        self.wall_seconds = 0.0
+
+    def _encode_executor(self):
+        if self.use_processes and self.encode_workers > 1:
+            # Fork keeps the already-imported models and avoids re-running the app module
+            start_methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork') if 'fork' in start_methods else None
+            return ProcessPoolExecutor(max_workers=self.encode_workers, mp_context=context)
+        return ThreadPoolExecutor(max_workers=self.encode_workers)
+
+    def _download(self, job):
+        start = time.perf_counter()
+        img_bytes = self.fetch(job)
+        return img_bytes, time.perf_counter() - start
+
+    def run(self, jobs):
+        """
+        Download and encode every job, yielding EnrollmentResult objects as they complete.
+        """
+        jobs = iter(jobs)
+        started = time.perf_counter()
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as io_pool, \
+                self._encode_executor() as cpu_pool:
+
+            def submit_download():
+                job = next(jobs, None)
+                if job is not None:
+                    pending[io_pool.submit(self._download, job)] = ('download', job)
+
+            for _ in range(self.max_in_flight):
+                submit_download()
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, job = pending.pop(future)
+
+                    if stage == 'download':
+                        try:
+                            img_bytes, seconds = future.result()
+                            self.download_stats.record(seconds, len(img_bytes))
+                            STAGE_SECONDS.observe(seconds, stage='download')
+                            pending[cpu_pool.submit(_timed_encode, self.encode, img_bytes)] = ('encode', job)
+                        except Exception as e:
+                            self.download_stats.errors += 1
+                            submit_download()
+                            yield EnrollmentResult(job, None, e)
+                        continue
+
+                    submit_download()
+                    try:
+                        encoding, seconds = future.result()
+                        self.encode_stats.record(seconds)
+                        STAGE_SECONDS.observe(seconds, stage='enroll_encode')
+                        yield EnrollmentResult(job, encoding, None)
+                    except Exception as e:
+                        self.encode_stats.errors += 1
+                        yield EnrollmentResult(job, None, e)
+
+        self.wall_seconds = time.perf_counter() - started
+        if self.download_stats.items or self.download_stats.errors:
+            logger.info(f"Enrollment pipeline finished: {self.report()}")
+
+    def report(self):
+        """
+        Per-stage throughput of the last run.
+        """
+        return {
+            'wall_seconds': round(self.wall_seconds, 3),
+            'download': self.download_stats.as_dict(self.wall_seconds),
+            'encode': self.encode_stats.as_dict(self.wall_seconds),
+        }
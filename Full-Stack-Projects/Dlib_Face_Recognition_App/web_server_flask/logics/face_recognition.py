@@ -2,7 +2,12 @@ import cv2
 import numpy as np
 import face_recognition
 from logger_config import setup_logger
-from logics.firebase import load_known_people_images_from_firebase
+from logics.gallery import GalleryIndex
+from logics.tracking import FaceTracker, TRACKING_MODE
+from logics.detection import DetectionScaler
+from logics.workers import run_inline
+from logics.buffers import convert_color
+from logics.metrics import STAGE_SECONDS, FACES_MATCHED
 
 # Colorful logger Configuration
 logger = setup_logger()
@@ -10,75 +15,115 @@ logger = setup_logger()
 # Define the threshold as a constant
 FACE_MATCH_THRESHOLD = 0.5
 
-# Function to recognize faces in an image and annotate it
-def recognize_faces_in_image(image_data, known_encodings):
-    # Convert image data to a numpy array and decode it
+# Detection runs on a downscaled copy (DETECTION_SCALE); encodings use the full-resolution frame
+detection_scaler = DetectionScaler()
+
+# Function to recognize faces in an image.
+# `run(func, *args)` executes the dlib work, e.g. on a RecognitionPool; matching stays in this process.
+# With `with_distances` every face also carries the distance to its closest known encoding.
+def recognize_faces_in_image(image_data, known_encodings, run=run_inline, with_distances=False):
+    faces, _ = recognize_image(image_data, known_encodings, run=run)
+    return faces if with_distances else [face[:5] for face in faces]
+
+# Function to recognize faces (with distances) in an image that is decoded only once.
+# With `keep_image` the decoded BGR array is returned as well, so it can be annotated
+# without decoding the bytes again; otherwise None is returned in its place.
+def recognize_image(image_data, known_encodings, run=run_inline, keep_image=False):
+    face_locations, face_encodings, img = run(detect_and_encode_image, image_data, keep_image)
+    return match_faces_with_distances(face_locations, face_encodings, known_encodings), img
+
+# Function to decode image bytes into a BGR array
+def decode_image(image_data):
     np_img = np.frombuffer(image_data, np.uint8)
-    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-    
-    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # Convert image to RGB (for face_recognition)
+    with STAGE_SECONDS.time(stage='decode'):
+        img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+# Function to decode an image and find all face locations and encodings (recognition worker job)
+def detect_and_encode_image(image_data, keep_image=False):
+    img = decode_image(image_data)
+    rgb_img = convert_color(img, cv2.COLOR_BGR2RGB)  # Convert image to RGB (for face_recognition)
+
+    face_locations = detect_faces(rgb_img)
+    face_encodings = encode_faces(rgb_img, face_locations)
+    return face_locations, face_encodings, (img if keep_image else None)
+
+# Function to match detected faces against the gallery in a single batch
+def match_faces(face_locations, face_encodings, known_encodings):
+    return [face[:5] for face in match_faces_with_distances(face_locations, face_encodings, known_encodings)]
+
+# Function to match detected faces and keep the distance of every match
+def match_faces_with_distances(face_locations, face_encodings, known_encodings):
+    gallery = GalleryIndex.ensure(known_encodings)
+    with STAGE_SECONDS.time(stage='match'):
+        matches = gallery.match(face_encodings, FACE_MATCH_THRESHOLD)
+    for name, _ in matches:
+        FACES_MATCHED.inc(result='unknown' if name == 'Unknown' else 'known')
+
+    return [
+        (top, right, bottom, left, name, distance)
+        for (top, right, bottom, left), (name, distance) in zip(face_locations, matches)
+    ]
+
+# Function to draw recognized faces onto a decoded BGR image (in place) and encode it as JPEG
+def annotate_decoded_image(img, recognized_faces):
+    with STAGE_SECONDS.time(stage='annotate'):
+        for (top, right, bottom, left, name) in recognized_faces:
+            # Draw rectangle and label around the face
+            cv2.rectangle(img, (left, top), (right, bottom), (0, 255, 0), 2)
+            cv2.putText(img, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
 
-    # Find all face locations and encodings in the image
-    face_locations = face_recognition.face_locations(rgb_img)
-    face_encodings = face_recognition.face_encodings(rgb_img, face_locations)
-
-    recognized_faces = []
-
-    for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-        best_match_name = "Unknown"
-        best_match_distance = FACE_MATCH_THRESHOLD  # Use the constant threshold
-
-        for person_name, encodings in known_encodings.items():
-            for known_encoding, filename in encodings:
-                distance = face_recognition.face_distance([known_encoding], face_encoding)
-                if distance < best_match_distance:
-                    best_match_distance = distance
-                    best_match_name = person_name
-
-        # Collect recognized face data
-        recognized_faces.append((top, right, bottom, left, best_match_name))
+    # Encode annotated image to bytes
+    with STAGE_SECONDS.time(stage='imencode'):
+        _, annotated_img = cv2.imencode('.jpg', img)
+    return annotated_img.tobytes()
 
-    return recognized_faces
+# Function to find face locations in an RGB frame, returned in full-resolution coordinates
+def detect_faces(rgb_frame):
+    with STAGE_SECONDS.time(stage='face_locations'):
+        return detection_scaler.detect(rgb_frame, face_recognition.face_locations)
 
-# Function to annotate the image with recognized faces without saving temporary files
-def annotate_image(image_data, recognized_faces):
-    # Convert image data to a numpy array and decode it
-    np_img = np.frombuffer(image_data, np.uint8)
-    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+# Function to compute encodings for the given face locations (recognition worker job)
+def encode_faces(rgb_frame, face_locations):
+    with STAGE_SECONDS.time(stage='face_encodings'):
+        return face_recognition.face_encodings(rgb_frame, face_locations)
 
-    for (top, right, bottom, left, name) in recognized_faces:
-        # Draw rectangle and label around the face
-        cv2.rectangle(img, (left, top), (right, bottom), (0, 255, 0), 2)
-        cv2.putText(img, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-
-    # Encode annotated image to bytes
-    _, annotated_img = cv2.imencode('.jpg', img)
-    return annotated_img.tobytes()
+# Function to encode the given face locations and match them against the gallery
+def identify_faces(rgb_frame, face_locations, known_encodings, run=run_inline):
+    face_encodings = run(encode_faces, rgb_frame, face_locations)
+    return [name for (_, _, _, _, name) in match_faces(face_locations, face_encodings, known_encodings)]
 
 # Function to process a single frame
 def process_frame(frame, known_encodings):
     try:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # Convert image to RGB (for face_recognition)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        results = []
+        rgb_frame = convert_color(frame, cv2.COLOR_BGR2RGB)  # Convert image to RGB (for face_recognition)
+        face_locations = detect_faces(rgb_frame)
+        face_encodings = encode_faces(rgb_frame, face_locations)
 
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            best_match_name = "Unknown"
-            best_match_distance = FACE_MATCH_THRESHOLD  # Use the constant threshold
+        return match_faces(face_locations, face_encodings, known_encodings)
 
-            for person_name, encodings in known_encodings.items():
-                for known_encoding, filename in encodings:
-                    distance = face_recognition.face_distance([known_encoding], face_encoding)
-                    if distance < best_match_distance:
-                        best_match_distance = distance
-                        best_match_name = person_name
-
-            results.append((top, right, bottom, left, best_match_name))
+    except Exception as e:
+        logger.error(f"Error processing frame: {e}")
+        return []
 
-        return results
+# Function to create a tracker that detects every few frames and propagates in between.
+# `get_gallery` is called on every identification so a reloaded gallery is picked up,
+# `run` executes detection and encoding (see recognize_faces_in_image).
+def create_frame_tracker(get_gallery, mode=None, run=run_inline):
+    return FaceTracker(
+        lambda rgb_frame: run(detect_faces, rgb_frame),
+        lambda rgb_frame, face_locations: identify_faces(rgb_frame, face_locations, get_gallery(), run),
+        mode=mode or TRACKING_MODE
+    )
+
+# Function to process a single frame through a FaceTracker
+def track_frame(frame, tracker):
+    try:
+        rgb_frame = convert_color(frame, cv2.COLOR_BGR2RGB)  # Convert image to RGB (for face_recognition)
+        return tracker.update(rgb_frame)
 
     except Exception as e:
-        logger.error(f"Error processing frame: {e}")
+        logger.error(f"Error tracking frame: {e}")
         return []
@@ -0,0 +1,112 @@
+import numpy as np
+from logics.search_index import create_index
+
+UNKNOWN_NAME = "Unknown"
+ENCODING_DIM = 128
+
+
+def pack_encodings(known_encodings):
+    """
+    Flatten the `{name: [(encoding, filename), ...]}` dict returned by the
+    Firebase loader into a float32 matrix and parallel label/filename lists.
+    """
+    rows, labels, filenames = [], [], []
+    for person_name, encodings in known_encodings.items():
+        for known_encoding, filename in encodings:
+            rows.append(np.asarray(known_encoding, dtype=np.float32).ravel())
+            labels.append(person_name)
+            filenames.append(filename)
+
+    matrix = np.vstack(rows) if rows else np.empty((0, ENCODING_DIM), dtype=np.float32)
+    return matrix, labels, filenames
+
+
+class GalleryIndex:
+    """
+    Packed view of the known face encodings.
+
+    All encodings live in one contiguous float32 matrix inside a search
+    index (exact brute force or IVF, see `logics.search_index`) with a
+    parallel label array, so a whole frame of faces is matched against the
+    whole gallery with a single batched distance computation.
+    """
+
+    def __init__(self, matrix=None, labels=(), filenames=None, backend=None):
+        self.index = create_index(ENCODING_DIM, metric='l2', backend=backend)
+        self.labels = []
+        self.filenames = []
+        if len(labels):
+            self.add(labels, matrix, filenames)
+
+    @classmethod
+    def from_known_encodings(cls, known_encodings, backend=None):
+        """
+        Build an index from the `{name: [(encoding, filename), ...]}` dict
+        returned by the Firebase loader.
+        """
+        matrix, labels, filenames = pack_encodings(known_encodings)
+        return cls(matrix, labels, filenames, backend=backend)
+
+    @classmethod
+    def from_matrix(cls, matrix, labels, filenames=None, backend=None):
+        """
+        Build an index directly on top of `matrix` (e.g. a read-only memory
+        map shared by several processes) without copying the encodings.
+        """
+        gallery = cls(backend=backend)
+        gallery.labels = list(labels)
+        gallery.filenames = list(filenames) if filenames is not None else [''] * len(gallery.labels)
+        gallery.index.attach(matrix)
+        return gallery
+
+    @classmethod
+    def ensure(cls, known_encodings):
+        """
+        Return `known_encodings` as a GalleryIndex, packing it if a plain dict was given.
+        """
+        if isinstance(known_encodings, cls):
+            return known_encodings
+        return cls.from_known_encodings(known_encodings or {})
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def names(self):
+        ids, _ = self.index.vectors()
+        return sorted({self.labels[row] for row in ids.tolist()})
+
+    def add(self, labels, encodings, filenames=None):
+        """
+        Append encodings to the gallery without rebuilding it.
+        """
+        start = len(self.labels)
+        self.labels.extend(labels)
+        self.filenames.extend(filenames if filenames is not None else [''] * len(labels))
+        self.index.add(np.arange(start, len(self.labels)), encodings)
+
+    def remove_person(self, person_name):
+        """
+        Drop every encoding enrolled under `person_name`.
+        """
+        ids, _ = self.index.vectors()
+        self.index.remove([row for row in ids.tolist() if self.labels[row] == person_name])
+
+    def match(self, face_encodings, threshold):
+        """
+        Find the closest known person for every face in one batch.
+
+        A face is labelled with the gallery name only when its best distance
+        is strictly below `threshold`; otherwise it is reported as Unknown.
+
+        Returns:
+            list: One `(name, distance)` tuple per face encoding.
+        """
+        if len(face_encodings) == 0:
+            return []
+
+        distances, rows = self.index.search(face_encodings, k=1)
+        return [
+            (self.labels[row] if row >= 0 and distance < threshold else UNKNOWN_NAME, float(distance))
+            for row, distance in zip(rows[:, 0].tolist(), distances[:, 0].tolist())
+        ]
@@ -0,0 +1,84 @@
+import os
+from io import BytesIO
+import face_recognition
+from logger_config import setup_logger
+from logics.encoding_store import EncodingStore
+from logics.enrollment import EnrollmentPipeline
+from logics.storage import group_by_person
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Directory of the persistent encoding cache
+encoding_cache_dir = os.getenv('ENCODING_CACHE_DIR', os.path.join('cache', 'encodings'))
+
+# Enrollment concurrency: parallel downloads and encoder processes (0 = one per core)
+enrollment_download_workers = int(os.getenv('ENROLLMENT_DOWNLOAD_WORKERS', 8))
+enrollment_encode_workers = int(os.getenv('ENROLLMENT_ENCODE_WORKERS', 0)) or None
+
+def encode_image_bytes(img_bytes):
+    """
+    Compute the face encoding of the first face in an image.
+    Runs inside the enrollment worker processes.
+
+    Returns:
+        ndarray: The 128-d encoding, or None if no face was found.
+    """
+    img = face_recognition.load_image_file(BytesIO(img_bytes))  # Load the image
+    encodings = face_recognition.face_encodings(img)
+    return encodings[0] if encodings else None  # Use the first face encoding found
+
+def load_known_people_images(storage):
+    """
+    Load face encodings for every image of every known person in `storage`
+    (a FirebaseStorage or LocalStorage from `logics.storage`).
+
+    The storage is listed once and grouped by person in memory. Encodings
+    are cached on disk by object name and fingerprint, so only new or
+    changed images are downloaded and encoded, and images deleted from the
+    storage are dropped from the cache. Cache misses go through the
+    enrollment pipeline, which overlaps downloads with encoding on a
+    process pool.
+
+    Returns:
+        dict: A dictionary with names as keys and lists of face encodings as values.
+    """
+    store = EncodingStore(encoding_cache_dir).load()
+    people = group_by_person(storage.list_images())
+    known_encodings = {}  # Dictionary to store face encodings for each known person
+    jobs = []  # Images that have to be downloaded and encoded
+
+    for person_name, images in people.items():
+        person_images = known_encodings.setdefault(person_name, [])
+        for image in images:
+            # Reuse the cached encoding when the image is unchanged
+            try:
+                img_encoding = store.get(image.name, image.fingerprint)
+                if img_encoding is not None:
+                    person_images.append((img_encoding, image.filename))
+            except KeyError:
+                jobs.append(image)
+
+    # Download and encode new or changed images, streaming results in as they finish
+    pipeline = EnrollmentPipeline(encode_image_bytes, fetch=storage.download,
+                                  download_workers=enrollment_download_workers,
+                                  encode_workers=enrollment_encode_workers)
+    for image, img_encoding, error in pipeline.run(jobs):
+        if error is not None:
+            logger.error(f"Error processing image {image.name}: {error}")
+            continue
+
+        logger.info(f"  Recognized {image.person} from {image.name}")
+        if img_encoding is None:
+            logger.warning(f"No face found in image: {image.name}")
+        else:
+            known_encodings[image.person].append((img_encoding, image.filename))
+        store.put(image.name, image.fingerprint, image.person, image.filename, img_encoding)
+
+    for person_name, person_images in known_encodings.items():
+        logger.info(f"Loaded {len(person_images)} images for {person_name}.")
+
+    seen_images = {image.name for images in people.values() for image in images}
+    store.save(keep=seen_images)
+    logger.info(f"Finished loading known people images ({len(seen_images) - len(jobs)} of {len(seen_images)} served from cache).")
+    return known_encodings
@@ -0,0 +1,427 @@
+import time
+import gevent
+from gevent.event import Event, AsyncResult
+from gevent.lock import Semaphore
+from gevent.monkey import get_original
+from logger_config import setup_logger
+from logics.stream_output import StreamRate, encode_jpeg, DEFAULT_PROFILE
+from logics.buffers import FRAME_BUFFERS, read_frame
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Camera reads run on native threads, so the lock guarding the capture must be a real one
+allocate_lock = get_original('_thread', 'allocate_lock')
+
+
+def run_in_thread(func, *args):
+    """
+    Run a blocking call on gevent's native thread pool and wait for it
+    cooperatively, so the event loop keeps serving other greenlets.
+    """
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
+class LatestSlot:
+    """
+    Single-item, latest-wins mailbox between two pipeline stages.
+
+    `put` never blocks: an item that was not consumed yet is replaced and
+    counted as dropped, so a slow consumer always gets the freshest item.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._full = False
+        self._event = Event()
+        self.dropped = 0
+
+    def put(self, item):
+        if self._full:
+            self.dropped += 1
+        self._item = item
+        self._full = True
+        self._event.set()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next item. Returns None on timeout.
+        """
+        if not self._event.wait(timeout):
+            return None
+        item, self._item, self._full = self._item, None, False
+        self._event.clear()
+        return item
+
+    @property
+    def depth(self):
+        return 1 if self._full else 0
+
+
+class StageTimer:
+    """
+    Count and latency of one pipeline stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(1000 * self.total / self.count, 2) if self.count else 0.0,
+            'last_ms': round(1000 * self.last, 2),
+            'max_ms': round(1000 * self.max, 2),
+        }
+
+
+class FrameRing:
+    """
+    Fixed-size ring of the most recently annotated frames.
+
+    The producer publishes each frame once; readers keep their own cursor
+    and never block the producer. A reader that falls behind jumps to the
+    newest frame and the frames it missed are counted as skipped.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._frames = [None] * size
+        self.sequence = 0
+        self.skipped = 0
+        self._ready = Event()
+
+    def publish(self, frame):
+        self.sequence += 1
+        self._frames[self.sequence % self.size] = frame
+        self.wake()
+
+    def wake(self):
+        self._ready.set()
+        self._ready.clear()
+
+    def read_after(self, cursor, timeout=None):
+        """
+        Wait for a frame newer than `cursor`. Returns `(sequence, frame)`,
+        or `(cursor, None)` on timeout or wake-up without a new frame.
+        """
+        if self.sequence == cursor:
+            self._ready.wait(timeout)
+            if self.sequence == cursor:
+                return cursor, None
+        sequence = self.sequence
+        if cursor:
+            self.skipped += max(0, sequence - cursor - 1)
+        return sequence, self._frames[sequence % self.size]
+
+
+class SharedEncoder:
+    """
+    Encode each annotated frame at most once per `(scale, quality)`.
+
+    Viewers asking for the same output of the same frame share one encode;
+    one that asks while the encode is in flight waits for its result.
+    Only the entries of the newest frames are kept.
+    """
+
+    def __init__(self, run_blocking=run_in_thread):
+        self.run_blocking = run_blocking
+        self.timer = StageTimer()
+        self.shared = 0
+        self._sequence = 0
+        self._encoded = {}  # (scale, quality) -> (sequence, AsyncResult of the JPEG bytes)
+
+    def encode(self, sequence, frame, scale, quality):
+        """
+        Return the JPEG of frame `sequence`, or None if encoding failed.
+        """
+        key = (scale, quality)
+        entry = self._encoded.get(key)
+        if entry is not None and entry[0] == sequence:
+            self.shared += 1
+            return entry[1].get()
+
+        if sequence > self._sequence:
+            self._sequence = sequence
+            self._encoded = {cached_key: cached for cached_key, cached in self._encoded.items() if cached[0] >= sequence - 1}
+        result = AsyncResult()
+        if entry is None or sequence > entry[0]:
+            self._encoded[key] = (sequence, result)
+
+        start = time.perf_counter()
+        try:
+            jpeg = self.run_blocking(encode_jpeg, frame, scale, quality)
+        except Exception as e:
+            logger.error(f"Error encoding frame: {e}")
+            jpeg = None
+        self.timer.record(time.perf_counter() - start)
+        result.set(jpeg)
+        return jpeg
+
+    def stats(self):
+        stats = self.timer.as_dict()
+        stats['shared'] = self.shared
+        stats['profiles'] = len([entry for entry in self._encoded.values() if entry[0] == self._sequence])
+        return stats
+
+
+class LivePipeline:
+    """
+    Capture -> inference -> annotate pipeline for a live feed, encoded per viewer.
+
+    Each stage is its own greenlet and hands work to the next one through a
+    LatestSlot, so capture never waits for recognition and every stage
+    works on the freshest frame available. Camera reads, drawing and JPEG
+    encoding run off the event loop through `run_blocking`; `recognize` is
+    called on the event loop and is expected to offload its heavy work
+    (e.g. to a RecognitionPool). Each frame is annotated once and published
+    to a FrameRing shared by every reader of `frames()`; readers encode it
+    at their own scale and quality through a SharedEncoder, so each
+    distinct output is encoded once per frame. Frames are captured into
+    buffers of `buffers` (a BufferPool), which are reused once the last
+    stage and reader let go of them.
+
+    Args:
+        open_capture: Callable returning an opened cv2.VideoCapture.
+        recognize: Cooperative callable `(frame) -> recognized_faces`.
+        annotate: Callable `(frame, recognized_faces) -> annotated frame`.
+        on_faces: Optional callback `(recognized_faces)` run on the event loop.
+        max_fps: Upper bound on the capture rate.
+    """
+
+    def __init__(self, open_capture, recognize, annotate, on_faces=None, max_fps=30, run_blocking=run_in_thread,
+                 buffers=FRAME_BUFFERS):
+        self.open_capture = open_capture
+        self.recognize = recognize
+        self.annotate = annotate
+        self.on_faces = on_faces
+        self.max_fps = max_fps
+        self.frame_time = 1.0 / max_fps if max_fps else 0.0
+        self.run_blocking = run_blocking
+        self.buffers = buffers
+        self._frame_shape = None
+        self._capture_lock = allocate_lock()
+
+        self.frames_slot = LatestSlot()
+        self.results_slot = LatestSlot()
+        self.timers = {name: StageTimer() for name in ('capture', 'inference', 'annotate', 'end_to_end')}
+        self.encoder = SharedEncoder(run_blocking)
+
+        self.running = False
+        self.started_at = None
+        self.stopped_at = None
+        self.capture = None
+        self._greenlets = []
+        self.ring = FrameRing()
+
+    def start(self):
+        if self.running:
+            return self
+        self.capture = self.run_blocking(self.open_capture)  # Stream URLs can take seconds to open
+        if self.capture is None or not self.capture.isOpened():
+            raise IOError("Failed to open video capture device.")
+
+        self.running = True
+        self.started_at = time.perf_counter()
+        self._greenlets = [gevent.spawn(loop) for loop in (self._capture_loop, self._inference_loop, self._annotate_loop)]
+        logger.info("Live pipeline started.")
+        return self
+
+    def stop(self):
+        if self.capture is None:
+            return
+        self.running = False
+        self.stopped_at = self.stopped_at or time.perf_counter()
+        gevent.killall(self._greenlets, block=True, timeout=5)
+        self._greenlets = []
+        if self.capture is not None:
+            # A killed capture greenlet leaves its read running on the thread pool
+            self.run_blocking(self._release_capture)
+        self.ring.wake()
+        logger.info(f"Live pipeline stopped: {self.stats()}")
+
+    def _read_frame(self):
+        with self._capture_lock:
+            if self.capture is None:
+                return False, None
+            buffer = self.buffers.acquire(self._frame_shape) if self._frame_shape is not None else None
+            ret, frame = read_frame(self.capture, buffer)
+        if ret:
+            self._frame_shape = frame.shape
+        return ret, frame
+
+    def _release_capture(self):
+        with self._capture_lock:
+            if self.capture is not None:
+                self.capture.release()
+                self.capture = None
+
+    def _capture_loop(self):
+        while self.running:
+            start = time.perf_counter()
+            try:
+                ret, frame = self.run_blocking(self._read_frame)
+            except Exception as e:
+                logger.error(f"Error reading frame: {e}")
+                ret, frame = False, None
+            if not ret:
+                logger.warning("Frame not retrieved, stopping video stream.")
+                self.running = False
+                self.stopped_at = time.perf_counter()
+                self.ring.wake()
+                break
+            self.timers['capture'].record(time.perf_counter() - start)
+            self.frames_slot.put((frame, start))
+
+            elapsed = time.perf_counter() - start
+            gevent.sleep(max(0, self.frame_time - elapsed))
+
+    def _inference_loop(self):
+        while self.running:
+            item = self.frames_slot.get(timeout=1.0)
+            if item is None:
+                continue
+            frame, captured_at = item
+            start = time.perf_counter()
+            try:
+                recognized_faces = self.recognize(frame)
+            except Exception as e:
+                logger.error(f"Error recognizing frame: {e}")
+                recognized_faces = []
+            self.timers['inference'].record(time.perf_counter() - start)
+            self.results_slot.put((frame, recognized_faces, captured_at))
+
+            if self.on_faces is not None:
+                try:
+                    self.on_faces(recognized_faces)
+                except Exception as e:
+                    logger.error(f"Error in face callback: {e}")
+
+    def _annotate_loop(self):
+        while self.running:
+            item = self.results_slot.get(timeout=1.0)
+            if item is None:
+                continue
+            frame, recognized_faces, captured_at = item
+            start = time.perf_counter()
+            try:
+                annotated = self.run_blocking(self.annotate, frame, recognized_faces)
+            except Exception as e:
+                logger.error(f"Error annotating frame: {e}")
+                continue
+            now = time.perf_counter()
+            self.timers['annotate'].record(now - start)
+            self.timers['end_to_end'].record(now - captured_at)
+
+            self.ring.publish(annotated)
+
+    def frames(self, rate=None, timeout=5.0):
+        """
+        Yield the freshest frame as JPEG each time a new one is ready, encoded
+        and paced according to `rate` (a StreamRate).
+
+        A reader that falls behind skips straight to the newest frame. The
+        time the consumer takes to come back for the next frame (i.e. to
+        write the previous one to the client) is reported to `rate`.
+        """
+        rate = rate or StreamRate(DEFAULT_PROFILE, self.max_fps)
+        cursor = 0
+        while self.running:
+            gevent.sleep(rate.delay())
+            cursor, frame = self.ring.read_after(cursor, timeout)
+            if frame is None:
+                continue
+            jpeg = self.encoder.encode(cursor, frame, rate.scale, rate.quality)
+            if jpeg is None:
+                continue
+            started = time.monotonic()
+            yield jpeg
+            rate.record_send(started, time.monotonic())
+
+    def fps(self):
+        """
+        Average rate of encoded frames since the pipeline started.
+        """
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.stopped_at or time.perf_counter()) - self.started_at
+        return self.ring.sequence / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'fps': round(self.fps(), 2),
+            'queue_depth': self.frames_slot.depth + self.results_slot.depth,
+            'frames_annotated': self.ring.sequence,
+            'frames_skipped_by_viewers': self.ring.skipped,
+            'dropped_before_inference': self.frames_slot.dropped,
+            'dropped_before_annotate': self.results_slot.dropped,
+            'stages': {name: timer.as_dict() for name, timer in self.timers.items()},
+            'encode': self.encoder.stats(),
+        }
+
+
+class CameraBroadcaster:
+    """
+    Share one LivePipeline between every viewer of a camera.
+
+    The camera is opened, recognized and annotated once no matter how many
+    clients are watching; each viewer reads the shared FrameRing at its own
+    pace and output profile, so a slow client skips frames instead of
+    stalling the producer.
+
+    Args:
+        create_pipeline: Callable returning a new (not started) LivePipeline.
+    """
+
+    def __init__(self, create_pipeline):
+        self.create_pipeline = create_pipeline
+        self.pipeline = None
+        self.viewers = []  # StreamRate of every connected viewer
+        self._lock = Semaphore()
+
+    @property
+    def running(self):
+        return self.pipeline is not None and self.pipeline.running
+
+    def start(self):
+        with self._lock:
+            if not self.running:
+                if self.pipeline is not None:
+                    self.pipeline.stop()  # Release a capture that ended on its own
+                self.pipeline = self.create_pipeline().start()
+        return self.pipeline
+
+    def stop(self):
+        with self._lock:
+            if self.pipeline is not None:
+                self.pipeline.stop()
+
+    def subscribe(self, profile=DEFAULT_PROFILE):
+        """
+        Yield encoded frames to one viewer until the feed stops or the viewer disconnects.
+        """
+        pipeline = self.pipeline
+        if pipeline is None or not pipeline.running:
+            return
+        rate = StreamRate(profile, pipeline.max_fps)
+        self.viewers.append(rate)
+        try:
+            yield from pipeline.frames(rate)
+        finally:
+            self.viewers.remove(rate)
+
+    def stats(self):
+        stats = self.pipeline.stats() if self.pipeline is not None else {'running': False}
+        stats['viewers'] = len(self.viewers)
+        stats['viewer_streams'] = [rate.as_dict() for rate in self.viewers]
+        return stats
@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from logger_config import setup_logger
+
+try:
+    # Under gevent, threading is patched to greenlets; the sampler needs a real OS thread
+    from gevent.monkey import get_original
+    start_new_thread, get_native_ident = get_original('_thread', ['start_new_thread', 'get_ident'])
+    native_sleep = get_original('time', 'sleep')
+except ImportError:
+    from _thread import start_new_thread, get_ident as get_native_ident
+    native_sleep = time.sleep
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Profiling configuration: nothing is sampled or timed unless enabled
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'  # Serve /admin/profile
+PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', 60))  # Longest profile one request may take
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', 10))  # Default time between two samples
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'  # Server-Timing header on /upload_image
+
+MAX_STACK_DEPTH = 128
+
+# Modules are imported on the main thread, which runs the gevent hub and every greenlet
+MAIN_THREAD_ID = get_native_ident()
+
+
+class ProfilerBusy(Exception):
+    """
+    Raised when a profile is requested while another one is running.
+    """
+
+
+def frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse_stack(frame, max_depth=MAX_STACK_DEPTH):
+    """
+    `outermost;...;innermost` labels of a frame and its callers.
+    """
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the Python stacks of every thread.
+
+    A native thread wakes up every `interval` seconds and records the
+    current stack of each other thread, so it also sees a gevent hub that
+    is stuck in a greenlet. The main thread's stack is whichever greenlet
+    is running (or the hub's loop when idle); thread pool threads appear
+    under their own root. Work done in recognition worker processes is not
+    visible; it shows as the caller waiting for the result.
+
+    Results use the collapsed format (`frame;frame;frame count` per line)
+    read by flamegraph.pl, speedscope and similar tools. Nothing runs
+    between profiles.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self._done = True
+        self._thread_names = {}
+        self._lock = threading.Lock()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running or not self._done:
+                raise ProfilerBusy("A profile is already running")
+            self.running = True
+            self._done = False
+        self.interval = interval or self.interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self._thread_names[MAIN_THREAD_ID] = 'MainThread'
+        start_new_thread(self._sample_loop, ())
+        logger.info(f"Profiler started (every {self.interval * 1000:g} ms).")
+
+    def stop(self):
+        self.running = False
+
+    def _sample_loop(self):
+        own_ident = get_native_ident()
+        try:
+            while self.running:
+                for ident, frame in sys._current_frames().items():
+                    if ident != own_ident:
+                        root = self._thread_names.get(ident, f'thread-{ident}')
+                        self.stacks[f'{root};{collapse_stack(frame)}'] += 1
+                self.samples += 1
+                native_sleep(self.interval)
+        except Exception as e:
+            logger.error(f"Profiler sampling failed: {e}")
+        finally:
+            self._done = True
+
+    def run(self, seconds, interval=None):
+        """
+        Profile for `seconds` and return the collapsed stacks. The caller
+        sleeps meanwhile (cooperatively under gevent).
+
+        Raises:
+            ProfilerBusy: If another profile is running.
+        """
+        self.start(interval)
+        try:
+            time.sleep(seconds)
+        finally:
+            self.stop()
+            while not self._done:
+                time.sleep(self.interval)
+        logger.info(f"Profiler stopped after {self.samples} samples.")
+        return self.collapsed()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ServerTiming:
+    """
+    Per-request timing breakdown, sent as a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.entries = []
+
+    @contextmanager
+    def time(self, name, description=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append((name, time.perf_counter() - start, description))
+
+    def wrap(self, name, func, description=None):
+        """
+        `func` timed as `name` on every call.
+        """
+        def timed(*args, **kwargs):
+            with self.time(name, description):
+                return func(*args, **kwargs)
+        return timed
+
+    def header(self):
+        entries = self.entries + [('total', time.perf_counter() - self.started, None)]
+        return ', '.join(
+            f'{name};dur={1000 * seconds:.1f}' + (f';desc="{description}"' if description else '')
+            for name, seconds, description in entries
+        )
+
+
+class _NoTiming:
+    """
+    Stand-in for ServerTiming when the header is disabled; records nothing.
+    """
+
+    def time(self, name, description=None):
+        return nullcontext()
+
+    def wrap(self, name, func, description=None):
+        return func
+
+    def header(self):
+        return None
+
+
+NO_TIMING = _NoTiming()
+
+
+def request_timing():
+    """
+    A ServerTiming for the current request, or a no-op one when SERVER_TIMING is off.
+    """
+    return ServerTiming() if SERVER_TIMING else NO_TIMING
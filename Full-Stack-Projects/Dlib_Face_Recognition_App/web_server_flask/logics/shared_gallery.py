@@ -0,0 +1,238 @@
+import os
+import json
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from logger_config import setup_logger
+from logics.gallery import GalleryIndex, pack_encodings, ENCODING_DIM
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Directory of the gallery shared by all worker processes
+SHARED_GALLERY_DIR = os.getenv('SHARED_GALLERY_DIR', os.path.join('cache', 'gallery'))
+SHARED_GALLERY_POLL_INTERVAL = float(os.getenv('SHARED_GALLERY_POLL_INTERVAL', 2))  # Seconds between generation checks
+
+GALLERY_VERSION = 1
+POINTER_NAME = 'current.json'
+KEEP_GENERATIONS = 2  # Generations kept on disk so a worker still opening the previous one finds its files
+
+
+def storage_signature(storage):
+    """
+    Fingerprint of every image under known_people/, used to detect changes.
+    Stable across processes, so it can be stored with the published gallery.
+    """
+    digest = hashlib.sha1()
+    for image in sorted(storage.list_images(), key=lambda image: image.name):
+        digest.update(f'{image.name}\0{image.fingerprint}\n'.encode())
+    return digest.hexdigest()
+
+
+class SharedGallery:
+    """
+    Known face encodings published once on disk and attached read-only by
+    every worker process.
+
+    Layout on disk:
+        current.json        pointer to the published generation (version,
+                            generation, size, storage signature, publish time)
+        gallery-<gen>.npy   float32 encoding matrix, one row per encoding
+        gallery-<gen>.json  label and filename of every row
+
+    Workers memory-map the matrix, so the page cache holds a single copy no
+    matter how many workers attach to it. A reload writes the next
+    generation next to the current one and publishes it by atomically
+    replacing the pointer; workers notice the new generation and swap their
+    gallery, while older generations stay readable until they are pruned.
+    """
+
+    def __init__(self, path=SHARED_GALLERY_DIR):
+        self.path = path
+        self._leader_fd = None
+        self.failed_signature = None  # Storage signature whose last load failed
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _matrix_path(self, generation):
+        return self._file(f'gallery-{generation}.npy')
+
+    def _labels_path(self, generation):
+        return self._file(f'gallery-{generation}.json')
+
+    def current(self):
+        """
+        Return the pointer of the published generation, or None when nothing
+        (compatible) has been published yet.
+        """
+        try:
+            with open(self._file(POINTER_NAME)) as f:
+                pointer = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading shared gallery pointer in {self.path}: {e}")
+            return None
+
+        if pointer.get('version') != GALLERY_VERSION or pointer.get('dim') != ENCODING_DIM:
+            logger.warning(f"Ignoring shared gallery at {self.path} with incompatible version/dimension.")
+            return None
+        return pointer
+
+    def publish(self, known_encodings, signature=None):
+        """
+        Write `known_encodings` as the next generation and make it current.
+
+        Returns:
+            int: The published generation.
+        """
+        matrix, labels, filenames = pack_encodings(known_encodings)
+        os.makedirs(self.path, exist_ok=True)
+        current = self.current()
+        generation = (current['generation'] if current else 0) + 1
+
+        with open(self._matrix_path(generation) + '.tmp', 'wb') as f:
+            np.save(f, matrix.astype(np.float32, copy=False))
+        os.replace(self._matrix_path(generation) + '.tmp', self._matrix_path(generation))
+
+        with open(self._labels_path(generation) + '.tmp', 'w') as f:
+            json.dump({'labels': labels, 'filenames': filenames}, f)
+        os.replace(self._labels_path(generation) + '.tmp', self._labels_path(generation))
+
+        pointer = {
+            'version': GALLERY_VERSION, 'dim': ENCODING_DIM, 'generation': generation,
+            'size': len(labels), 'signature': signature, 'published_at': datetime.utcnow().isoformat(),
+        }
+        pointer_path = self._file(POINTER_NAME)
+        with open(pointer_path + '.tmp', 'w') as f:
+            json.dump(pointer, f)
+        os.replace(pointer_path + '.tmp', pointer_path)
+
+        # Workers that already mapped a pruned matrix keep reading it until they let go
+        for stale in (self._matrix_path(generation - KEEP_GENERATIONS), self._labels_path(generation - KEEP_GENERATIONS)):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+        logger.info(f"Published shared gallery generation {generation} ({len(labels)} encodings).")
+        return generation
+
+    def attach(self, newer_than=0, backend=None, retries=1):
+        """
+        Memory-map the published generation read-only and wrap it in a GalleryIndex.
+
+        Returns:
+            tuple: `(pointer, gallery)`, or None when no generation newer
+            than `newer_than` has been published.
+        """
+        pointer = self.current()
+        if pointer is None or pointer['generation'] <= newer_than:
+            return None
+
+        generation = pointer['generation']
+        try:
+            matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+            with open(self._labels_path(generation)) as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            # Two generations were published while we were reading the pointer
+            if retries > 0:
+                return self.attach(newer_than, backend, retries - 1)
+            raise
+
+        if matrix.shape != (len(rows['labels']), ENCODING_DIM):
+            raise ValueError(f"Unexpected shared gallery matrix shape {matrix.shape}")
+        return pointer, GalleryIndex.from_matrix(matrix, rows['labels'], rows['filenames'], backend=backend)
+
+    @contextmanager
+    def reload_lock(self):
+        """
+        Hold the cross-process reload lock for the duration of the block.
+        Yields False without waiting when another process already holds it.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('reload.lock'), 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def lead(self):
+        """
+        Try to become (or stay) the process that watches storage for changes.
+
+        The lock is held until the process exits, so when the leading worker
+        is restarted another worker takes over on its next attempt.
+        """
+        if self._leader_fd is None:
+            os.makedirs(self.path, exist_ok=True)
+            fd = os.open(self._file('leader.lock'), os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._leader_fd = fd
+            logger.info(f"Process {os.getpid()} now watches known people for changes.")
+        return True
+
+
+def publish_known_people(shared, storage, load_known_people, force=False):
+    """
+    Load the known people and publish them as a new shared generation.
+
+    Unless `force` is set, nothing is loaded when the published generation
+    was built from the same storage contents, or when loading those
+    contents already failed. An empty storage publishes an empty gallery.
+
+    Returns:
+        bool: True if the published gallery is up to date, False if the
+        storage is unchanged since a failed load.
+
+    Raises:
+        Exception: Whatever `load_known_people` raised; the current gallery stays published.
+    """
+    signature = storage_signature(storage)
+    current = shared.current()
+    if not force and current is not None and current.get('signature') == signature:
+        logger.info(f"Shared gallery generation {current['generation']} is up to date.")
+        return True
+    if not force and shared.failed_signature == signature:
+        logger.info("Known people unchanged since the last failed load; waiting for a change or a forced reload.")
+        return False
+
+    logger.info("Loading known encodings...")
+    try:
+        known_encodings = load_known_people()
+    except Exception:
+        shared.failed_signature = signature
+        raise
+    if not known_encodings:
+        logger.warning("No known people in storage; publishing an empty gallery.")
+
+    shared.failed_signature = None
+    shared.publish(known_encodings, signature)
+    return True
+
+
+if __name__ == '__main__':
+    # Run by the gunicorn master before the workers start (see gunicorn_config.py)
+    from logics.firebase import known_people_storage, load_known_people_images_from_firebase
+
+    shared_gallery = SharedGallery()
+    with shared_gallery.reload_lock() as acquired:
+        if not acquired:
+            logger.info("Another process is already publishing the shared gallery.")
+        else:
+            try:
+                publish_known_people(shared_gallery, known_people_storage, load_known_people_images_from_firebase)
+            except Exception as e:
+                logger.error(f"Publishing the shared gallery failed: {e}")
+                raise SystemExit(1)
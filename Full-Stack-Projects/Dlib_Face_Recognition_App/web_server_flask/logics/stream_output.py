@@ -0,0 +1,158 @@
+import os
+import time
+from collections import namedtuple
+import cv2
+from logger_config import setup_logger
+from logics.metrics import STAGE_SECONDS
+from logics.buffers import resize_frame
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Stream output configuration: what viewers receive, independent of the resolution faces are analyzed at
+STREAM_SCALE = float(os.getenv('STREAM_SCALE', 1.0))  # Output size relative to the captured frame
+STREAM_JPEG_QUALITY = int(os.getenv('STREAM_JPEG_QUALITY', 80))  # JPEG quality (10-100)
+STREAM_MAX_FPS = float(os.getenv('STREAM_MAX_FPS', 0))  # Per-viewer frame rate cap (0 sends every frame)
+STREAM_ADAPTIVE = os.getenv('STREAM_ADAPTIVE', 'false').lower() == 'true'  # Adapt to each viewer's connection
+
+MIN_SCALE = 0.1
+MIN_QUALITY = 10
+MAX_QUALITY = 100
+
+# Adaptive mode steps quality down first, then halves the frame rate.
+# The steps are fixed so viewers on the same step share encoded frames.
+ADAPTIVE_QUALITY_STEP = 15
+ADAPTIVE_MIN_QUALITY = 30
+ADAPTIVE_MIN_FPS = 2
+BACKLOG_HIGH = 0.5  # Step down when sending a frame takes more than half of the frame interval
+BACKLOG_LOW = 0.1  # Step back up when sends stay under a tenth of it
+ADAPTIVE_DOWN_HOLD = 1.0  # Seconds between two steps down
+ADAPTIVE_UP_HOLD = 5.0  # Seconds at a step before trying the next better one
+
+OutputProfile = namedtuple('OutputProfile', ['scale', 'quality', 'max_fps', 'adaptive'])
+DEFAULT_PROFILE = OutputProfile(STREAM_SCALE, STREAM_JPEG_QUALITY, STREAM_MAX_FPS, STREAM_ADAPTIVE)
+
+
+def parse_output_profile(args, default=DEFAULT_PROFILE):
+    """
+    Build an OutputProfile from the `scale`, `quality`, `fps` and `adaptive`
+    query arguments, falling back to `default` for the missing ones.
+
+    Raises:
+        ValueError: If a value is not a number or out of range.
+    """
+    try:
+        scale = float(args.get('scale', default.scale))
+        quality = int(args.get('quality', default.quality))
+        max_fps = float(args.get('fps', default.max_fps))
+    except (TypeError, ValueError):
+        raise ValueError("scale, quality and fps must be numbers")
+    adaptive = str(args.get('adaptive', default.adaptive)).lower() in ('1', 'true', 'yes', 'on')
+
+    if not MIN_SCALE <= scale <= 1.0:
+        raise ValueError(f"scale must be between {MIN_SCALE} and 1")
+    if not MIN_QUALITY <= quality <= MAX_QUALITY:
+        raise ValueError(f"quality must be between {MIN_QUALITY} and {MAX_QUALITY}")
+    if max_fps < 0:
+        raise ValueError("fps must not be negative")
+    # Rounded so near-identical requests map to the same shared encode
+    return OutputProfile(round(scale, 2), quality, max_fps, adaptive)
+
+
+def encode_jpeg(frame, scale=1.0, quality=STREAM_JPEG_QUALITY):
+    """
+    Resize a BGR frame by `scale` and encode it as JPEG bytes.
+    """
+    with STAGE_SECONDS.time(stage='imencode'):
+        if scale != 1.0:
+            frame = resize_frame(frame, scale)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ret:
+        raise ValueError("Frame encoding failed")
+    return buffer.tobytes()
+
+
+def adaptive_steps(quality, fps):
+    """
+    The `(quality, fps)` steps an adaptive viewer moves along, best first.
+    """
+    steps = [(quality, fps)]
+    while steps[-1][0] > ADAPTIVE_MIN_QUALITY:
+        steps.append((max(ADAPTIVE_MIN_QUALITY, steps[-1][0] - ADAPTIVE_QUALITY_STEP), fps))
+    while steps[-1][1] > ADAPTIVE_MIN_FPS:
+        steps.append((steps[-1][0], max(ADAPTIVE_MIN_FPS, steps[-1][1] / 2)))
+    return steps
+
+
+class StreamRate:
+    """
+    Output state of one viewer: the scale, quality and frame rate it is sent.
+
+    The frame rate is the profile's `max_fps`, or `default_fps` when the
+    profile has no cap. In adaptive mode the time each frame takes to be
+    written to the viewer's socket is the measure of its send backlog: a
+    write only blocks once the socket buffer is full, i.e. when the client
+    reads slower than frames are sent. A growing backlog steps quality and
+    then frame rate down; a drained one steps them back up.
+    """
+
+    def __init__(self, profile, default_fps=0):
+        self.profile = profile
+        self.scale = profile.scale
+        fps = profile.max_fps or default_fps
+        self.steps = adaptive_steps(profile.quality, fps) if profile.adaptive else [(profile.quality, fps)]
+        self.step = 0
+        self.backlog = None
+        self._changed_at = time.monotonic()
+        self._next_at = 0.0
+
+    @property
+    def quality(self):
+        return self.steps[self.step][0]
+
+    @property
+    def fps(self):
+        return self.steps[self.step][1]
+
+    def delay(self):
+        """
+        Seconds to wait before the next frame is due.
+        """
+        if not self.fps:
+            return 0.0
+        return max(0.0, self._next_at - time.monotonic())
+
+    def record_send(self, started, finished):
+        """
+        Record one frame written to the viewer between `started` and
+        `finished` (time.monotonic() values).
+        """
+        if self.fps:
+            interval = 1.0 / self.fps
+            self._next_at = max(self._next_at, started - interval) + interval
+        if len(self.steps) > 1:
+            self._adapt(finished - started, finished)
+
+    def _adapt(self, seconds, now):
+        self.backlog = seconds if self.backlog is None else 0.7 * self.backlog + 0.3 * seconds
+        # Without a frame rate, judge the backlog against a 30 fps frame interval
+        ratio = self.backlog * (self.fps or 30)
+        if ratio > BACKLOG_HIGH and self.step < len(self.steps) - 1 and now - self._changed_at >= ADAPTIVE_DOWN_HOLD:
+            self._set_step(self.step + 1, now)
+        elif ratio < BACKLOG_LOW and self.step > 0 and now - self._changed_at >= ADAPTIVE_UP_HOLD:
+            self._set_step(self.step - 1, now)
+
+    def _set_step(self, step, now):
+        self.step = step
+        self.backlog = None
+        self._changed_at = now
+        logger.debug(f"Viewer stream now at quality {self.quality}, {self.fps or 'uncapped'} fps.")
+
+    def as_dict(self):
+        return {
+            'scale': self.scale,
+            'quality': self.quality,
+            'fps': self.fps,
+            'adaptive': self.profile.adaptive,
+            'backlog_ms': round(1000 * self.backlog, 2) if self.backlog is not None else None,
+        }
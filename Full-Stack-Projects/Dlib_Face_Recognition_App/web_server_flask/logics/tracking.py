@@ -0,0 +1,198 @@
+import os
+import cv2
+import numpy as np
+
+# Tracking configuration
+TRACKING_MODE = os.getenv('TRACKING_MODE', 'off').lower()  # off | iou | kcf
+DETECTION_INTERVAL = int(os.getenv('DETECTION_INTERVAL', 5))  # Frames between full detections
+SCENE_CHANGE_THRESHOLD = float(os.getenv('SCENE_CHANGE_THRESHOLD', 20.0))  # Mean abs pixel difference
+REIDENTIFY_INTERVAL = int(os.getenv('REIDENTIFY_INTERVAL', 5))  # Detections before a known face is re-encoded
+IOU_THRESHOLD = 0.3
+THUMBNAIL_SIZE = (32, 24)
+
+
+def box_iou(a, b):
+    """
+    Intersection over union of two `(top, right, bottom, left)` boxes.
+    """
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def create_kcf_tracker():
+    """
+    Create an OpenCV KCF tracker, or None when opencv-contrib is not available.
+    """
+    legacy = getattr(cv2, 'legacy', None)
+    for factory in (getattr(cv2, 'TrackerKCF_create', None), getattr(legacy, 'TrackerKCF_create', None)):
+        if factory is not None:
+            return factory()
+    return None
+
+
+class Track:
+    """
+    A face followed across frames, carrying its identity.
+    """
+
+    def __init__(self, box, name):
+        self.box = tuple(int(v) for v in box)
+        self.name = name
+        self.age = 0  # Detection rounds since the identity was last computed
+        self.misses = 0
+        self.tracker = None
+
+    def start_tracker(self, frame):
+        top, right, bottom, left = self.box
+        self.tracker = create_kcf_tracker()
+        if self.tracker is not None:
+            self.tracker.init(frame, (left, top, max(1, right - left), max(1, bottom - top)))
+
+    def step(self, frame):
+        """
+        Move the box with the correlation tracker. Returns False when tracking failed.
+        """
+        if self.tracker is None:
+            return True
+        ok, (x, y, w, h) = self.tracker.update(frame)
+        if ok:
+            self.box = (int(y), int(x + w), int(y + h), int(x))
+            self.misses = 0
+        else:
+            self.misses += 1
+        return ok
+
+
+class FaceTracker:
+    """
+    Run full detection and recognition only every `detect_interval` frames
+    or when the scene changes, and propagate boxes and identities in between.
+
+    On a detection frame every new box is associated with the existing
+    tracks by IoU. A box that continues a recognised track keeps its name
+    without being encoded again (until `reidentify_interval` detections have
+    passed); only new, unknown or stale faces go through `identify`.
+    Between detections the boxes are moved with OpenCV KCF trackers in
+    'kcf' mode, or held in place in 'iou' mode.
+
+    Args:
+        detect: Callable `(frame) -> [(top, right, bottom, left), ...]`.
+        identify: Callable `(frame, boxes) -> [name, ...]`.
+    """
+
+    def __init__(self, detect, identify, mode=TRACKING_MODE, detect_interval=DETECTION_INTERVAL,
+                 scene_change_threshold=SCENE_CHANGE_THRESHOLD, reidentify_interval=REIDENTIFY_INTERVAL,
+                 iou_threshold=IOU_THRESHOLD, max_misses=2, unknown_name='Unknown'):
+        self.detect = detect
+        self.identify = identify
+        self.mode = mode
+        self.detect_interval = max(1, detect_interval)
+        self.scene_change_threshold = scene_change_threshold
+        self.reidentify_interval = reidentify_interval
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.unknown_name = unknown_name
+        self.tracks = []
+        self.frames = 0
+        self.detections = 0
+        self.encoded_faces = 0
+        self._since_detection = 0
+        self._thumbnail = None
+
+    @staticmethod
+    def _make_thumbnail(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def scene_changed(self, thumbnail):
+        if self._thumbnail is None:
+            return True
+        return float(np.abs(thumbnail - self._thumbnail).mean()) > self.scene_change_threshold
+
+    def update(self, frame):
+        """
+        Process one frame and return `[(top, right, bottom, left, name), ...]`.
+        """
+        self.frames += 1
+        if self.mode == 'off':
+            self._run_detection(frame, reuse_identities=False)
+            return self.results()
+
+        thumbnail = self._make_thumbnail(frame)
+        if self._since_detection >= self.detect_interval - 1 or self.scene_changed(thumbnail):
+            self._run_detection(frame)
+            self._thumbnail = thumbnail
+            self._since_detection = 0
+        else:
+            self._propagate(frame)
+            self._since_detection += 1
+        return self.results()
+
+    def results(self):
+        return [(*track.box, track.name) for track in self.tracks]
+
+    def _associate(self, boxes):
+        """
+        Greedy IoU matching of detected boxes to existing tracks.
+        """
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b) for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True,
+        )
+        matches, used_tracks = {}, set()
+        for iou, t, b in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in used_tracks or b in matches:
+                continue
+            matches[b] = self.tracks[t]
+            used_tracks.add(t)
+        return matches
+
+    def _run_detection(self, frame, reuse_identities=True):
+        self.detections += 1
+        boxes = self.detect(frame)
+        matches = self._associate(boxes) if reuse_identities else {}
+
+        tracks, pending = [None] * len(boxes), []
+        for b, box in enumerate(boxes):
+            track = matches.get(b)
+            if track is not None and track.name != self.unknown_name and track.age + 1 < self.reidentify_interval:
+                track.box = tuple(int(v) for v in box)
+                track.age += 1
+                track.misses = 0
+                tracks[b] = track
+            else:
+                pending.append(b)
+
+        if pending:
+            names = self.identify(frame, [boxes[b] for b in pending])
+            self.encoded_faces += len(pending)
+            for b, name in zip(pending, names):
+                tracks[b] = Track(boxes[b], name)
+
+        self.tracks = tracks
+        if self.mode == 'kcf':
+            for track in self.tracks:
+                track.start_tracker(frame)
+
+    def _propagate(self, frame):
+        if self.mode != 'kcf':
+            return
+        for track in self.tracks:
+            track.step(frame)
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'frames': self.frames,
+            'detections': self.detections,
+            'encoded_faces': self.encoded_faces,
+            'detection_ratio': round(self.detections / self.frames, 3) if self.frames else 0.0,
+        }
@@ -0,0 +1,392 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import struct
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import cv2
+import gevent
+from gevent.pool import Pool
+from gevent.queue import Queue
+from logger_config import setup_logger
+from logics.face_recognition import detect_faces, identify_faces, annotate_decoded_image, track_frame
+from logics.gallery import GalleryIndex
+from logics.shared_gallery import SharedGallery
+from logics.tracking import FaceTracker
+from logics.buffers import read_frame
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Video job configuration
+VIDEO_JOB_WORKERS = int(os.getenv('VIDEO_JOB_WORKERS', 0)) or max(1, (os.cpu_count() or 2) // 2)
+VIDEO_JOB_STRIDE = int(os.getenv('VIDEO_JOB_STRIDE', 5))  # Frames between full detections, tracked in between
+VIDEO_JOB_TRACKING_MODE = os.getenv('VIDEO_JOB_TRACKING_MODE', 'iou').lower()  # off | iou | kcf
+VIDEO_JOB_SEGMENT_SECONDS = float(os.getenv('VIDEO_JOB_SEGMENT_SECONDS', 10))  # Video length analyzed per worker call
+VIDEO_JOB_RETENTION_HOURS = float(os.getenv('VIDEO_JOB_RETENTION_HOURS', 24))  # Finished jobs are deleted after this
+
+QUEUED, ANALYZING, RENDERING, DONE, FAILED = 'queued', 'analyzing', 'rendering', 'done', 'failed'
+FINISHED_STATES = (DONE, FAILED)
+JOB_FILE = 'job.json'
+TIMELINE_FILE = 'timeline.json'
+FRAMES_FILE = 'annotated.frames'  # JPEG frames, each prefixed with its uint32 length
+VIDEO_FILE = 'annotated.mp4'
+FRAME_HEADER = struct.Struct('<I')
+
+# Galleries attached by this worker process, keyed by gallery directory
+_attached_galleries = {}
+
+
+def probe_video(video_path):
+    """
+    Read the frame count, frame rate and size of a video (video worker job).
+    """
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            raise ValueError("Could not open video")
+        return {
+            'frames': max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT))),
+            'fps': capture.get(cv2.CAP_PROP_FPS) or 25.0,
+            'width': int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        capture.release()
+
+
+def plan_segments(frame_count, fps, segment_seconds=VIDEO_JOB_SEGMENT_SECONDS):
+    """
+    Split `[0, frame_count)` into `(start, end)` frame ranges of about
+    `segment_seconds` each. The last segment has no end and reads to the end
+    of the file, since container frame counts are not always exact.
+    """
+    length = max(1, int(round(fps * segment_seconds)))
+    starts = list(range(0, frame_count, length)) or [0]
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+
+def attached_gallery(gallery_dir):
+    """
+    The newest shared gallery, attached once per generation in this process.
+    """
+    generation, gallery = _attached_galleries.get(gallery_dir, (0, None))
+    published = SharedGallery(gallery_dir).attach(newer_than=generation)
+    if published is not None:
+        pointer, gallery = published
+        _attached_galleries[gallery_dir] = (pointer['generation'], gallery)
+    return gallery if gallery is not None else GalleryIndex.from_known_encodings({})
+
+
+def analyze_segment(video_path, start, end, stride, tracking_mode, gallery_dir):
+    """
+    Recognize the faces in frames `[start, end)` of a video (video worker job).
+    Full detection runs every `stride` frames and faces are tracked in between.
+
+    Returns:
+        tuple: `(frames_read, {frame_index: [(top, right, bottom, left, name), ...]})`
+        with only the frames that contain faces.
+    """
+    gallery = attached_gallery(gallery_dir)
+    tracker = FaceTracker(
+        detect_faces,
+        lambda rgb_frame, face_locations: identify_faces(rgb_frame, face_locations, gallery),
+        mode=tracking_mode, detect_interval=stride
+    )
+    capture = cv2.VideoCapture(video_path)
+    faces_by_frame = {}
+    frame = None  # Every frame is decoded into the same array
+    frame_index = start
+    try:
+        if start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        while end is None or frame_index < end:
+            ret, frame = read_frame(capture, frame)
+            if not ret:
+                break
+            faces = track_frame(frame, tracker)
+            if faces:
+                faces_by_frame[frame_index] = faces
+            frame_index += 1
+    finally:
+        capture.release()
+    return frame_index - start, faces_by_frame
+
+
+def render_job_video(job_dir, video_path, fps):
+    """
+    Draw the timeline onto the video (video worker job). Writes the JPEG
+    frames replayed to viewers and an annotated MP4 for download.
+
+    Returns:
+        int: The number of rendered frames.
+    """
+    with open(os.path.join(job_dir, TIMELINE_FILE)) as f:
+        faces_by_frame = {
+            entry['frame']: [(face['top'], face['right'], face['bottom'], face['left'], face['name']) for face in entry['faces']]
+            for entry in json.load(f)['timeline']
+        }
+
+    capture = cv2.VideoCapture(video_path)
+    writer = None
+    video_tmp = os.path.join(job_dir, VIDEO_FILE + '.tmp')
+    frame_index = 0
+    frame = None
+    try:
+        with open(os.path.join(job_dir, FRAMES_FILE), 'wb') as frames_file:
+            while True:
+                ret, frame = read_frame(capture, frame)
+                if not ret:
+                    break
+                if writer is None:
+                    writer = cv2.VideoWriter(video_tmp, cv2.VideoWriter_fourcc(*'mp4v'), fps, (frame.shape[1], frame.shape[0]))
+                    if not writer.isOpened():
+                        logger.warning("No MP4 encoder available, skipping the annotated video file.")
+                jpeg = annotate_decoded_image(frame, faces_by_frame.get(frame_index, []))
+                frames_file.write(FRAME_HEADER.pack(len(jpeg)) + jpeg)
+                frames_file.flush()  # Viewers follow the file while it is written
+                if writer.isOpened():
+                    writer.write(frame)
+                frame_index += 1
+    finally:
+        capture.release()
+        if writer is not None:
+            writer.release()
+
+    if os.path.exists(video_tmp):
+        os.replace(video_tmp, os.path.join(job_dir, VIDEO_FILE))
+    return frame_index
+
+
+def build_timeline(faces_by_frame, fps):
+    """
+    JSON-ready per-frame timeline plus a per-identity summary.
+    """
+    timeline, identities = [], {}
+    for frame_index in sorted(faces_by_frame):
+        seconds = round(frame_index / fps, 3)
+        faces = []
+        for top, right, bottom, left, name in faces_by_frame[frame_index]:
+            faces.append({'top': int(top), 'right': int(right), 'bottom': int(bottom), 'left': int(left), 'name': name})
+            identity = identities.setdefault(name, {'first_seen': seconds, 'last_seen': seconds, 'frames': 0})
+            identity['last_seen'] = seconds
+            identity['frames'] += 1
+        timeline.append({'frame': frame_index, 'time': seconds, 'faces': faces})
+    return timeline, identities
+
+
+class VideoJobStore:
+    """
+    Video analysis jobs persisted on disk, one directory per job:
+
+        job.json           status, progress and parameters
+        input<ext>         the uploaded video
+        timeline.json      per-frame identities and a per-identity summary
+        annotated.frames   annotated JPEG frames, replayed to viewers as MJPEG
+        annotated.mp4      annotated video for download
+
+    All state lives in the job directory, so any gunicorn worker can report
+    on or replay a job that another worker processed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.path, job_id)
+
+    def file(self, job_id, name):
+        return os.path.join(self.job_dir(job_id), name)
+
+    def input_path(self, job):
+        return self.file(job['id'], job['input'])
+
+    def create(self, filename, save, **params):
+        """
+        Create a queued job. `save(path)` stores the uploaded video.
+        """
+        job_id = uuid.uuid4().hex
+        extension = os.path.splitext(filename)[1].lower()
+        os.makedirs(self.job_dir(job_id))
+        job = dict(params, id=job_id, filename=os.path.basename(filename), input='input' + extension,
+                   status=QUEUED, progress=0.0, created_at=datetime.utcnow().isoformat())
+        save(self.input_path(job))
+        self._write(job)
+        return job
+
+    def get(self, job_id):
+        """
+        Return the job, or None if it does not exist.
+        """
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self.file(job_id, JOB_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self):
+        jobs = [self.get(job_id) for job_id in os.listdir(self.path)]
+        return sorted((job for job in jobs if job), key=lambda job: job['created_at'])
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id)
+        job.update(fields, updated_at=datetime.utcnow().isoformat())
+        self._write(job)
+        return job
+
+    def _write(self, job):
+        path = self.file(job['id'], JOB_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    @contextmanager
+    def claim(self, job_id):
+        """
+        Hold the job's processing lock for the duration of the block. Yields
+        False when another process is already working on the job. POSIX
+        record locks are not inherited by forked worker processes.
+        """
+        with open(self.file(job_id, '.lock'), 'w') as f:
+            try:
+                fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+    def cleanup(self, retention_hours=VIDEO_JOB_RETENTION_HOURS):
+        """
+        Delete finished jobs older than the retention period.
+        """
+        cutoff = (datetime.utcnow() - timedelta(hours=retention_hours)).isoformat()
+        for job in self.list():
+            if job['status'] in FINISHED_STATES and job.get('updated_at', job['created_at']) < cutoff:
+                shutil.rmtree(self.job_dir(job['id']), ignore_errors=True)
+                logger.info(f"Deleted expired video job {job['id']}.")
+
+    def iter_frames(self, job_id, poll_interval=0.2):
+        """
+        Yield the annotated JPEG frames of a job. While the job is still
+        running, wait for frames that have not been rendered yet.
+        """
+        offset = 0
+        while True:
+            frames_path = self.file(job_id, FRAMES_FILE)
+            data = b''
+            if os.path.exists(frames_path):
+                with open(frames_path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(FRAME_HEADER.size)
+                    if len(data) == FRAME_HEADER.size:
+                        (length,) = FRAME_HEADER.unpack(data)
+                        frame = f.read(length)
+                        if len(frame) == length:
+                            offset += FRAME_HEADER.size + length
+                            yield frame
+                            continue
+
+            job = self.get(job_id)
+            if job is None or job['status'] in FINISHED_STATES:
+                return
+            gevent.sleep(poll_interval)
+
+
+class VideoJobRunner:
+    """
+    Process queued video jobs in the background.
+
+    A job is split into segments of VIDEO_JOB_SEGMENT_SECONDS that are
+    analyzed in parallel on the video worker processes, each running full
+    detection every `stride` frames and tracking in between. The merged
+    timeline is saved, then the annotated output is rendered once, so
+    replays and additional viewers only read files.
+    """
+
+    def __init__(self, store, pool, gallery_dir, stride=VIDEO_JOB_STRIDE, tracking_mode=VIDEO_JOB_TRACKING_MODE,
+                 segment_seconds=VIDEO_JOB_SEGMENT_SECONDS):
+        self.store = store
+        self.pool = pool
+        self.gallery_dir = gallery_dir
+        self.stride = max(1, stride)
+        self.tracking_mode = tracking_mode
+        self.segment_seconds = segment_seconds
+        self._queue = Queue()
+        self._runner = None
+
+    def start(self):
+        """
+        Start the runner and pick up jobs left unfinished by a restarted worker.
+        """
+        if self._runner is None:
+            self._runner = gevent.spawn(self._loop)
+            for job in self.store.list():
+                if job['status'] not in FINISHED_STATES:
+                    with self.store.claim(job['id']) as free:
+                        if not free:
+                            continue
+                    self.submit(job['id'])
+        return self
+
+    def submit(self, job_id):
+        self._queue.put(job_id)
+
+    def _loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self.store.cleanup()
+                with self.store.claim(job_id) as claimed:
+                    job = self.store.get(job_id)
+                    if claimed and job is not None and job['status'] not in FINISHED_STATES:
+                        self._process(job)
+            except Exception as e:
+                logger.error(f"Error running video job {job_id}: {e}")
+
+    def _process(self, job):
+        job_id, video_path = job['id'], self.store.input_path(job)
+        start = time.perf_counter()
+        try:
+            info = self.pool.run(probe_video, video_path)
+            segments = plan_segments(info['frames'], info['fps'], self.segment_seconds)
+            self.store.update(job_id, status=ANALYZING, progress=0.0, frames_total=info['frames'], frames_done=0,
+                              fps=info['fps'], width=info['width'], height=info['height'],
+                              segments=len(segments), segments_done=0, stride=self.stride)
+            logger.info(f"Analyzing video job {job_id}: {info['frames']} frames in {len(segments)} segments.")
+
+            faces_by_frame, done = {}, {'frames': 0, 'segments': 0}
+
+            def analyze(segment):
+                frames_read, segment_faces = self.pool.run(
+                    analyze_segment, video_path, segment[0], segment[1], self.stride, self.tracking_mode, self.gallery_dir
+                )
+                faces_by_frame.update(segment_faces)
+                done['frames'] += frames_read
+                done['segments'] += 1
+                self.store.update(job_id, frames_done=done['frames'], segments_done=done['segments'],
+                                  progress=round(min(1.0, done['frames'] / max(1, info['frames'])), 3))
+
+            Pool(self.pool.workers).map(analyze, segments)
+
+            timeline, identities = build_timeline(faces_by_frame, info['fps'])
+            with open(self.store.file(job_id, TIMELINE_FILE), 'w') as f:
+                json.dump({'fps': info['fps'], 'frames': done['frames'], 'stride': self.stride,
+                           'identities': identities, 'timeline': timeline}, f)
+
+            self.store.update(job_id, status=RENDERING, identities=sorted(identities))
+            frames = self.pool.run(render_job_video, self.store.job_dir(job_id), video_path, info['fps'])
+            self.store.update(job_id, status=DONE, progress=1.0, frames_rendered=frames,
+                              seconds=round(time.perf_counter() - start, 2))
+            logger.info(f"Video job {job_id} finished in {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            logger.error(f"Video job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e))
@@ -0,0 +1,324 @@
+import os
+import time
+import multiprocessing
+from collections import OrderedDict, Counter, deque
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.lock import BoundedSemaphore
+from gevent.queue import Queue
+from gevent.socket import wait_read
+from gevent.threadpool import ThreadPool
+from logger_config import setup_logger
+from logics.metrics import REGISTRY, QUEUE_WAIT_SECONDS
+
+# Colorful logger Configuration
+logger = setup_logger()
+
+# Recognition executor configuration
+RECOGNITION_EXECUTOR = os.getenv('RECOGNITION_EXECUTOR', 'process').lower()  # process | thread
+RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', 0)) or os.cpu_count() or 1
+RECOGNITION_QUEUE_SIZE = int(os.getenv('RECOGNITION_QUEUE_SIZE', 16))  # Jobs allowed to wait for a worker
+RECOGNITION_MAX_BATCH = int(os.getenv('RECOGNITION_MAX_BATCH', 4))  # Jobs of different sources sent to a worker at once
+
+
+class RecognitionBusy(Exception):
+    """
+    Raised when every worker is busy and the wait queue is full.
+    """
+
+
+def run_inline(func, *args):
+    """
+    Run a recognition job in the calling greenlet (no offloading).
+    """
+    return func(*args)
+
+
+def run_batch(jobs):
+    """
+    Run several `(func, args)` jobs in one worker call. Returns `(ok, value)` per job.
+    """
+    outcomes = []
+    for func, args in jobs:
+        try:
+            outcomes.append((True, func(*args)))
+        except Exception as e:
+            outcomes.append((False, f"{type(e).__name__}: {e}"))
+    return outcomes
+
+
+def _run_after_wait(name, queued_at, func, args):
+    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, queue=name)
+    return func(*args)
+
+
+def _worker_loop(conn):
+    # Metrics inherited from the parent at fork time are not ours to report
+    REGISTRY.drain()
+    while True:
+        try:
+            func, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, f"{type(e).__name__}: {e}")
+        # Timings recorded by the job travel back with its result and are merged by the parent
+        conn.send(result + (REGISTRY.drain(),))
+
+
+class _ProcessWorker:
+    """
+    A forked worker process driven over a pipe. The parent waits for the
+    reply with `wait_read`, so only the calling greenlet blocks.
+    """
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        # Pipe() is built on a socketpair, which gevent makes non-blocking
+        os.set_blocking(self.conn.fileno(), True)
+        os.set_blocking(child_conn.fileno(), True)
+        self.process = context.Process(target=_worker_loop, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, func, args):
+        self.conn.send((func, args))
+        wait_read(self.conn.fileno())
+        ok, value, metrics = self.conn.recv()
+        REGISTRY.merge(metrics)
+        return ok, value
+
+    def close(self):
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class RecognitionPool:
+    """
+    Bounded pool that runs CPU-bound recognition jobs off the gevent loop.
+
+    In 'process' mode jobs run in forked worker processes (one dlib call
+    per core, no GIL contention); in 'thread' mode they run on a native
+    thread pool. At most `workers + queue_size` jobs are admitted at once:
+    `run(..., block=False)` raises RecognitionBusy beyond that, which HTTP
+    handlers turn into a 503, while `block=True` callers (video streams)
+    wait for a slot.
+
+    Jobs must be module-level functions with picklable arguments and
+    results in 'process' mode. Metrics the jobs record in a worker process
+    are sent back with their results, and the time jobs wait for a worker
+    is recorded under the pool's `name`.
+    """
+
+    def __init__(self, workers=RECOGNITION_WORKERS, mode=RECOGNITION_EXECUTOR, queue_size=RECOGNITION_QUEUE_SIZE,
+                 name='recognition'):
+        self.name = name
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.queue_size = max(0, queue_size)
+        self.capacity = self.workers + self.queue_size
+        self._slots = BoundedSemaphore(self.capacity)
+        self._context = None
+        self._idle = None
+        self._threads = None
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def started(self):
+        return self._idle is not None or self._threads is not None
+
+    def start(self):
+        """
+        Start the workers. Call after the models are loaded so forked
+        workers share them copy-on-write.
+        """
+        if self.started:
+            return self
+        if self.mode == 'process' and 'fork' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('fork')
+            self._idle = Queue()
+            for _ in range(self.workers):
+                self._idle.put(_ProcessWorker(self._context))
+        else:
+            self.mode = 'thread'
+            self._threads = ThreadPool(self.workers)
+        logger.info(f"Recognition pool started: {self.workers} {self.mode} workers, queue size {self.queue_size}.")
+        return self
+
+    def run(self, func, *args, block=True):
+        """
+        Run `func(*args)` on a worker and return its result.
+
+        Raises:
+            RecognitionBusy: If `block` is False and the pool is at capacity.
+        """
+        if not self._slots.acquire(blocking=block):
+            self.rejected += 1
+            raise RecognitionBusy(f"Recognition queue is full ({self.capacity} jobs)")
+
+        start = time.perf_counter()
+        try:
+            self.start()
+            result = self._call(func, args, start)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - start
+            self._slots.release()
+
+    def _call(self, func, args, queued_at):
+        if self._threads is not None:
+            return self._threads.apply(_run_after_wait, (self.name, queued_at, func, args))
+
+        worker = self._idle.get()
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, queue=self.name)
+        try:
+            ok, value = worker.call(func, args)
+        except (EOFError, OSError) as e:
+            logger.error(f"Recognition worker failed, restarting it: {e}")
+            worker = self._replace(worker)
+            raise RuntimeError("Recognition worker died") from e
+        except BaseException:
+            # Interrupted mid-job (e.g. the client went away): its reply would be stale
+            worker = self._replace(worker)
+            raise
+        finally:
+            self._idle.put(worker)
+
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def _replace(self, worker):
+        worker.process.terminate()
+        worker.close()
+        return _ProcessWorker(self._context)
+
+    def in_flight(self):
+        return self.capacity - self._slots.counter
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'in_flight': self.in_flight(),
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'busy_seconds': round(self.busy_seconds, 3),
+        }
+
+    def close(self):
+        if self._threads is not None:
+            self._threads.kill()
+            self._threads = None
+        if self._idle is not None:
+            while not self._idle.empty():
+                self._idle.get().close()
+            self._idle = None
+
+
+class FairScheduler:
+    """
+    Share one RecognitionPool fairly between several video sources.
+
+    Each source has its own short queue and dispatchers serve the sources
+    in round-robin order, so a fast camera cannot starve the others. When
+    more sources are waiting than there are workers, one job from each of
+    several sources is sent to a worker as a single batch (`run_batch`),
+    saving a round trip per frame. A source that queues more than
+    `max_pending` jobs has its oldest job dropped.
+    """
+
+    def __init__(self, pool, max_pending=2, max_batch=RECOGNITION_MAX_BATCH):
+        self.pool = pool
+        self.max_pending = max(1, max_pending)
+        self.max_batch = max(1, max_batch)
+        self._queues = OrderedDict()  # source_id -> deque of (func, args, AsyncResult, queued_at); front is served next
+        self._has_work = Event()
+        self._dispatchers = []
+        self.submitted = Counter()
+        self.dropped = Counter()
+        self.batches = 0
+
+    def run(self, source_id, func, *args):
+        """
+        Queue a job for `source_id` and wait for its result.
+
+        Raises:
+            RecognitionBusy: If the job was dropped in favour of a newer one.
+        """
+        queue = self._queues.setdefault(source_id, deque())
+        if len(queue) >= self.max_pending:
+            _, _, stale, _ = queue.popleft()
+            self.dropped[source_id] += 1
+            stale.set_exception(RecognitionBusy(f"Dropped a queued job of source {source_id}"))
+
+        result = AsyncResult()
+        queue.append((func, args, result, time.perf_counter()))
+        self.submitted[source_id] += 1
+        self._has_work.set()
+        if not self._dispatchers:
+            self._dispatchers = [gevent.spawn(self._dispatch) for _ in range(self.pool.workers)]
+        return result.get()
+
+    def _next_batch(self):
+        waiting = [source_id for source_id, queue in self._queues.items() if queue]
+        size = min(self.max_batch, max(1, -(-len(waiting) // self.pool.workers)))
+        batch = []
+        for source_id in waiting[:size]:
+            batch.append(self._queues[source_id].popleft())
+            self._queues.move_to_end(source_id)  # Served: go to the back of the line
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                self._has_work.clear()
+                self._has_work.wait()
+                continue
+
+            now = time.perf_counter()
+            for _, _, _, queued_at in batch:
+                QUEUE_WAIT_SECONDS.observe(now - queued_at, queue='scheduler')
+
+            try:
+                if len(batch) == 1:
+                    func, args, _, _ = batch[0]
+                    outcomes = [(True, self.pool.run(func, *args))]
+                else:
+                    self.batches += 1
+                    outcomes = self.pool.run(run_batch, [(func, args) for func, args, _, _ in batch])
+            except Exception as e:
+                for _, _, result, _ in batch:
+                    result.set_exception(e)
+                continue
+
+            for (_, _, result, _), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    result.set(value)
+                else:
+                    result.set_exception(RuntimeError(value))
+
+    def pending(self, source_id):
+        queue = self._queues.get(source_id)
+        return len(queue) if queue else 0
+
+    def stats(self, source_id):
+        return {
+            'pending': self.pending(source_id),
+            'submitted': self.submitted[source_id],
+            'dropped': self.dropped[source_id],
+        }
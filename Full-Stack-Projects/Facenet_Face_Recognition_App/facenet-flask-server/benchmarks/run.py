@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import argparse
+import urllib.request
+import cv2
+import numpy as np
+from face_gallery import FaceGallery
+from search_index import create_index
+from stream_output import encode_jpeg
+from buffers import convert_color
+from benchmarks.common import (Report, measure, summarize, synthetic_gallery, synthetic_queries, sample_images,
+                               sample_video, read_frames, parse_sizes, ASSETS_DIR, DEFAULT_SIZES)
+
+GROUPS = ('match', 'detect', 'embed', 'frame', 'encode', 'stream')
+DEFAULT_GROUPS = ('match', 'detect', 'embed', 'frame', 'encode')
+EMBEDDING_DIM = 512
+
+# Same recognition settings as server.py
+threshold = float(os.getenv('RECOGNITION_THRESHOLD', 0.5))
+face_confidence_threshold = float(os.getenv('FACE_CONFIDENCE_THRESHOLD', 0.9))
+min_face_size = int(os.getenv('MIN_FACE_SIZE', 20))
+
+
+def bench_match(report, args):
+    """
+    FaceGallery.match (the batched successor of get_face_name) against
+    synthetic galleries, for both match modes and both search backends.
+    """
+    for size in args.sizes:
+        matrix, labels = synthetic_gallery(size, EMBEDDING_DIM, seed=args.seed)
+        known_encodings = {label: [(row, f'{label}.jpg')] for label, row in zip(labels, matrix)}
+        queries = synthetic_queries(matrix, args.faces, seed=args.seed + 1)
+        for mode, backend in (('max', 'exact'), ('max', 'ivf'), ('centroid', 'exact')):
+            start = time.perf_counter()
+            gallery = FaceGallery(known_encodings, dim=EMBEDDING_DIM, mode=mode,
+                                  index=create_index(EMBEDDING_DIM, metric='cosine', backend=backend))
+            build_seconds = time.perf_counter() - start
+            stats = measure(lambda: gallery.match(queries, threshold), args.repeat, items=len(queries))
+            stats['build_ms'] = round(1000 * build_seconds, 2)
+            report.add('match', stats, gallery_size=size, mode=mode, backend=backend, faces=len(queries))
+
+
+class Recognizer:
+    """
+    The detection, alignment, embedding and matching steps of server.py,
+    composed the same way as its recognize_faces_in_frame. server.py
+    connects to Firebase when imported, so the benchmark builds the models
+    itself.
+    """
+
+    def __init__(self, args):
+        import torch
+        from facenet_pytorch import MTCNN, InceptionResnetV1
+        from embedding_service import BatchEmbedder
+
+        torch.manual_seed(args.seed)
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.mtcnn = MTCNN(keep_all=True, min_face_size=min_face_size, device=self.device)
+        # Random weights unless --pretrained: timings do not depend on the weights
+        self.model = InceptionResnetV1(pretrained='vggface2' if args.pretrained else None).eval().to(self.device)
+        self.embedder = BatchEmbedder(self.model, self.device).start()
+        self.torch = torch
+
+    def detect(self, rgb_frame):
+        boxes, probs = self.mtcnn.detect(rgb_frame)
+        if boxes is None:
+            return np.empty((0, 4), dtype=np.float32)
+        return boxes[probs >= face_confidence_threshold]
+
+    def detect_and_align(self, rgb_frame):
+        boxes = self.detect(rgb_frame)
+        if len(boxes) == 0:
+            return boxes, None
+        return boxes, self.mtcnn.extract(rgb_frame, boxes, None)
+
+    def recognize_faces_in_frame(self, frame, gallery):
+        rgb_frame = convert_color(frame, cv2.COLOR_BGR2RGB)
+        boxes, faces = self.detect_and_align(rgb_frame)
+        if faces is None:
+            return []
+        matches = gallery.match(self.embedder.embed(faces), threshold)
+        return list(zip(boxes, [match.name for match in matches]))
+
+
+def decode_rgb(image_data):
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def bench_detect(report, args, recognizer, images):
+    """
+    MTCNN detection alone, and detection plus alignment, per sample image.
+    """
+    for name, image_data in images:
+        rgb = decode_rgb(image_data)
+        faces = len(recognizer.detect(rgb))
+        report.add('detect', measure(lambda: recognizer.detect(rgb), args.repeat), image=name, faces=faces)
+        report.add('detect_and_align', measure(lambda: recognizer.detect_and_align(rgb), args.repeat),
+                   image=name, faces=faces)
+
+
+def bench_embed(report, args, recognizer):
+    """
+    BatchEmbedder forward passes at increasing batch sizes.
+    """
+    for batch in args.batches:
+        faces = recognizer.torch.rand(batch, 3, 160, 160) * 2 - 1
+        report.add('embed', measure(lambda: recognizer.embedder.embed(faces), args.repeat, items=batch),
+                   batch=batch, device=str(recognizer.device))
+
+
+def bench_frame(report, args, recognizer, frames, gallery):
+    """
+    recognize_faces_in_frame over consecutive frames of the sample video.
+    """
+    frame_iter = iter(())
+
+    def next_frame():
+        nonlocal frame_iter
+        frame = next(frame_iter, None)
+        if frame is None:
+            frame_iter = iter(frames)
+            frame = next(frame_iter)
+        return recognizer.recognize_faces_in_frame(frame, gallery)
+
+    height, width = frames[0].shape[:2]
+    report.add('recognize_faces_in_frame', measure(next_frame, args.repeat),
+               resolution=f'{width}x{height}', gallery_size=len(gallery))
+
+
+def bench_encode(report, args, frames):
+    """
+    JPEG encoding of one live frame at the usual stream output profiles.
+    """
+    frame = frames[0]
+    for scale, quality in ((1.0, 80), (0.5, 80), (1.0, 50), (0.5, 50)):
+        report.add('encode_jpeg', measure(lambda: encode_jpeg(frame, scale, quality), args.repeat),
+                   scale=scale, quality=quality)
+
+
+def bench_stream(report, args):
+    """
+    Frames per second a running server delivers on /video_feed.
+    """
+    url = args.url.rstrip('/') + '/video_feed' + (f'/{args.source}' if args.source else '')
+    start = time.perf_counter()
+    first_frame, received, samples, last = None, 0, [], start
+    with urllib.request.urlopen(url, timeout=30) as response:
+        for line in response:
+            if not line.startswith(b'--frame'):
+                continue
+            now = time.perf_counter()
+            first_frame = first_frame or now - start
+            samples.append(now - last)
+            last = now
+            received += 1
+            if received >= args.stream_frames:
+                break
+
+    stats = summarize(samples[1:] or samples)
+    stats['frames'] = received
+    stats['first_frame_ms'] = round(1000 * first_frame, 2) if first_frame is not None else None
+    stats['per_second'] = round(received / (last - start), 2) if last > start else None
+    report.add('video_feed', stats, url=url)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the FaceNet recognition hot paths and video feed.")
+    parser.add_argument('--only', default=','.join(DEFAULT_GROUPS), help=f"Comma-separated groups: {', '.join(GROUPS)}")
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES, help="Gallery sizes for the match group")
+    parser.add_argument('--gallery-size', type=int, default=1000, help="Gallery size for the frame group")
+    parser.add_argument('--faces', type=int, default=4, help="Faces per frame matched in the match group")
+    parser.add_argument('--batches', type=parse_sizes, default=(1, 4, 16, 32), help="Batch sizes for the embed group")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per measurement")
+    parser.add_argument('--frames', type=int, default=60, help="Video frames cycled through by the frame group")
+    parser.add_argument('--pretrained', action='store_true', help="Load the vggface2 weights (downloads them once)")
+    parser.add_argument('--url', default='http://localhost:5000', help="Running server for the stream group")
+    parser.add_argument('--source', help="Video source id for the stream group (default source if omitted)")
+    parser.add_argument('--stream-frames', type=int, default=100, help="Frames read by the stream group")
+    parser.add_argument('--assets', default=ASSETS_DIR, help="Directory with the sample images and Video.mp4")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Previous JSON report to compare against")
+    args = parser.parse_args()
+    args.only = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = set(args.only) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    report = Report('facenet', {key: value for key, value in vars(args).items()})
+
+    if 'match' in args.only:
+        bench_match(report, args)
+    if {'detect', 'embed', 'frame'} & set(args.only):
+        recognizer = Recognizer(args)
+        if 'detect' in args.only:
+            bench_detect(report, args, recognizer, sample_images(args.assets))
+        if 'embed' in args.only:
+            bench_embed(report, args, recognizer)
+        if 'frame' in args.only:
+            matrix, labels = synthetic_gallery(args.gallery_size, EMBEDDING_DIM, seed=args.seed)
+            gallery = FaceGallery({label: [(row, '')] for label, row in zip(labels, matrix)}, dim=EMBEDDING_DIM)
+            bench_frame(report, args, recognizer, read_frames(sample_video(args.assets), args.frames), gallery)
+    if 'encode' in args.only:
+        bench_encode(report, args, read_frames(sample_video(args.assets), 1))
+    if 'stream' in args.only:
+        bench_stream(report, args)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report.compare(json.load(f))
+    report.write(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+import torch
+from logger_config import setup_logger
+from metrics import STAGE_SECONDS, QUEUE_WAIT_SECONDS
+
+# Initialize logger
+logger = setup_logger()
+
+# Micro-batching configuration
+EMBED_MAX_BATCH = int(os.getenv('EMBED_MAX_BATCH', 32))  # Faces per forward pass
+EMBED_MAX_WAIT_MS = float(os.getenv('EMBED_MAX_WAIT_MS', 5))  # How long the first request waits for company
+
+
+class BatchEmbedder:
+    """
+    Micro-batching front end for the FaceNet model.
+
+    Any thread (request handlers, video streams, enrollment workers) can
+    submit a tensor of aligned faces. A single inference thread collects
+    everything submitted within `max_wait_ms` of the first request, up to
+    `max_batch` faces, runs one forward pass under `torch.inference_mode()`
+    and hands each caller its own rows back.
+    """
+
+    def __init__(self, model, device, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.device = device
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.faces = 0
+        self.largest_batch = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='batch-embedder', daemon=True)
+                self._thread.start()
+                logger.info(f"Batch embedder started (max batch {self.max_batch}, max wait {self.max_wait * 1000:g} ms).")
+        return self
+
+    def submit(self, faces):
+        """
+        Queue an `(n, 3, 160, 160)` tensor of aligned faces. Returns a Future
+        resolving to an `(n, 512)` float32 array.
+        """
+        future = Future()
+        if faces is None or len(faces) == 0:
+            future.set_result(np.empty((0, 512), dtype=np.float32))
+            return future
+        self.start()
+        self._requests.put((faces, future, time.perf_counter()))
+        return future
+
+    def embed(self, faces, timeout=None):
+        return self.submit(faces).result(timeout)
+
+    def _loop(self):
+        while True:
+            pending = [self._requests.get()]
+            count = len(pending[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+            self._run(pending)
+
+    def _run(self, pending):
+        start = time.perf_counter()
+        for _, _, queued_at in pending:
+            QUEUE_WAIT_SECONDS.observe(start - queued_at, queue='embedder')
+        try:
+            batch = torch.cat([faces for faces, _, _ in pending]).to(self.device)
+            with torch.inference_mode():
+                embeddings = self.model(batch).cpu().numpy().astype(np.float32, copy=False)
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(pending)} requests: {e}")
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for faces, future, _ in pending:
+            future.set_result(embeddings[offset:offset + len(faces)])
+            offset += len(faces)
+
+        self.batches += 1
+        self.faces += offset
+        self.largest_batch = max(self.largest_batch, offset)
+        self.busy_seconds += time.perf_counter() - start
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='embed')
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'faces': self.faces,
+            'average_batch': round(self.faces / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'queued': self._requests.qsize(),
+            'faces_per_second': round(self.faces / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+        }
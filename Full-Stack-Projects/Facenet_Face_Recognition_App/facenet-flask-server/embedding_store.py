@@ -0,0 +1,510 @@
+import os
+import re
+import json
+import uuid
+import fcntl
+import pickle
+import threading
+from contextlib import contextmanager
+import numpy as np
+from logger_config import setup_logger
+
+try:
+    from google.api_core.exceptions import NotFound as BlobNotFound
+except ImportError:  # google-cloud-storage comes with firebase-admin; fake buckets raise FileNotFoundError
+    BlobNotFound = FileNotFoundError
+
+# Initialize logger
+logger = setup_logger()
+
+STORE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = '.lock'
+MIGRATED_FINGERPRINT = 'migrated'  # Entries imported from a legacy pickle, adopted on first sight
+KEEP_GENERATIONS = 2  # Matrices kept on disk so readers of the previous manifest can still open theirs
+MATRIX_NAME = re.compile(r'embeddings-(\d+)\.npy$')
+HEAD_NAME = 'head.json'
+REMOTE_NAME = re.compile(r'(?:snapshot|delta)-\d+-[0-9a-f]+\.(?:npy|npz|json)$')
+REMOTE_MAX_DELTAS = int(os.getenv('EMBEDDING_STORE_MAX_DELTAS', 16))  # Deltas on top of a snapshot before a new one
+
+
+def matrix_generation(filename):
+    """
+    Generation of an `embeddings-<gen>.npy` file name, or None for other files.
+    """
+    match = MATRIX_NAME.search(filename)
+    return int(match.group(1)) if match else None
+
+
+class EmbeddingStore:
+    """
+    Versioned, memory-mapped store of face embeddings.
+
+    Layout on disk:
+        manifest.json          version, dimension, dtype, generation, the
+                               label table (person per row) and one entry
+                               per source blob (person, filename, fingerprint, row)
+        embeddings-<gen>.npy   float32 or float16 matrix with one row per
+                               embedded blob, loaded memory-mapped (zero copy)
+
+    Writers build the next generation on the side and publish it by
+    atomically replacing the manifest, keeping the previous matrix around so
+    concurrent readers (other gunicorn workers) never see a half-written or
+    vanished file. Concurrent writers (threads or processes) must hold
+    `lock()` from load() to save(), so each builds on the latest generation.
+    Only new or changed blobs have to be embedded again; blobs whose image
+    had no face are kept with row -1.
+
+    Every generation also gets a random token, and save() remembers what it
+    changed (`last_delta`) so a RemoteEmbeddingStore can publish only that.
+    """
+
+    def __init__(self, path, dim=512, dtype='float32'):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.generation = 0
+        self.token = None
+        self.last_delta = None
+        self._entries = {}
+        self._matrix = np.empty((0, dim), dtype=self.dtype)
+        self._pending = {}
+
+    def _matrix_path(self, generation):
+        return os.path.join(self.path, f'embeddings-{generation}.npy')
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive writer lock on the store directory (an flock, so it also
+        serializes threads that open it separately).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_NAME), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _tmp_path(self, path):
+        return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def load(self, retries=1):
+        """
+        Load the manifest and memory-map the current embedding matrix.
+        A missing, corrupt or incompatible store is treated as empty.
+        """
+        if not os.path.exists(self.manifest_path):
+            return self
+
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != STORE_VERSION or manifest.get('dim') != self.dim:
+                logger.warning(f"Ignoring embedding store at {self.path} with incompatible version/dimension.")
+                return self
+
+            generation = manifest['generation']
+            matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+            if matrix.shape[1:] != (self.dim,):
+                raise ValueError(f"Unexpected matrix shape {matrix.shape}")
+
+            self.generation = generation
+            self.token = manifest.get('token')
+            self._entries = manifest['entries']
+            self._matrix = matrix
+            logger.info(f"Loaded embedding store generation {generation} with {len(self._entries)} entries.")
+        except FileNotFoundError:
+            # A writer published two generations while we were reading the manifest
+            if retries > 0:
+                return self.load(retries - 1)
+            logger.error(f"Embedding store at {self.path} changed while loading.")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading embedding store at {self.path}: {e}")
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def matrix(self):
+        """
+        The memory-mapped embedding matrix of the loaded generation (read-only).
+        """
+        return self._matrix
+
+    def get(self, blob_name, fingerprint):
+        """
+        Return the stored embedding for `blob_name`, or None if the image has no face.
+        Entries migrated from a legacy pickle are adopted under `fingerprint`.
+
+        Raises:
+            KeyError: If the blob is not stored or its fingerprint changed.
+        """
+        if blob_name in self._pending:
+            entry, embedding = self._pending[blob_name]
+            if entry['fingerprint'] == fingerprint:
+                return embedding
+            raise KeyError(blob_name)
+
+        entry = self._entries.get(blob_name)
+        if entry is None or entry['fingerprint'] not in (fingerprint, MIGRATED_FINGERPRINT):
+            raise KeyError(blob_name)
+        embedding = None if entry['row'] < 0 else self._matrix[entry['row']]
+        if entry['fingerprint'] == MIGRATED_FINGERPRINT:
+            self.put(blob_name, fingerprint, entry['person'], entry['filename'], embedding)
+        return embedding
+
+    def put(self, blob_name, fingerprint, person_name, filename, embedding):
+        """
+        Stage a freshly computed embedding (None for "no face found").
+        """
+        entry = {'person': person_name, 'filename': filename, 'fingerprint': fingerprint}
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+        self._pending[blob_name] = (entry, embedding)
+
+    def known_embeddings(self):
+        """
+        `{person: [(embedding, filename), ...]}` view of the stored rows (no copies).
+        """
+        known = {}
+        for blob_name in sorted(self._entries):
+            entry = self._entries[blob_name]
+            if entry['row'] >= 0:
+                known.setdefault(entry['person'], []).append((self._matrix[entry['row']], entry['filename']))
+        return known
+
+    def migrate_pickle(self, pickle_path, prefix):
+        """
+        Import a legacy `{person: [(embedding, filename), ...]}` pickle. Entries
+        are keyed as `<prefix><person>/<filename>` and adopted the first time
+        the matching blob is seen.
+
+        Returns:
+            bool: True if anything was imported.
+        """
+        if len(self) or not os.path.exists(pickle_path):
+            return False
+        try:
+            with open(pickle_path, 'rb') as f:
+                legacy = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Error reading legacy embeddings {pickle_path}: {e}")
+            return False
+
+        imported = 0
+        for person_name, images in legacy.items():
+            for embedding, filename in images:
+                embedding = np.asarray(embedding, dtype=np.float32).ravel()
+                if embedding.shape != (self.dim,):
+                    continue
+                self.put(f'{prefix}{person_name}/{filename}', MIGRATED_FINGERPRINT, person_name, filename, embedding)
+                imported += 1
+
+        if imported:
+            self.save(keep=self._pending)
+            logger.info(f"Migrated {imported} embeddings from {pickle_path}.")
+        return imported > 0
+
+    def save(self, keep, token=None):
+        """
+        Write a new generation containing only the blobs named in `keep`.
+        Entries for blobs that no longer exist are dropped.
+
+        Returns:
+            bool: True if a new generation was published.
+        """
+        keep = set(keep)
+        entries, rows, labels = {}, [], []
+        changed = {}  # Staged entries in keep, with their row in the new matrix
+
+        for blob_name in sorted(keep):
+            if blob_name in self._pending:
+                entry, embedding = self._pending[blob_name]
+                entry = dict(entry)
+                changed[blob_name] = entry
+            elif blob_name in self._entries:
+                entry = dict(self._entries[blob_name])
+                embedding = None if entry['row'] < 0 else self._matrix[entry['row']]
+            else:
+                continue
+
+            entry['row'] = -1 if embedding is None else len(rows)
+            if embedding is not None:
+                rows.append(embedding)
+                labels.append(entry['person'])
+            entries[blob_name] = entry
+
+        removed = sorted(set(self._entries) - keep)
+        dropped = len(removed)
+        if not self._pending and not dropped:
+            return False
+
+        os.makedirs(self.path, exist_ok=True)
+        generation = self.generation + 1
+        token = token or uuid.uuid4().hex
+        matrix = np.vstack(rows).astype(self.dtype) if rows else np.empty((0, self.dim), dtype=self.dtype)
+
+        matrix_tmp = self._tmp_path(self._matrix_path(generation))
+        with open(matrix_tmp, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(matrix_tmp, self._matrix_path(generation))
+
+        manifest = {
+            'version': STORE_VERSION, 'dim': self.dim, 'dtype': self.dtype.name,
+            'generation': generation, 'token': token, 'labels': labels, 'entries': entries,
+        }
+        self._write_manifest(json.dumps(manifest).encode())
+
+        self.last_delta = {
+            'parent_token': self.token, 'generation': generation, 'token': token, 'removed': removed,
+            'entries': {blob_name: entries[blob_name] for blob_name in changed},
+        }
+        self.generation = generation
+        self.token = token
+        self._entries = entries
+        self._matrix = np.load(self._matrix_path(generation), mmap_mode='r')
+        self._pending = {}
+        self._prune()
+
+        logger.info(f"Saved embedding store generation {generation}: {len(entries)} entries, {dropped} dropped.")
+        return True
+
+    def _write_manifest(self, manifest_bytes):
+        manifest_tmp = self._tmp_path(self.manifest_path)
+        with open(manifest_tmp, 'wb') as f:
+            f.write(manifest_bytes)
+        os.replace(manifest_tmp, self.manifest_path)
+
+    def _prune(self):
+        for filename in os.listdir(self.path):
+            generation = matrix_generation(filename)
+            if generation is not None and generation <= self.generation - KEEP_GENERATIONS:
+                os.remove(os.path.join(self.path, filename))
+
+    def files(self):
+        """
+        Paths of the files making up the current generation (manifest last).
+        """
+        return [self._matrix_path(self.generation), self.manifest_path]
+
+    def write_delta(self, path):
+        """
+        Write what the last save() changed as an .npz file: the rows of the
+        new or changed blobs and the names of the removed ones.
+
+        Returns:
+            int: Number of rows written.
+        """
+        if self.last_delta is None or self.last_delta['generation'] != self.generation:
+            raise ValueError("The current generation was not saved by this store.")
+        entries, rows = {}, []
+        for blob_name, entry in self.last_delta['entries'].items():
+            entry = dict(entry)
+            if entry['row'] >= 0:
+                rows.append(entry['row'])
+                entry['row'] = len(rows) - 1
+            entries[blob_name] = entry
+        meta = dict(self.last_delta, entries=entries)
+
+        rows = np.asarray(self._matrix[rows]).reshape(len(rows), self.dim)
+        with open(path, 'wb') as f:
+            np.savez(f, rows=rows, meta=np.array(json.dumps(meta)))
+        return len(rows)
+
+    def apply_delta(self, path):
+        """
+        Publish the generation described by a write_delta() file on top of
+        the current one, under the delta's own generation and token.
+
+        Raises:
+            ValueError: If the delta was not written on top of the current generation.
+        """
+        with np.load(path, allow_pickle=False) as delta:
+            meta = json.loads(str(delta['meta']))
+            rows = delta['rows']
+        if meta['parent_token'] != self.token or meta['generation'] != self.generation + 1:
+            raise ValueError(f"Delta {meta['generation']} does not apply on top of generation {self.generation}.")
+
+        self._pending = {}
+        for blob_name, entry in meta['entries'].items():
+            embedding = None if entry['row'] < 0 else rows[entry['row']]
+            self.put(blob_name, entry['fingerprint'], entry['person'], entry['filename'], embedding)
+        keep = (set(self._entries) - set(meta['removed'])) | set(meta['entries'])
+        self.save(keep, token=meta['token'])
+        return self
+
+    def install(self, manifest_bytes, write_matrix):
+        """
+        Replace the store with a generation built elsewhere. `write_matrix(path)`
+        writes its matrix file; the manifest is published once it is in place.
+        """
+        generation = json.loads(manifest_bytes)['generation']
+        os.makedirs(self.path, exist_ok=True)
+        matrix_tmp = self._tmp_path(self._matrix_path(generation))
+        try:
+            write_matrix(matrix_tmp)
+            os.replace(matrix_tmp, self._matrix_path(generation))
+        finally:
+            if os.path.exists(matrix_tmp):
+                os.remove(matrix_tmp)
+        self._write_manifest(manifest_bytes)
+
+        self._pending = {}
+        self.last_delta = None
+        self.load()
+        self._prune()
+        return self
+
+
+class RemoteEmbeddingStore:
+    """
+    Copy of an EmbeddingStore in a storage bucket, synced with deltas.
+
+    Layout under `prefix`:
+        head.json                         generation and token last published,
+                                          the snapshot it builds on and the
+                                          deltas applied on top of it, in order
+        snapshot-<gen>-<token>.npy/.json  full matrix and manifest of a generation
+        delta-<gen>-<token>.npz           rows added or changed by a generation
+                                          and the blobs it removed
+
+    push() uploads only the delta of the last save when the bucket holds its
+    parent generation. It uploads a full snapshot when the bucket is empty or
+    has moved on (another server pushed first, last writer wins), when the
+    chain already has `max_deltas` deltas, or when the delta holds at least
+    half the rows. A snapshot push deletes the files no longer reachable from
+    the new or the previous head, so a concurrent pull can still finish.
+    pull() applies the deltas the local store is missing, downloading the
+    snapshot first if the local generation is not on the chain.
+
+    Args:
+        bucket: Storage bucket (a firebase_admin storage bucket or anything
+            with the same blob/list_blobs interface).
+        prefix: Blob name prefix of the store, ending in '/'.
+        max_deltas: Deltas allowed on top of a snapshot.
+    """
+
+    def __init__(self, bucket, prefix, max_deltas=REMOTE_MAX_DELTAS):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_deltas = max_deltas
+
+    def _blob(self, name):
+        return self.bucket.blob(f'{self.prefix}{name}')
+
+    def _read_head(self, store):
+        try:
+            head = json.loads(self._blob(HEAD_NAME).download_as_bytes())
+        except BlobNotFound:
+            return None
+        except ValueError as e:
+            logger.error(f"Ignoring unreadable remote embedding store head: {e}")
+            return None
+        if head.get('version') != STORE_VERSION or head.get('dim') != store.dim:
+            logger.warning("Ignoring remote embedding store with incompatible version/dimension.")
+            return None
+        return head
+
+    def _chain_files(self, head):
+        if head is None:
+            return set()
+        snapshot = head['snapshot']
+        names = {f"snapshot-{snapshot['generation']}-{snapshot['token']}{ext}" for ext in ('.npy', '.json')}
+        names.update(f"delta-{delta['generation']}-{delta['token']}.npz" for delta in head['deltas'])
+        return names
+
+    def pull(self, store, retries=1):
+        """
+        Bring a loaded `store` up to the generation last published.
+
+        Returns:
+            bool: True if the local store changed.
+        """
+        try:
+            head = self._read_head(store)
+            if head is None or head['token'] == store.token:
+                return False
+
+            tokens = [head['snapshot']['token']] + [delta['token'] for delta in head['deltas']]
+            if store.token in tokens:
+                missing = head['deltas'][tokens.index(store.token):]
+            else:
+                snapshot = head['snapshot']
+                name = f"snapshot-{snapshot['generation']}-{snapshot['token']}"
+                manifest_bytes = self._blob(f'{name}.json').download_as_bytes()
+                store.install(manifest_bytes, self._blob(f'{name}.npy').download_to_filename)
+                missing = head['deltas']
+
+            for delta in missing:
+                delta_path = store._tmp_path(os.path.join(store.path, 'delta.npz'))
+                try:
+                    self._blob(f"delta-{delta['generation']}-{delta['token']}.npz").download_to_filename(delta_path)
+                    store.apply_delta(delta_path)
+                finally:
+                    if os.path.exists(delta_path):
+                        os.remove(delta_path)
+            logger.info(f"Pulled embedding store generation {store.generation} ({len(missing)} deltas applied).")
+            return True
+        except BlobNotFound:
+            # A snapshot push pruned the chain we were reading; start over from the new head
+            if retries > 0:
+                return self.pull(store, retries - 1)
+            logger.error("Remote embedding store changed while pulling.")
+            return False
+
+    def push(self, store):
+        """
+        Publish the generation last saved by `store`.
+
+        Returns:
+            str: 'delta', 'snapshot', or None if the bucket already has it.
+        """
+        head = self._read_head(store)
+        if head is not None and head['token'] == store.token:
+            return None
+
+        delta = store.last_delta
+        if (head is not None and delta is not None and delta['generation'] == store.generation
+                and delta['parent_token'] == head['token'] and len(head['deltas']) < self.max_deltas):
+            delta_path = store._tmp_path(os.path.join(store.path, 'delta.npz'))
+            try:
+                rows = store.write_delta(delta_path)
+                if 2 * rows < len(store.matrix):
+                    self._blob(f'delta-{store.generation}-{store.token}.npz').upload_from_filename(delta_path)
+                    deltas = head['deltas'] + [{'generation': store.generation, 'token': store.token}]
+                    self._write_head(dict(head, generation=store.generation, token=store.token, deltas=deltas))
+                    logger.info(f"Pushed embedding store generation {store.generation} as a delta of {rows} rows.")
+                    return 'delta'
+            finally:
+                if os.path.exists(delta_path):
+                    os.remove(delta_path)
+
+        matrix_path, manifest_path = store.files()
+        name = f'snapshot-{store.generation}-{store.token}'
+        self._blob(f'{name}.npy').upload_from_filename(matrix_path)
+        self._blob(f'{name}.json').upload_from_filename(manifest_path)
+        new_head = {
+            'version': STORE_VERSION, 'dim': store.dim, 'dtype': store.dtype.name,
+            'generation': store.generation, 'token': store.token,
+            'snapshot': {'generation': store.generation, 'token': store.token}, 'deltas': [],
+        }
+        self._write_head(new_head)
+        logger.info(f"Pushed embedding store generation {store.generation} as a snapshot of {len(store.matrix)} rows.")
+
+        keep = self._chain_files(new_head) | self._chain_files(head)
+        for blob in self.bucket.list_blobs(prefix=self.prefix):
+            name = blob.name[len(self.prefix):]
+            if (REMOTE_NAME.match(name) or matrix_generation(name) is not None or name == MANIFEST_NAME) \
+                    and name not in keep:
+                blob.delete()
+        return 'snapshot'
+
+    def _write_head(self, head):
+        self._blob(HEAD_NAME).upload_from_string(json.dumps(head), content_type='application/json')
@@ -0,0 +1,347 @@
+import time
+import threading
+from logger_config import setup_logger
+from stream_output import StreamRate, encode_jpeg, DEFAULT_PROFILE
+from buffers import FRAME_BUFFERS, read_frame
+
+# Initialize logger
+logger = setup_logger()
+
+
+class LatestSlot:
+    """
+    Single-item, latest-wins mailbox between two pipeline threads.
+
+    `put` never blocks: an item that was not consumed yet is replaced and
+    counted as dropped, so a slow consumer always gets the freshest item.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._full = False
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if self._full:
+                self.dropped += 1
+            self._item = item
+            self._full = True
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next item. Returns None on timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._full, timeout):
+                return None
+            item, self._item, self._full = self._item, None, False
+            return item
+
+    @property
+    def depth(self):
+        return 1 if self._full else 0
+
+
+class StageTimer:
+    """
+    Count and latency of one pipeline stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(1000 * self.total / self.count, 2) if self.count else 0.0,
+            'last_ms': round(1000 * self.last, 2),
+            'max_ms': round(1000 * self.max, 2),
+        }
+
+
+class FrameRing:
+    """
+    Fixed-size ring of the most recently annotated frames.
+
+    The producer publishes each frame once; readers keep their own cursor
+    and never block the producer. A reader that falls behind jumps to the
+    newest frame and the frames it missed are counted as skipped.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._frames = [None] * size
+        self.sequence = 0
+        self.skipped = 0
+        self._condition = threading.Condition()
+
+    def publish(self, frame):
+        with self._condition:
+            self.sequence += 1
+            self._frames[self.sequence % self.size] = frame
+            self._condition.notify_all()
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def read_after(self, cursor, timeout=None):
+        """
+        Wait for a frame newer than `cursor`. Returns `(sequence, frame)`,
+        or `(cursor, None)` on timeout or wake-up without a new frame.
+        """
+        with self._condition:
+            if self.sequence == cursor:
+                self._condition.wait(timeout)
+                if self.sequence == cursor:
+                    return cursor, None
+            sequence = self.sequence
+            if cursor:
+                self.skipped += max(0, sequence - cursor - 1)
+            return sequence, self._frames[sequence % self.size]
+
+
+class LivePipeline:
+    """
+    Capture -> recognize and annotate pipeline for a live feed, encoded per viewer.
+
+    Capture and recognition each run on their own thread and hand frames
+    over through a LatestSlot, so capture never waits for recognition and
+    recognition always works on the freshest frame. Each frame is
+    recognized and annotated once and published to a FrameRing shared by
+    every reader of `frames()`; readers encode it at their own scale and
+    quality. Frames are captured into buffers of `buffers` (a BufferPool),
+    which are reused once the ring and every reader let go of them.
+
+    Args:
+        open_capture: Callable returning an opened cv2.VideoCapture.
+        recognize: Callable `(frame) -> recognized_faces`.
+        annotate: Callable `(frame, recognized_faces) -> annotated frame`.
+        max_fps: Upper bound on the capture rate.
+    """
+
+    def __init__(self, open_capture, recognize, annotate, max_fps=30, buffers=FRAME_BUFFERS):
+        self.open_capture = open_capture
+        self.recognize = recognize
+        self.annotate = annotate
+        self.max_fps = max_fps
+        self.frame_time = 1.0 / max_fps if max_fps else 0.0
+        self.buffers = buffers
+        self._frame_shape = None
+        self._capture_lock = threading.Lock()
+
+        self.frames_slot = LatestSlot()
+        self.timers = {name: StageTimer() for name in ('capture', 'inference', 'annotate', 'end_to_end')}
+
+        self.running = False
+        self.started_at = None
+        self.stopped_at = None
+        self.capture = None
+        self._threads = []
+        self.ring = FrameRing()
+
+    def start(self):
+        if self.running:
+            return self
+        self.capture = self.open_capture()
+        if self.capture is None or not self.capture.isOpened():
+            raise IOError("Failed to open video capture device.")
+
+        self.running = True
+        self.started_at = time.perf_counter()
+        self._threads = [threading.Thread(target=loop, daemon=True) for loop in (self._capture_loop, self._recognize_loop)]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Live pipeline started.")
+        return self
+
+    def stop(self):
+        if self.capture is None:
+            return
+        self.running = False
+        self.stopped_at = self.stopped_at or time.perf_counter()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self._threads = []
+        self._release_capture()
+        self.ring.wake()
+        logger.info(f"Live pipeline stopped: {self.stats()}")
+
+    def _read_frame(self):
+        with self._capture_lock:
+            if self.capture is None:
+                return False, None
+            buffer = self.buffers.acquire(self._frame_shape) if self._frame_shape is not None else None
+            ret, frame = read_frame(self.capture, buffer)
+        if ret:
+            self._frame_shape = frame.shape
+        return ret, frame
+
+    def _release_capture(self):
+        with self._capture_lock:
+            if self.capture is not None:
+                self.capture.release()
+                self.capture = None
+
+    def _capture_loop(self):
+        while self.running:
+            start = time.perf_counter()
+            try:
+                ret, frame = self._read_frame()
+            except Exception as e:
+                logger.error(f"Error reading frame: {e}")
+                ret, frame = False, None
+            if not ret:
+                logger.warning("Frame not retrieved, stopping video stream.")
+                self.running = False
+                self.stopped_at = time.perf_counter()
+                self.ring.wake()
+                break
+            self.timers['capture'].record(time.perf_counter() - start)
+            self.frames_slot.put((frame, start))
+
+            elapsed = time.perf_counter() - start
+            time.sleep(max(0, self.frame_time - elapsed))
+
+    def _recognize_loop(self):
+        while self.running:
+            item = self.frames_slot.get(timeout=1.0)
+            if item is None:
+                continue
+            frame, captured_at = item
+            start = time.perf_counter()
+            try:
+                recognized_faces = self.recognize(frame)
+            except Exception as e:
+                logger.error(f"Error recognizing frame: {e}")
+                recognized_faces = []
+            annotate_start = time.perf_counter()
+            self.timers['inference'].record(annotate_start - start)
+            try:
+                annotated = self.annotate(frame, recognized_faces)
+            except Exception as e:
+                logger.error(f"Error annotating frame: {e}")
+                continue
+            now = time.perf_counter()
+            self.timers['annotate'].record(now - annotate_start)
+            self.timers['end_to_end'].record(now - captured_at)
+
+            self.ring.publish(annotated)
+
+    def frames(self, rate=None, timeout=5.0):
+        """
+        Yield the freshest frame as JPEG each time a new one is ready, encoded
+        and paced according to `rate` (a StreamRate).
+
+        A reader that falls behind skips straight to the newest frame. The
+        time the consumer takes to come back for the next frame (i.e. to
+        write the previous one to the client) is reported to `rate`.
+        """
+        rate = rate or StreamRate(DEFAULT_PROFILE, self.max_fps)
+        cursor = 0
+        while self.running:
+            time.sleep(rate.delay())
+            cursor, frame = self.ring.read_after(cursor, timeout)
+            if frame is None:
+                continue
+            try:
+                jpeg = encode_jpeg(frame, rate.scale, rate.quality)
+            except Exception as e:
+                logger.error(f"Error encoding frame: {e}")
+                continue
+            started = time.monotonic()
+            yield jpeg
+            rate.record_send(started, time.monotonic())
+
+    def fps(self):
+        """
+        Average rate of annotated frames since the pipeline started.
+        """
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.stopped_at or time.perf_counter()) - self.started_at
+        return self.ring.sequence / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'fps': round(self.fps(), 2),
+            'queue_depth': self.frames_slot.depth,
+            'frames_annotated': self.ring.sequence,
+            'frames_skipped_by_viewers': self.ring.skipped,
+            'dropped_before_inference': self.frames_slot.dropped,
+            'stages': {name: timer.as_dict() for name, timer in self.timers.items()},
+        }
+
+
+class CameraBroadcaster:
+    """
+    Share one LivePipeline between every viewer of a camera.
+
+    The first viewer starts the pipeline and the last one to leave stops
+    it, so the camera is opened, recognized and annotated once no matter
+    how many clients are watching. Each viewer reads the shared FrameRing
+    at its own pace and output profile, so a slow client skips frames
+    instead of stalling the producer.
+
+    Args:
+        create_pipeline: Callable returning a new (not started) LivePipeline.
+    """
+
+    def __init__(self, create_pipeline):
+        self.create_pipeline = create_pipeline
+        self.pipeline = None
+        self.viewers = []  # StreamRate of every connected viewer
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.pipeline is not None and self.pipeline.running
+
+    def stop(self):
+        with self._lock:
+            if self.pipeline is not None:
+                self.pipeline.stop()
+
+    def subscribe(self, profile=DEFAULT_PROFILE):
+        """
+        Yield encoded frames to one viewer until the feed stops or the viewer disconnects.
+
+        Raises:
+            IOError: If the pipeline has to be started and the capture cannot be opened.
+        """
+        with self._lock:
+            if not self.running:
+                if self.pipeline is not None:
+                    self.pipeline.stop()  # Release a capture that ended on its own
+                self.pipeline = self.create_pipeline().start()
+            pipeline = self.pipeline
+            rate = StreamRate(profile, pipeline.max_fps)
+            self.viewers.append(rate)
+        try:
+            yield from pipeline.frames(rate)
+        finally:
+            with self._lock:
+                self.viewers.remove(rate)
+                if not self.viewers and self.pipeline is pipeline:
+                    pipeline.stop()
+
+    def stats(self):
+        pipeline = self.pipeline
+        stats = pipeline.stats() if pipeline is not None else {'running': False}
+        stats['viewers'] = len(self.viewers)
+        stats['viewer_streams'] = [rate.as_dict() for rate in self.viewers]
+        return stats
@@ -2,6 +2,11 @@ import logging
 
 def setup_logger():
     logger = logging.getLogger("face_recognition_logger")
+
+    # Check if the logger is already set up
+    if logger.handlers:
+        return logger
+
     logger.setLevel(logging.INFO)
     
     # Create console handler
@@ -0,0 +1,248 @@
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond matching up to multi-second downloads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def drain(self):
+        """
+        Return the values recorded since the last drain and reset them.
+        """
+        return None
+
+    def merge(self, values):
+        """
+        Add values drained from another process.
+        """
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, one value per label combination.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in sorted(self._values.items())]
+
+    def drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        for key, value in values.items():
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    """
+    Value read when metrics are collected. `function` returns either a
+    number, or a dict mapping label value tuples to numbers.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None, kind='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self.type = kind  # Totals kept elsewhere (e.g. pool stats) are exposed as 'counter'
+
+    def _samples(self):
+        try:
+            values = self.function()
+        except Exception as e:
+            return [f'# {self.name} unavailable: {type(e).__name__}']
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in sorted(values.items())]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'key', 'start')
+
+    def __init__(self, histogram, key):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.key, time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (latencies in seconds) over fixed buckets.
+
+    Observing is a bisect and three additions. Updates are not locked:
+    under thread contention an observation can be lost, which is fine for
+    monitoring and keeps the hot paths cheap.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [per-bucket counts (last one is +Inf), sum, count]
+
+    def _state(self, key):
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return state
+
+    def _observe(self, key, value):
+        state = self._state(key)
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def observe(self, value, **labels):
+        self._observe(self._key(labels), value)
+
+    def time(self, **labels):
+        """
+        Context manager observing the duration of its block.
+        """
+        return _Timer(self, self._key(labels))
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self):
+        samples = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                samples.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            samples.append(f'{self.name}_count{labels} {count}')
+        return samples
+
+    def drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        for key, (counts, total, count) in values.items():
+            state = self._state(key)
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+
+class Registry:
+    """
+    The metrics of one process, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function, labelnames=(), kind='gauge'):
+        return self.register(Gauge(name, documentation, labelnames, function, kind))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def drain(self):
+        """
+        Take everything recorded since the last drain, e.g. in a worker
+        process, so it can be merged into the parent's registry.
+        """
+        drained = {}
+        for name, metric in self._metrics.items():
+            values = metric.drain()
+            if values:
+                drained[name] = values
+        return drained
+
+    def merge(self, drained):
+        for name, values in drained.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = Registry()
+
+# Hot path metrics shared by the video streams, the batch embedder and enrollment
+STAGE_SECONDS = REGISTRY.histogram(
+    'face_recognition_stage_seconds', 'Time spent in one recognition stage.', ['stage'])
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'face_recognition_queue_wait_seconds', 'Time a job waited before a worker picked it up.', ['queue'])
+FACES_MATCHED = REGISTRY.counter(
+    'face_recognition_faces_total', 'Faces matched against the gallery, by outcome.', ['result'])
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import threading
+from _thread import start_new_thread, get_ident as get_native_ident
+from collections import Counter
+from logger_config import setup_logger
+
+# Initialize logger
+logger = setup_logger()
+
+# Profiling configuration: nothing is sampled unless enabled
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'  # Serve /admin/profile
+PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', 60))  # Longest profile one request may take
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', 10))  # Default time between two samples
+
+MAX_STACK_DEPTH = 128
+
+# Modules are imported on the main thread
+MAIN_THREAD_ID = get_native_ident()
+
+
+class ProfilerBusy(Exception):
+    """
+    Raised when a profile is requested while another one is running.
+    """
+
+
+def frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse_stack(frame, max_depth=MAX_STACK_DEPTH):
+    """
+    `outermost;...;innermost` labels of a frame and its callers.
+    """
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the Python stacks of every thread.
+
+    A separate thread wakes up every `interval` seconds and records the
+    current stack of each other thread (request handlers, video streams,
+    the batch embedder) under the thread's name.
+
+    Results use the collapsed format (`frame;frame;frame count` per line)
+    read by flamegraph.pl, speedscope and similar tools. Nothing runs
+    between profiles.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self._done = True
+        self._thread_names = {}
+        self._lock = threading.Lock()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running or not self._done:
+                raise ProfilerBusy("A profile is already running")
+            self.running = True
+            self._done = False
+        self.interval = interval or self.interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self._thread_names[MAIN_THREAD_ID] = 'MainThread'
+        start_new_thread(self._sample_loop, ())
+        logger.info(f"Profiler started (every {self.interval * 1000:g} ms).")
+
+    def stop(self):
+        self.running = False
+
+    def _sample_loop(self):
+        own_ident = get_native_ident()
+        try:
+            while self.running:
+                for ident, frame in sys._current_frames().items():
+                    if ident != own_ident:
+                        root = self._thread_names.get(ident, f'thread-{ident}')
+                        self.stacks[f'{root};{collapse_stack(frame)}'] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+        except Exception as e:
+            logger.error(f"Profiler sampling failed: {e}")
+        finally:
+            self._done = True
+
+    def run(self, seconds, interval=None):
+        """
+        Profile for `seconds` and return the collapsed stacks. The caller
+        sleeps meanwhile.
+
+        Raises:
+            ProfilerBusy: If another profile is running.
+        """
+        self.start(interval)
+        try:
+            time.sleep(seconds)
+        finally:
+            self.stop()
+            while not self._done:
+                time.sleep(self.interval)
+        logger.info(f"Profiler stopped after {self.samples} samples.")
+        return self.collapsed()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
@@ -0,0 +1,340 @@
+import os
+import numpy as np
+
+# Search backend configuration (exact brute force or IVF approximate search)
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'exact').lower()
+SEARCH_NLIST = int(os.getenv('SEARCH_NLIST', 0))  # 0 picks sqrt(gallery size)
+SEARCH_NPROBE = int(os.getenv('SEARCH_NPROBE', 8))
+SEARCH_MIN_TRAIN_SIZE = int(os.getenv('SEARCH_MIN_TRAIN_SIZE', 2048))
+
+
+class ExactIndex:
+    """
+    Brute-force nearest neighbour search over a growable float32 matrix.
+
+    Vectors are addressed by integer ids and can be added or removed at any
+    time. Removed rows are tombstoned and their slots reused by later adds.
+    Metric is either 'l2' (Euclidean distance) or 'cosine' (1 - cosine similarity).
+    """
+
+    kind = 'exact'
+
+    def __init__(self, dim, metric='l2'):
+        if metric not in ('l2', 'cosine'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._slot_of = {}
+        self._free = []
+        self._high_water = 0
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, vector_id):
+        return int(vector_id) in self._slot_of
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == 'cosine':
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        vectors[:capacity] = self._vectors
+        self._vectors = vectors
+        self._sq_norms = np.concatenate([self._sq_norms, np.zeros(new_capacity - capacity, dtype=np.float32)])
+        self._ids = np.concatenate([self._ids, np.full(new_capacity - capacity, -1, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(new_capacity - capacity, dtype=bool)])
+
+    def add(self, ids, vectors):
+        """
+        Add (or replace) vectors under the given ids.
+        """
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+
+        self.remove([vector_id for vector_id in ids if int(vector_id) in self._slot_of])
+
+        slots = []
+        for _ in range(len(ids)):
+            if self._free:
+                slots.append(self._free.pop())
+            else:
+                slots.append(self._high_water)
+                self._high_water += 1
+        self._grow(self._high_water)
+
+        slots = np.asarray(slots, dtype=np.int64)
+        self._vectors[slots] = vectors
+        self._sq_norms[slots] = np.einsum('ij,ij->i', vectors, vectors)
+        self._ids[slots] = ids
+        self._alive[slots] = True
+        for vector_id, slot in zip(ids.tolist(), slots.tolist()):
+            self._slot_of[vector_id] = slot
+        self._on_add(slots)
+
+    def remove(self, ids):
+        """
+        Remove vectors by id. Unknown ids are ignored.
+        """
+        slots = [self._slot_of.pop(int(vector_id)) for vector_id in ids if int(vector_id) in self._slot_of]
+        if not slots:
+            return
+        slots = np.asarray(slots, dtype=np.int64)
+        self._alive[slots] = False
+        self._ids[slots] = -1
+        self._free.extend(slots.tolist())
+        self._on_remove(slots)
+
+    def vectors(self):
+        """
+        Return `(ids, vectors)` for every live entry.
+        """
+        slots = np.flatnonzero(self._alive[:self._high_water])
+        return self._ids[slots], self._vectors[slots]
+
+    def _on_add(self, slots):
+        pass
+
+    def _on_remove(self, slots):
+        pass
+
+    def _finish(self, sq_dist):
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        if self.metric == 'cosine':
+            # For unit vectors |a - b|^2 = 2 - 2cos, so the distance is 1 - cos
+            return sq_dist * 0.5
+        return np.sqrt(sq_dist, out=sq_dist)
+
+    def _sq_distances(self, queries, slots=None):
+        if slots is None:
+            vectors = self._vectors[:self._high_water]
+            sq_norms = self._sq_norms[:self._high_water]
+        else:
+            vectors = self._vectors[slots]
+            sq_norms = self._sq_norms[slots]
+        q_sq_norms = np.einsum('ij,ij->i', queries, queries)
+        return q_sq_norms[:, None] + sq_norms[None, :] - 2.0 * (queries @ vectors.T)
+
+    @staticmethod
+    def _top_k(dist, k):
+        """
+        Column positions of the k smallest entries per row, sorted ascending.
+        """
+        k = min(k, dist.shape[1])
+        if k == 0:
+            return np.empty((dist.shape[0], 0), dtype=np.int64)
+        if k < dist.shape[1]:
+            part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+        order = np.take_along_axis(dist, part, axis=1).argsort(axis=1)
+        return np.take_along_axis(part, order, axis=1)
+
+    def _empty_result(self, n_queries, k):
+        return (np.full((n_queries, k), np.inf, dtype=np.float32),
+                np.full((n_queries, k), -1, dtype=np.int64))
+
+    def search(self, queries, k=1):
+        """
+        Find the k nearest vectors for every query.
+
+        Returns:
+            tuple: `(distances, ids)`, both shaped (queries, k). Missing
+            neighbours are reported with distance inf and id -1.
+        """
+        queries = self._prepare(queries)
+        distances, ids = self._empty_result(len(queries), k)
+        if len(queries) == 0 or len(self) == 0:
+            return distances, ids
+
+        sq_dist = self._sq_distances(queries)
+        sq_dist[:, ~self._alive[:self._high_water]] = np.inf
+        top = self._top_k(sq_dist, k)
+        found = np.take_along_axis(sq_dist, top, axis=1)
+        cols = top.shape[1]
+        distances[:, :cols] = self._finish(found)
+        ids[:, :cols] = np.where(np.isfinite(found), self._ids[top], -1)
+        distances[ids < 0] = np.inf
+        return distances, ids
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file approximate index.
+
+    A k-means coarse quantizer splits the gallery into `nlist` cells and a
+    query only scans the `nprobe` closest cells. Until enough vectors have
+    been added to train the quantizer, searches fall back to an exact scan.
+    The quantizer is retrained whenever the gallery doubles in size.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim, metric='l2', nlist=0, nprobe=8, min_train_size=2048, seed=0):
+        super().__init__(dim, metric)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.centroids = None
+        self._trained_size = 0
+        self._assign = np.empty(0, dtype=np.int64)
+        self._cells = []
+        self._cell_cache = []
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        super()._grow(needed)
+        if len(self._ids) > capacity:
+            self._assign = np.concatenate([self._assign, np.full(len(self._ids) - capacity, -1, dtype=np.int64)])
+
+    def train(self, iterations=10):
+        """
+        Fit the coarse quantizer on the current vectors and rebuild every cell.
+        """
+        _, vectors = self.vectors()
+        if len(vectors) == 0:
+            return
+        nlist = self.nlist or int(np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors)))
+
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = self._nearest_centroids(sample, centroids, 1)[:, 0]
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            if self.metric == 'cosine':
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids
+        self._trained_size = len(vectors)
+        self._cells = [set() for _ in range(nlist)]
+        self._cell_cache = [None] * nlist
+        self._assign[:] = -1
+        self._on_add(np.flatnonzero(self._alive[:self._high_water]))
+
+    @staticmethod
+    def _nearest_centroids(vectors, centroids, n):
+        c_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+        scores = c_sq_norms[None, :] - 2.0 * (vectors @ centroids.T)
+        return ExactIndex._top_k(scores, n)
+
+    def _on_add(self, slots):
+        if not self.is_trained:
+            if len(self) >= self.min_train_size:
+                self.train()
+            return
+        if len(self) >= 2 * self._trained_size:
+            self.train()
+            return
+
+        assign = self._nearest_centroids(self._vectors[slots], self.centroids, 1)[:, 0]
+        self._assign[slots] = assign
+        for slot, cell in zip(slots.tolist(), assign.tolist()):
+            self._cells[cell].add(slot)
+            self._cell_cache[cell] = None
+
+    def _on_remove(self, slots):
+        if not self.is_trained:
+            return
+        for slot in slots.tolist():
+            cell = self._assign[slot]
+            if cell >= 0:
+                self._cells[cell].discard(slot)
+                self._cell_cache[cell] = None
+                self._assign[slot] = -1
+
+    def _cell_slots(self, cell):
+        cached = self._cell_cache[cell]
+        if cached is None:
+            cached = np.fromiter(self._cells[cell], dtype=np.int64, count=len(self._cells[cell]))
+            self._cell_cache[cell] = cached
+        return cached
+
+    def search(self, queries, k=1):
+        if not self.is_trained:
+            return super().search(queries, k)
+
+        queries = self._prepare(queries)
+        distances, ids = self._empty_result(len(queries), k)
+        if len(queries) == 0 or len(self) == 0:
+            return distances, ids
+
+        probes = self._nearest_centroids(queries, self.centroids, min(self.nprobe, len(self.centroids)))
+        for row, cells in enumerate(probes):
+            slots = np.concatenate([self._cell_slots(cell) for cell in cells])
+            if len(slots) == 0:
+                continue
+            query = queries[row:row + 1]
+            sq_dist = self._sq_distances(query, slots)
+            top = self._top_k(sq_dist, k)
+            cols = top.shape[1]
+            distances[row, :cols] = self._finish(np.take_along_axis(sq_dist, top, axis=1))[0]
+            ids[row, :cols] = self._ids[slots[top[0]]]
+        return distances, ids
+
+
+def create_index(dim, metric='l2', backend=None):
+    """
+    Build an empty search index for the configured backend.
+    """
+    backend = (backend or SEARCH_BACKEND).lower()
+    if backend == 'exact':
+        return ExactIndex(dim, metric)
+    if backend == 'ivf':
+        return IVFIndex(dim, metric, nlist=SEARCH_NLIST, nprobe=SEARCH_NPROBE,
+                        min_train_size=SEARCH_MIN_TRAIN_SIZE)
+    raise ValueError(f"Unknown search backend: {backend}")
+
+
+def recall_at_k(index, queries, k=1):
+    """
+    Fraction of the exact top-k neighbours that `index` also returns.
+    """
+    ids, vectors = index.vectors()
+    reference = ExactIndex(index.dim, index.metric)
+    reference.add(ids, vectors)
+
+    _, expected = reference.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(e[e >= 0]) & set(f[f >= 0])) for e, f in zip(expected, found))
+    total = int((expected >= 0).sum())
+    return hits / total if total else 1.0
+
+
+def estimate_recall(index, sample_size=256, k=1, noise=0.05, seed=0):
+    """
+    Estimate recall@k against the exact mode using perturbed gallery entries as queries.
+    """
+    _, vectors = index.vectors()
+    if len(vectors) == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    scale = noise * np.linalg.norm(sample, axis=1, keepdims=True) / np.sqrt(index.dim)
+    queries = sample + rng.normal(size=sample.shape).astype(np.float32) * scale
+    return recall_at_k(index, queries, k)
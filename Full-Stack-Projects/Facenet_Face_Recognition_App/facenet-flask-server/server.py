@@ -1,6 +1,8 @@
 import os
 import time
-import pickle
+import json
+import hmac
+from functools import partial
 from io import BytesIO
 from dotenv import load_dotenv
 import firebase_admin
@@ -10,11 +12,21 @@ import numpy as np
 import torch
 from PIL import Image
 from facenet_pytorch import MTCNN, InceptionResnetV1
-from sklearn.metrics.pairwise import cosine_similarity
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, jsonify, request
 from logger_config import setup_logger
-import gc
-from concurrent.futures import ThreadPoolExecutor
+from search_index import create_index, estimate_recall
+from enrollment import EnrollmentPipeline
+from storage import FirebaseStorage, group_by_person, KNOWN_PEOPLE_PREFIX
+from embedding_store import EmbeddingStore, RemoteEmbeddingStore
+from tracking import FaceTracker, TRACKING_MODE
+from sources import SourceRegistry, VIDEO_SOURCES, parse_video_sources, open_video_source
+from live_pipeline import LivePipeline
+from stream_output import parse_output_profile
+from buffers import FRAME_BUFFERS, resize_frame, convert_color
+from embedding_service import BatchEmbedder
+from face_gallery import FaceGallery
+from metrics import REGISTRY, STAGE_SECONDS, FACES_MATCHED, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from profiler import SamplingProfiler, ProfilerBusy, PROFILER_ENABLED, PROFILER_MAX_SECONDS, PROFILER_INTERVAL_MS
 
 # Initialize logger
 logger = setup_logger()
@@ -22,6 +34,18 @@ logger = setup_logger()
 # Load environment variables
 load_dotenv()
 threshold = float(os.getenv('RECOGNITION_THRESHOLD', 0.5))
+face_confidence_threshold = float(os.getenv('FACE_CONFIDENCE_THRESHOLD', 0.9))  # Minimum MTCNN face probability
+min_face_size = int(os.getenv('MIN_FACE_SIZE', 20))  # Smallest face (pixels) MTCNN looks for
+EMBEDDING_DIM = 512
+enrollment_download_workers = int(os.getenv('ENROLLMENT_DOWNLOAD_WORKERS', 8))
+enrollment_encode_workers = int(os.getenv('ENROLLMENT_ENCODE_WORKERS', 2))
+embedding_store_dir = os.getenv('EMBEDDING_STORE_DIR', 'embedding_store')
+embedding_store_dtype = os.getenv('EMBEDDING_STORE_DTYPE', 'float32')  # float32 | float16
+embedding_store_remote_prefix = 'embeddings/store/'
+legacy_embeddings_path = 'known_embeddings.pkl'
+admin_token = os.getenv('ADMIN_TOKEN')  # Required in the X-Admin-Token header of /admin routes (refused without it)
+
+gallery_status = {'embeddings': 0}  # Size of the most recently built gallery
 
 # Determine if running locally or in Render
 firebase_secret_path = (
@@ -44,6 +68,7 @@ try:
         'storageBucket': 'face-recognition-storage.appspot.com'
     })
     bucket = storage.bucket()
+    remote_store = RemoteEmbeddingStore(bucket, embedding_store_remote_prefix)
     logger.info("Firebase Admin SDK initialized successfully.")
 except Exception as e:
     logger.error(f"Failed to initialize Firebase Admin SDK: {e}")
@@ -51,145 +76,200 @@ except Exception as e:
 
 # Initialize FaceNet models
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-mtcnn = MTCNN(keep_all=True, device=device)
+mtcnn = MTCNN(keep_all=True, min_face_size=min_face_size, device=device)
 model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
 
-# Create a thread pool
-executor = ThreadPoolExecutor(max_workers=4)
+# Batch faces from all streams and requests into shared forward passes
+embedder = BatchEmbedder(model, device).start()
 
-def load_embeddings():
-    local_cache_path = 'known_embeddings.pkl'
-    known_encodings = {}
-
-    if os.path.exists(local_cache_path):
-        with open(local_cache_path, 'rb') as f:
-            known_encodings = pickle.load(f)
-        logger.info("Loaded embeddings from local cache.")
-    else:
-        try:
-            blob = bucket.blob('embeddings/known_embeddings.pkl')
-            if blob.exists():
-                logger.info("Local cache not found. Downloading embeddings from Firebase.")
-                img_bytes = blob.download_as_bytes()
-                known_encodings = pickle.loads(img_bytes)
-                save_embeddings(known_encodings)
-                logger.info("Downloaded embeddings from Firebase and saved to local cache.")
-            else:
-                logger.error("No embeddings found in Firebase.")
-        except Exception as e:
-            logger.error(f"Error downloading embeddings from Firebase: {e}")
-
-    return known_encodings
-
-def save_embeddings(known_encodings):
-    local_cache_path = 'known_embeddings.pkl'
-    
-    with open(local_cache_path, 'wb') as f:
-        pickle.dump(known_encodings, f)
+# On-demand stack sampling (/admin/profile); idle until a profile is requested
+profiler = SamplingProfiler()
+if PROFILER_ENABLED and not admin_token:
+    logger.warning("ADMIN_TOKEN is not set: /admin/profile is refused until it is.")
 
+def pull_remote_store(store):
+    """
+    Catch the local store up with the generation last published to Firebase.
+    """
+    try:
+        remote_store.pull(store)
+    except Exception as e:
+        logger.error(f"Error downloading embedding store from Firebase: {e}")
+    return store
+
+def push_remote_store(store):
+    """
+    Publish the generation just saved to Firebase, as a delta when the
+    bucket holds its parent generation.
+    """
     try:
-        blob = bucket.blob('embeddings/known_embeddings.pkl')
-        blob.upload_from_filename(local_cache_path)
-        logger.info("Saved embeddings to Firebase.")
+        remote_store.push(store)
     except Exception as e:
-        logger.error(f"Error uploading embeddings to Firebase: {e}")
+        logger.error(f"Error uploading embedding store to Firebase: {e}")
+
+def embed_image_bytes(img_bytes):
+    with STAGE_SECONDS.time(stage='decode'):
+        img = Image.open(BytesIO(img_bytes)).convert("RGB")
+    img_cropped = mtcnn(img)
+    if img_cropped is None or len(img_cropped) == 0:
+        return None
+    return embedder.embed(img_cropped[:1])[0]  # Largest face: MTCNN (select_largest) orders faces by size
 
 def load_known_people_images_from_firebase():
-    known_encodings = load_embeddings()
-    if known_encodings:
-        logger.info("Using cached known encodings.")
-        return known_encodings
+    """
+    Load the embeddings of every image under known_people/.
+
+    Embeddings live in a versioned, memory-mapped EmbeddingStore keyed by
+    blob name and fingerprint, so only new or changed images are downloaded
+    and embedded and deleted images are dropped. A legacy
+    known_embeddings.pkl is migrated into the store on first start.
+    """
+    store = EmbeddingStore(embedding_store_dir, dim=EMBEDDING_DIM, dtype=embedding_store_dtype)
+    # Every viewer loads on its own thread; writers take turns and each starts from the latest generation
+    with store.lock():
+        return sync_embedding_store(store.load())
+
+def sync_embedding_store(store):
+    """
+    Bring a loaded store up to date with known_people/ and return its embeddings.
+    """
+    if not store.migrate_pickle(legacy_embeddings_path, KNOWN_PEOPLE_PREFIX):
+        pull_remote_store(store)
+    storage_backend = FirebaseStorage(bucket)
 
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
-    
     try:
-        blobs = bucket.list_blobs(prefix='known_people/')
-        for blob in blobs:
-            if blob.name.endswith('/') and blob.name != 'known_people/':
-                person_name = blob.name.split('/')[-2]
-                logger.info(f"Loading images for: {person_name}")
-                person_images = []
-
-                person_blobs = bucket.list_blobs(prefix=f'{blob.name}')
-                for person_blob in person_blobs:
-                    file_extension = os.path.splitext(person_blob.name)[1].lower()
-                    if file_extension in allowed_extensions:
-                        try:
-                            logger.info(f"  Recognized {person_name} from {person_blob.name}")
-                            img_bytes = person_blob.download_as_bytes()
-                            img = Image.open(BytesIO(img_bytes)).convert("RGB")
-
-                            img_cropped = mtcnn(img)
-                            if img_cropped is not None and len(img_cropped) > 0:
-                                with torch.no_grad():
-                                    embedding = model(img_cropped.to(device)).detach().cpu().numpy()
-                                person_images.append((embedding, person_blob.name.split("/")[-1]))
-                            else:
-                                logger.warning(f"No face found in image: {person_blob.name}")
-                        except Exception as e:
-                            logger.error(f"Error processing image {person_blob.name}: {e}")
-
-                known_encodings[person_name] = person_images
-                logger.info(f"Loaded {len(person_images)} images for {person_name}.")
-                
-                del person_images
-                gc.collect()
-
-        logger.info("Finished loading known people images.")
-        save_embeddings(known_encodings)
+        # One paginated listing of known_people/, compared against the store
+        people = group_by_person(storage_backend.list_images())
+        jobs = []
+        for person_name, images in people.items():
+            for image in images:
+                try:
+                    store.get(image.name, image.fingerprint)
+                except KeyError:
+                    jobs.append(image)
+
+        # Overlap downloads with embedding; the model stays in this process so encoders are threads
+        pipeline = EnrollmentPipeline(embed_image_bytes, fetch=storage_backend.download,
+                                      download_workers=enrollment_download_workers,
+                                      encode_workers=enrollment_encode_workers, use_processes=False)
+        for job, embedding, error in pipeline.run(jobs):
+            if error is not None:
+                logger.error(f"Error processing image {job.name}: {error}")
+                continue
+            if embedding is None:
+                logger.warning(f"No face found in image: {job.name}")
+            else:
+                logger.info(f"  Recognized {job.person} from {job.name}")
+            store.put(job.name, job.fingerprint, job.person, job.filename, embedding)
+
+        seen_images = {image.name for images in people.values() for image in images}
+        if store.save(keep=seen_images):
+            push_remote_store(store)
+
+        known_encodings = store.known_embeddings()
+        for person_name, person_images in known_encodings.items():
+            logger.info(f"Loaded {len(person_images)} images for {person_name}.")
+
+        logger.info(f"Finished loading known people images ({len(seen_images) - len(jobs)} of {len(seen_images)} served from the store).")
         return known_encodings
 
     except Exception as e:
         logger.error(f"Error loading known people images: {e}")
-        return {}
+        return store.known_embeddings()
+
+def build_face_gallery(known_encodings):
+    """
+    Pack the known embeddings into a normalized FaceGallery. With
+    SEARCH_BACKEND=ivf an approximate index serves max-of-samples matching.
+    """
+    index = create_index(EMBEDDING_DIM, metric='cosine')
+    gallery = FaceGallery(known_encodings, dim=EMBEDDING_DIM, index=index)
+    if gallery.skipped:
+        logger.warning(f"Skipped {gallery.skipped} embeddings without shape ({EMBEDDING_DIM},)")
+    if gallery.index is not None:
+        logger.info(f"{gallery.index.kind} search recall@1 vs exact: {estimate_recall(gallery.index):.3f}")
+
+    logger.info(f"Built {gallery.mode} face gallery with {len(gallery)} embeddings of {len(gallery.names)} people.")
+    gallery_status['embeddings'] = len(gallery)
+    return gallery
+
+def detect_faces(rgb_frame):
+    """
+    Run MTCNN detection once and keep the faces above the confidence threshold.
+    Returns `(boxes, probs)` with boxes as `[x1, y1, x2, y2]` rows.
+    """
+    with STAGE_SECONDS.time(stage='detect'):
+        boxes, probs = mtcnn.detect(rgb_frame)
+    if boxes is None:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32)
+    keep = probs >= face_confidence_threshold
+    return boxes[keep], probs[keep]
+
+def detect_and_align(rgb_frame):
+    """
+    Single-pass detection and alignment: returns `(boxes, probs, faces)` where
+    `faces` holds the aligned 160x160 tensors MTCNN extracts for those boxes
+    (None when no face was found).
+    """
+    boxes, probs = detect_faces(rgb_frame)
+    if len(boxes) == 0:
+        return boxes, probs, None
+    with STAGE_SECONDS.time(stage='align'):
+        faces = mtcnn.extract(rgb_frame, boxes, None)
+    return boxes, probs, faces
+
+def name_faces(faces, gallery):
+    """
+    Embed aligned faces in one batched call and match them against the gallery together.
+    """
+    if faces is None or len(faces) == 0:
+        return []
+    embeddings = embedder.embed(faces)
+    with STAGE_SECONDS.time(stage='match'):
+        matches = gallery.match(embeddings, threshold)
+    for match in matches:
+        FACES_MATCHED.inc(result='unknown' if match.name == 'Unknown' else 'known')
+    return [match.name for match in matches]
+
+def recognize_faces_in_frame(frame, gallery):
+    rgb_frame = convert_color(frame, cv2.COLOR_BGR2RGB)
+    boxes, _, faces = detect_and_align(rgb_frame)
 
-def get_face_name(face_embedding, known_embeddings, threshold):
-    for name, encodings in known_embeddings.items():
-        for known_embedding, _ in encodings:
-            if face_embedding.shape != known_embedding.shape:
-                logger.warning(f"Embedding shape mismatch: {face_embedding.shape} vs {known_embedding.shape}")
-                continue
-            
-            similarity = cosine_similarity(face_embedding.reshape(1, -1), known_embedding.reshape(1, -1))[0][0]
-            if similarity >= threshold:
-                return name
-    return "Unknown"
+    results = []
+    if faces is not None:
+        try:
+            results = list(zip(boxes, name_faces(faces, gallery)))
+        except Exception as e:
+            logger.error(f"Error recognizing faces: {e}")
 
-def process_face(face, known_encodings):
-    try:
-        mtcnn_face = mtcnn(face)
-        if mtcnn_face is None or len(mtcnn_face) == 0:
-            # logger.warning("No face detected in the cropped region.")
-            return None
+    return results
 
-        face_embedding = model(mtcnn_face.to(device)).detach().cpu().numpy()
-        name = get_face_name(face_embedding, known_encodings, threshold)
+def detect_face_boxes(rgb_frame):
+    boxes, _ = detect_faces(rgb_frame)
+    # FaceTracker boxes are (top, right, bottom, left)
+    return [(int(y1), int(x2), int(y2), int(x1)) for x1, y1, x2, y2 in boxes]
 
-        return name
+def identify_face_boxes(rgb_frame, face_boxes, gallery):
+    boxes = np.array([[left, top, right, bottom] for (top, right, bottom, left) in face_boxes], dtype=np.float32)
+    try:
+        with STAGE_SECONDS.time(stage='align'):
+            faces = mtcnn.extract(rgb_frame, boxes, None)
+        return name_faces(faces, gallery)
     except Exception as e:
-        logger.error(f"Error processing face: {e}")
-        return None
-
-def recognize_faces_in_frame(frame, known_encodings):
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    boxes, _ = mtcnn.detect(rgb_frame)
-
-    results = []
-    if boxes is not None and len(boxes) > 0:
-        faces = [rgb_frame[int(box[1]):int(box[3]), int(box[0]):int(box[2])] for box in boxes]
-        
-        # Use ThreadPoolExecutor to process faces in parallel
-        names = list(executor.map(lambda face: process_face(face, known_encodings), faces))
-        
-        results = [(box, name) for box, name in zip(boxes, names) if name is not None]
+        logger.error(f"Error identifying faces: {e}")
+        return ["Unknown"] * len(face_boxes)
 
-    del rgb_frame, boxes
-    gc.collect()
-
-    return results
+def track_faces_in_frame(frame, tracker):
+    rgb_frame = convert_color(frame, cv2.COLOR_BGR2RGB)
+    return [
+        (np.array([left, top, right, bottom], dtype=np.float32), name)
+        for (top, right, bottom, left, name) in tracker.update(rgb_frame)
+    ]
 
 def annotate_frame(frame, recognized_faces):
-    overlay = frame.copy()
+    start = time.perf_counter()
+    overlay = FRAME_BUFFERS.like(frame)
+    np.copyto(overlay, frame)
     
     for (box, name) in recognized_faces:
         color = (0, 0, 255) if name == "Unknown" else (0, 255, 0)
@@ -218,45 +298,136 @@ def annotate_frame(frame, recognized_faces):
 
     cv2.addWeighted(frame, 0.6, overlay, 0.4, 0, frame)
 
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage='annotate')
     return frame
 
-def generate_frames():
-    known_encodings = load_known_people_images_from_firebase()
-    video_capture = cv2.VideoCapture(0)
-    
-    frame_rate = 30
-    prev = 0
+def create_source_pipeline(source_id, uri):
+    """
+    Build the shared pipeline of one video source. The gallery and tracker
+    are built once per pipeline run, not once per viewer.
+    """
+    gallery = build_face_gallery(load_known_people_images_from_firebase())
 
-    while True:
-        time_elapsed = time.time() - prev
-        success, frame = video_capture.read()
+    # Detect every DETECTION_INTERVAL frames and track in between (TRACKING_MODE=iou|kcf)
+    tracker = None
+    if TRACKING_MODE != 'off':
+        tracker = FaceTracker(detect_face_boxes,
+                              lambda rgb_frame, face_boxes: identify_face_boxes(rgb_frame, face_boxes, gallery))
 
-        if not success:
-            logger.error("Failed to capture video frame.")
-            break
+    def recognize(frame):
+        # Resize frame for faster processing
+        small_frame = resize_frame(frame, 0.25, cv2.INTER_LINEAR)
 
-        if time_elapsed > 1./frame_rate:
-            prev = time.time()
+        if tracker is not None:
+            recognized_faces = track_faces_in_frame(small_frame, tracker)
+        else:
+            recognized_faces = recognize_faces_in_frame(small_frame, gallery)
+        return [(box * 4, name) for box, name in recognized_faces]
 
-            # Resize frame for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
+    logger.info(f"Starting video source {source_id!r}.")
+    return LivePipeline(partial(open_video_source, uri), recognize, annotate_frame, max_fps=30)
 
-            recognized_faces = recognize_faces_in_frame(small_frame, known_encodings)
-            recognized_faces = [(box * 4, name) for box, name in recognized_faces]
+# One shared capture and recognition pipeline per source, started by its first viewer
+video_sources = SourceRegistry(parse_video_sources(VIDEO_SOURCES), create_source_pipeline)
 
-            frame = annotate_frame(frame, recognized_faces)
-
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+def generate_frames(source_id, profile):
+    try:
+        for frame in video_sources.get(source_id).subscribe(profile):
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    except Exception as e:
+        logger.error(f"Error streaming video: {e}")
+
+@app.route('/video_feed', defaults={'source_id': None})
+@app.route('/video_feed/<source_id>')
+def video_feed(source_id):
+    source_id = source_id or video_sources.default
+    if source_id not in video_sources:
+        return 'Unknown video source', 404
+    try:
+        profile = parse_output_profile(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(generate_frames(source_id, profile), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video_sources')
+def list_video_sources():
+    """
+    Per-source state, FPS, queue depth, latency and drop counters.
+    """
+    return jsonify({'default': video_sources.default, 'sources': video_sources.stats()})
+
+def source_metric(read):
+    """
+    Gauge function reading one value of every video source from its stats.
+    """
+    def collect():
+        values = {}
+        for source_id, stats in video_sources.stats().items():
+            for labels, value in read(stats).items():
+                values[(source_id,) + labels] = value
+        return values
+    return collect
+
+# Values read when /metrics is scraped; the hot paths record their histograms directly
+REGISTRY.gauge('face_recognition_gallery_encodings', 'Embeddings in the most recently built gallery.',
+               lambda: gallery_status['embeddings'])
+REGISTRY.gauge('face_recognition_active_streams', 'Video sources currently streaming.',
+               lambda: sum(broadcaster.running for broadcaster in video_sources.broadcasters.values()))
+REGISTRY.gauge('face_recognition_stream_viewers', 'Open video feed streams per source.',
+               source_metric(lambda stats: {(): stats['viewers']}), ['source'])
+REGISTRY.gauge('face_recognition_stream_fps', 'Annotated frames per second per video source.',
+               source_metric(lambda stats: {(): stats.get('fps', 0.0)}), ['source'])
+REGISTRY.gauge('face_recognition_stream_queue_depth', 'Captured frames waiting for recognition per video source.',
+               source_metric(lambda stats: {(): stats.get('queue_depth', 0)}), ['source'])
+REGISTRY.gauge('face_recognition_dropped_frames_total', 'Frames dropped per video source and stage.',
+               source_metric(lambda stats: {
+                   ('inference',): stats.get('dropped_before_inference', 0),
+                   ('viewer',): stats.get('frames_skipped_by_viewers', 0),
+               }), ['source', 'stage'], kind='counter')
+REGISTRY.gauge('face_recognition_pool_in_flight', 'Requests queued for the batch embedder.',
+               lambda: {('embedder',): embedder.stats()['queued']}, ['pool'])
+REGISTRY.gauge('face_recognition_pool_busy_seconds_total', 'Time the batch embedder spent in forward passes.',
+               lambda: {('embedder',): embedder.busy_seconds}, ['pool'], kind='counter')
+REGISTRY.gauge('face_recognition_embedder_batches_total', 'Forward passes run by the batch embedder.',
+               lambda: embedder.batches, kind='counter')
+REGISTRY.gauge('face_recognition_embedder_faces_total', 'Faces embedded by the batch embedder.',
+               lambda: embedder.faces, kind='counter')
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/embedding_stats')
+def embedding_stats():
+    return jsonify(embedder.stats())
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    # Sample every thread for `seconds` and return collapsed stacks for flamegraph tools
+    if not PROFILER_ENABLED:
+        return jsonify({'error': 'Profiler disabled'}), 404
+    if not admin_token:
+        return jsonify({'error': 'Admin routes are disabled; set ADMIN_TOKEN'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), admin_token.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
 
-    video_capture.release()
-    cv2.destroyAllWindows()
+    try:
+        seconds = float(request.values.get('seconds', 10))
+        interval_ms = float(request.values.get('interval_ms', PROFILER_INTERVAL_MS))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not 0 < seconds <= PROFILER_MAX_SECONDS or interval_ms < 1:
+        return jsonify({'error': f'seconds must be between 0 and {PROFILER_MAX_SECONDS:g}, interval_ms at least 1'}), 400
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    try:
+        collapsed = profiler.run(seconds, interval_ms / 1000.0)
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(collapsed, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{os.getpid()}.collapsed',
+        'X-Profile-Samples': str(profiler.samples),
+    })
 
 @app.route('/')
 def index():
@@ -0,0 +1,131 @@
+import os
+import re
+from collections import OrderedDict
+from functools import partial
+import cv2
+from live_pipeline import CameraBroadcaster
+from buffers import read_frame
+
+# Video sources: comma-separated `id=uri` pairs. A uri is a camera index,
+# an RTSP/HTTP stream URL or a video file path (files loop, to stand in for a camera).
+VIDEO_SOURCES = os.getenv('VIDEO_SOURCES', 'webcam=0')
+CAPTURE_WIDTH = 640
+CAPTURE_HEIGHT = 480
+SOURCE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def parse_video_sources(spec):
+    """
+    Parse `id=uri,id=uri,...` into an ordered `{source_id: uri}` mapping.
+    The first source is the default one.
+    """
+    sources = OrderedDict()
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        source_id, sep, uri = item.partition('=')
+        if not sep:
+            source_id, uri = f'source{len(sources)}', item
+        source_id, uri = source_id.strip(), uri.strip()
+        if not SOURCE_ID_PATTERN.match(source_id):
+            raise ValueError(f"Invalid video source id: {source_id!r}")
+        if source_id in sources:
+            raise ValueError(f"Duplicate video source id: {source_id!r}")
+        sources[source_id] = uri
+    if not sources:
+        raise ValueError("No video sources configured.")
+    return sources
+
+
+def source_kind(uri):
+    if uri.isdigit():
+        return 'camera'
+    if '://' in uri:
+        return 'stream'
+    return 'file'
+
+
+class LoopingCapture:
+    """
+    Restart a video file from the beginning when it ends.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self, frame=None):
+        ret, image = read_frame(self.capture, frame)
+        if not ret:
+            # A failed read hands back an empty array, so retry into `frame` itself
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = read_frame(self.capture, frame)
+        return ret, image
+
+    def release(self):
+        self.capture.release()
+
+
+def open_video_source(uri):
+    """
+    Open a camera index, stream URL or video file for capture.
+    """
+    kind = source_kind(uri)
+    if kind == 'camera':
+        capture = cv2.VideoCapture(int(uri))
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_WIDTH)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_HEIGHT)
+        return capture
+    capture = cv2.VideoCapture(uri)
+    return LoopingCapture(capture) if kind == 'file' else capture
+
+
+class SourceRegistry:
+    """
+    The configured video sources, each served by its own CameraBroadcaster.
+
+    Args:
+        sources: Ordered `{source_id: uri}` mapping (see parse_video_sources).
+        create_pipeline: Callable `(source_id, uri) -> LivePipeline`.
+    """
+
+    def __init__(self, sources, create_pipeline):
+        self.sources = OrderedDict(sources)
+        self.default = next(iter(self.sources))
+        self.broadcasters = OrderedDict(
+            (source_id, CameraBroadcaster(partial(create_pipeline, source_id, uri)))
+            for source_id, uri in self.sources.items()
+        )
+
+    def __contains__(self, source_id):
+        return source_id in self.broadcasters
+
+    def __iter__(self):
+        return iter(self.broadcasters)
+
+    def get(self, source_id=None):
+        """
+        Return the broadcaster of `source_id` (the default source when None).
+
+        Raises:
+            KeyError: If the source is not configured.
+        """
+        return self.broadcasters[source_id or self.default]
+
+    @property
+    def running(self):
+        return any(broadcaster.running for broadcaster in self.broadcasters.values())
+
+    def stop_all(self):
+        for broadcaster in self.broadcasters.values():
+            broadcaster.stop()
+
+    def stats(self):
+        # URIs are left out on purpose: stream URLs often carry credentials
+        return OrderedDict(
+            (source_id, dict(broadcaster.stats(), kind=source_kind(self.sources[source_id])))
+            for source_id, broadcaster in self.broadcasters.items()
+        )
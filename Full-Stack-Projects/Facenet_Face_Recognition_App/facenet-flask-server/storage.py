@@ -0,0 +1,110 @@
+import os
+from collections import namedtuple
+from logger_config import setup_logger
+
+# Initialize logger
+logger = setup_logger()
+
+KNOWN_PEOPLE_PREFIX = 'known_people/'
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}  # Supported image formats
+LIST_PAGE_SIZE = int(os.getenv('STORAGE_LIST_PAGE_SIZE', 1000))
+
+# One enrollment image. `name` is the full object name, `fingerprint` changes
+# whenever the content changes and `source` is the backend handle used to download it.
+StoredImage = namedtuple('StoredImage', ['name', 'person', 'filename', 'fingerprint', 'source'])
+
+
+def blob_fingerprint(blob):
+    """
+    Content fingerprint of a storage object: its generation plus md5 hash.
+    """
+    return f"{getattr(blob, 'generation', '') or ''}:{getattr(blob, 'md5_hash', '') or ''}"
+
+
+def split_person_path(relative_name):
+    """
+    Split `<person>/<file>` into `(person, filename)`.
+
+    Returns None for folder placeholders, files outside a person folder
+    and files without a supported image extension.
+    """
+    person, _, filename = relative_name.partition('/')
+    if not person or not filename or filename.endswith('/'):
+        return None
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        return None
+    return person, filename
+
+
+def group_by_person(images):
+    """
+    Group StoredImage objects into `{person: [StoredImage, ...]}`.
+    """
+    people = {}
+    for image in images:
+        people.setdefault(image.person, []).append(image)
+    return people
+
+
+class FirebaseStorage:
+    """
+    Known-people images stored in a Firebase / Google Cloud Storage bucket.
+
+    The whole prefix is listed once with paginated requests and grouped by
+    person in memory, so people whose folder has no placeholder object are
+    found as well.
+    """
+
+    def __init__(self, bucket, prefix=KNOWN_PEOPLE_PREFIX, page_size=LIST_PAGE_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.page_size = page_size
+
+    def list_images(self):
+        """
+        List every enrollment image under the prefix in a single paginated listing.
+        """
+        images = []
+        pages = 0
+        for page in self.bucket.list_blobs(prefix=self.prefix, page_size=self.page_size).pages:
+            pages += 1
+            for blob in page:
+                parts = split_person_path(blob.name[len(self.prefix):])
+                if parts is not None:
+                    images.append(StoredImage(blob.name, parts[0], parts[1], blob_fingerprint(blob), blob))
+
+        logger.info(f"Listed {len(images)} images under {self.prefix} in {pages} page(s).")
+        return images
+
+    def download(self, image):
+        return image.source.download_as_bytes()
+
+
+class LocalStorage:
+    """
+    Known-people images stored on the local filesystem as `<root>/<person>/<file>`.
+    Useful for development, tests and offline benchmarks.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_images(self):
+        images = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                relative_name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                parts = split_person_path(relative_name)
+                if parts is None:
+                    continue
+                stat = os.stat(path)
+                images.append(StoredImage(KNOWN_PEOPLE_PREFIX + relative_name, parts[0], parts[1],
+                                          f"{stat.st_mtime_ns}:{stat.st_size}", path))
+
+        logger.info(f"Listed {len(images)} images under {self.root}.")
+        return images
+
+    def download(self, image):
+        with open(image.source, 'rb') as f:
+            return f.read()
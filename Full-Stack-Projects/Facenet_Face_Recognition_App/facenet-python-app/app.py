@@ -10,7 +10,7 @@ import numpy as np
 import torch
 from PIL import Image
 from facenet_pytorch import MTCNN, InceptionResnetV1
-from sklearn.metrics.pairwise import cosine_similarity
+from face_gallery import FaceGallery
 from logger_config import setup_logger
 
 # Initialize logger
@@ -20,6 +20,8 @@ logger = setup_logger()
 load_dotenv()
 firebase_secret = os.getenv('FIREBASE_SECRET_KEY')
 threshold = float(os.getenv('RECOGNITION_THRESHOLD', 0.5))  # Load threshold from environment variable
+face_confidence_threshold = float(os.getenv('FACE_CONFIDENCE_THRESHOLD', 0.9))  # Minimum MTCNN face probability
+min_face_size = int(os.getenv('MIN_FACE_SIZE', 20))  # Smallest face (pixels) MTCNN looks for
 
 # Validate Firebase secret key
 if not firebase_secret:
@@ -40,7 +42,7 @@ except Exception as e:
 
 # Initialize FaceNet models
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-mtcnn = MTCNN(keep_all=True, device=device)
+mtcnn = MTCNN(keep_all=True, min_face_size=min_face_size, device=device)
 model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
 
 def load_embeddings():
@@ -133,43 +135,36 @@ def load_known_people_images_from_firebase():
         logger.error(f"Error loading known people images: {e}")
         return {}
 
-def get_face_name(face_embedding, known_embeddings, threshold):
-    for name, encodings in known_embeddings.items():
-        for known_embedding, _ in encodings:
-            if face_embedding.shape != known_embedding.shape:
-                logger.warning(f"Embedding shape mismatch: {face_embedding.shape} vs {known_embedding.shape}")
-                continue
-            
-            similarity = cosine_similarity(face_embedding.reshape(1, -1), known_embedding.reshape(1, -1))[0][0]
-            if similarity >= threshold:
-                return name
-    return "Unknown"
-
-def recognize_faces_in_frame(frame, known_encodings):
+def detect_and_align(rgb_frame):
+    """
+    Single-pass detection and alignment: returns `(boxes, probs, faces)` for the
+    faces above the confidence threshold, where `faces` holds the aligned
+    160x160 tensors MTCNN extracts for those boxes (None when no face was found).
+    """
+    boxes, probs = mtcnn.detect(rgb_frame)
+    if boxes is None:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), None
+
+    keep = probs >= face_confidence_threshold
+    boxes, probs = boxes[keep], probs[keep]
+    if len(boxes) == 0:
+        return boxes, probs, None
+    return boxes, probs, mtcnn.extract(rgb_frame, boxes, None)
+
+def recognize_faces_in_frame(frame, gallery):
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    boxes, _ = mtcnn.detect(rgb_frame)
+    boxes, _, faces = detect_and_align(rgb_frame)
 
-    results = []
-    if boxes is not None and len(boxes) > 0:  
-        for box in boxes:
-            face = rgb_frame[int(box[1]):int(box[3]), int(box[0]):int(box[2])]
-            if face.size == 0:
-                logger.warning("Detected face region is empty.")
-                continue
-
-            mtcnn_face = mtcnn(face)
-            if mtcnn_face is None or len(mtcnn_face) == 0:
-                logger.warning("No face detected in the cropped region.")
-                continue
-
-            face_embedding = model(mtcnn_face.to(device)).detach().cpu().numpy()
-            name = get_face_name(face_embedding, known_encodings, threshold)
-
-            results.append((box, name))
-    else:
+    if faces is None:
         logger.warning("No faces detected in the frame.")
+        return []
+
+    # One forward pass for every face in the frame
+    with torch.inference_mode():
+        face_embeddings = model(faces.to(device)).cpu().numpy()
 
-    return results
+    # Score every face of the frame against the gallery in one matrix product
+    return [(box, match.name) for box, match in zip(boxes, gallery.match(face_embeddings, threshold))]
 
 def annotate_frame(frame, recognized_faces):
     for (box, name) in recognized_faces:
@@ -177,7 +172,7 @@ def annotate_frame(frame, recognized_faces):
         cv2.putText(frame, name, (int(box[0]), int(box[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
 
 def main():
-    known_encodings = load_known_people_images_from_firebase()
+    gallery = FaceGallery(load_known_people_images_from_firebase())
     cap = cv2.VideoCapture(0)
 
     if not cap.isOpened():
@@ -192,7 +187,7 @@ def main():
             logger.error("Failed to capture frame.")
             break
 
-        recognized_faces = recognize_faces_in_frame(frame, known_encodings)
+        recognized_faces = recognize_faces_in_frame(frame, gallery)
         annotate_frame(frame, recognized_faces)
 
         logger.info(f"Detected faces: {len(recognized_faces)}")
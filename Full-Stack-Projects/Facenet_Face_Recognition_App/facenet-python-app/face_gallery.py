@@ -0,0 +1,125 @@
+import os
+from collections import namedtuple
+import numpy as np
+
+# Matching configuration
+MATCH_MODE = os.getenv('MATCH_MODE', 'max').lower()  # max (best sample) | centroid (mean of samples)
+MATCH_TOP_K = int(os.getenv('MATCH_TOP_K', 3))  # Candidate identities reported per face
+MATCH_MIN_MARGIN = float(os.getenv('MATCH_MIN_MARGIN', 0.0))  # Required lead over the runner-up identity
+UNKNOWN_NAME = "Unknown"
+
+# Result for one face: `score` is the cosine similarity of the best identity,
+# `margin` its lead over the runner-up (scored -1 when there is none) and
+# `candidates` the top-k `(name, score)` pairs, best first.
+FaceMatch = namedtuple('FaceMatch', ['name', 'score', 'margin', 'candidates'])
+
+
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """
+    Known face embeddings packed for best-match cosine search.
+
+    Embeddings are L2-normalized once into a matrix whose rows are grouped
+    by identity, so scoring all faces of a frame is one matrix product:
+    'max' mode scores an identity by its closest sample, 'centroid' mode by
+    the normalized mean of its samples. An approximate search index (see
+    search_index.create_index) can be passed in for large galleries; it is
+    used in 'max' mode unless it is exact.
+    """
+
+    def __init__(self, known_encodings, dim=512, mode=MATCH_MODE, top_k=MATCH_TOP_K,
+                 min_margin=MATCH_MIN_MARGIN, index=None):
+        self.dim = dim
+        self.mode = mode
+        self.top_k = max(1, top_k)
+        self.min_margin = min_margin
+        self.names = []
+        self.skipped = 0
+
+        rows, row_identity = [], []
+        for name in sorted(known_encodings):
+            samples = []
+            for embedding, _ in known_encodings[name]:
+                embedding = np.asarray(embedding, dtype=np.float32).ravel()
+                if embedding.shape != (dim,):
+                    self.skipped += 1
+                    continue
+                samples.append(embedding)
+            if samples:
+                row_identity.extend([len(self.names)] * len(samples))
+                self.names.append(name)
+                rows.extend(samples)
+
+        self.matrix = l2_normalize(np.vstack(rows)) if rows else np.empty((0, dim), dtype=np.float32)
+        self.row_identity = np.asarray(row_identity, dtype=np.int64)
+        # First row of every identity, for per-identity reductions
+        self._starts = np.flatnonzero(np.r_[True, np.diff(self.row_identity) != 0]) if rows else self.row_identity
+        # Only 'centroid' mode scores against the per-identity means
+        self.centroids = None
+        if mode == 'centroid' and self.names:
+            counts = np.diff(np.r_[self._starts, len(rows)])
+            self.centroids = l2_normalize(np.add.reduceat(self.matrix, self._starts, axis=0) / counts[:, None])
+        elif mode == 'centroid':
+            self.centroids = np.empty((0, dim), dtype=np.float32)
+
+        self.index = index if index is not None and index.kind != 'exact' else None
+        if self.index is not None and rows:
+            self.index.add(np.arange(len(rows)), self.matrix)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def identity_scores(self, embeddings):
+        """
+        Cosine similarity of every query embedding to every identity, shape `(q, identities)`.
+        """
+        queries = l2_normalize(np.atleast_2d(embeddings))
+        if self.mode == 'centroid':
+            return queries @ self.centroids.T
+        if self.index is not None:
+            return self._indexed_scores(queries)
+        return np.maximum.reduceat(queries @ self.matrix.T, self._starts, axis=1)
+
+    def _indexed_scores(self, queries):
+        # Enough neighbours to cover several samples of the top-k identities
+        distances, ids = self.index.search(queries, min(len(self.matrix), 8 * self.top_k))
+        scores = np.full((len(queries), len(self.names)), -1.0, dtype=np.float32)
+        for q in range(len(queries)):
+            valid = ids[q] >= 0
+            np.maximum.at(scores[q], self.row_identity[ids[q][valid]], 1.0 - distances[q][valid])
+        return scores
+
+    @staticmethod
+    def _top_order(scores, k):
+        # Indices of the k best identities per row, best first, without sorting every identity
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+    def match(self, embeddings, threshold):
+        """
+        Best identity for each row of `embeddings`. A face is named only if
+        its score reaches `threshold` and beats the runner-up by `min_margin`.
+        """
+        embeddings = np.atleast_2d(embeddings)
+        if not self.names:
+            return [FaceMatch(UNKNOWN_NAME, 0.0, 0.0, []) for _ in range(len(embeddings))]
+
+        scores = self.identity_scores(embeddings)
+        order = self._top_order(scores, max(2, self.top_k))
+        matches = []
+        for q in range(len(scores)):
+            best = float(scores[q, order[q, 0]])
+            runner_up = float(scores[q, order[q, 1]]) if scores.shape[1] > 1 else -1.0
+            margin = best - runner_up
+            name = self.names[order[q, 0]] if best >= threshold and margin >= self.min_margin else UNKNOWN_NAME
+            candidates = [(self.names[i], float(scores[q, i])) for i in order[q, :self.top_k]]
+            matches.append(FaceMatch(name, best, margin, candidates))
+        return matches
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The server imports its modules as top-level names from facenet-flask-server/
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'facenet-flask-server')
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
@@ -0,0 +1,371 @@
+import os
+import shutil
+import pickle
+import threading
+import numpy as np
+import pytest
+from embedding_store import (EmbeddingStore, RemoteEmbeddingStore, BlobNotFound, KEEP_GENERATIONS, MANIFEST_NAME,
+                             HEAD_NAME, MIGRATED_FINGERPRINT, matrix_generation)
+
+DIM = 8
+
+
+def embedding(value):
+    return np.full(DIM, value, dtype=np.float32)
+
+
+def matrices(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.npy'))
+
+
+def test_round_trip(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('known_people/ann/1.jpg', 'f1', 'ann', '1.jpg', embedding(1))
+    store.put('known_people/ann/2.jpg', 'f1', 'ann', '2.jpg', None)
+    store.put('known_people/bob/1.jpg', 'f1', 'bob', '1.jpg', embedding(2))
+    assert store.save(keep=store._pending)
+
+    loaded = EmbeddingStore(str(tmp_path), dim=DIM).load()
+
+    assert loaded.generation == 1 and len(loaded) == 3
+    assert loaded.matrix.shape == (2, DIM)
+    assert loaded.get('known_people/ann/2.jpg', 'f1') is None
+    known = loaded.known_embeddings()
+    assert sorted(known) == ['ann', 'bob']
+    np.testing.assert_array_equal(known['bob'][0][0], embedding(2))
+    assert known['bob'][0][1] == '1.jpg'
+
+
+def test_float16_store(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM, dtype='float16')
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(0.5))
+    store.save(keep=['a'])
+
+    loaded = EmbeddingStore(str(tmp_path), dim=DIM, dtype='float16').load()
+    assert loaded.matrix.dtype == np.float16
+    np.testing.assert_array_equal(loaded.get('a', 'f1'), embedding(0.5))
+
+
+def test_changed_fingerprints_miss(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    store.save(keep=['a'])
+
+    with pytest.raises(KeyError):
+        store.get('a', 'f2')
+
+
+def test_save_without_changes_publishes_nothing(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    store.save(keep=['a'])
+
+    assert not store.save(keep=['a'])
+    assert store.generation == 1
+
+
+def test_old_generations_are_pruned(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    for generation in range(1, KEEP_GENERATIONS + 3):
+        store.put('a', f'f{generation}', 'ann', 'a.jpg', embedding(generation))
+        store.save(keep=['a'])
+
+    assert matrices(tmp_path) == [f'embeddings-{g}.npy' for g in range(3, KEEP_GENERATIONS + 3)]
+    np.testing.assert_array_equal(EmbeddingStore(str(tmp_path), dim=DIM).load().get('a', 'f4'), embedding(4))
+
+
+def test_deleted_blobs_are_dropped(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    store.put('b', 'f1', 'bob', 'b.jpg', embedding(2))
+    store.save(keep=['a', 'b'])
+
+    assert store.save(keep=['b'])
+    assert len(store) == 1 and store.matrix.shape == (1, DIM)
+
+
+def test_incompatible_stores_load_empty(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    store.save(keep=['a'])
+
+    assert len(EmbeddingStore(str(tmp_path), dim=2 * DIM).load()) == 0
+    (tmp_path / MANIFEST_NAME).write_text('{not json')
+    assert len(EmbeddingStore(str(tmp_path), dim=DIM).load()) == 0
+
+
+def test_migrated_entries_are_adopted_on_first_sight(tmp_path):
+    pickle_path = tmp_path / 'known_embeddings.pkl'
+    with open(pickle_path, 'wb') as f:
+        pickle.dump({'ann': [(embedding(1), '1.jpg'), (np.zeros(3), 'bad.jpg')]}, f)
+    store = EmbeddingStore(str(tmp_path / 'store'), dim=DIM)
+
+    assert store.migrate_pickle(str(pickle_path), 'known_people/')
+    assert not store.migrate_pickle(str(pickle_path), 'known_people/')
+    assert len(store) == 1
+
+    np.testing.assert_array_equal(store.get('known_people/ann/1.jpg', 'real-fingerprint'), embedding(1))
+    store.save(keep=['known_people/ann/1.jpg'])
+    assert store._entries['known_people/ann/1.jpg']['fingerprint'] == 'real-fingerprint'
+    assert MIGRATED_FINGERPRINT not in {entry['fingerprint'] for entry in store._entries.values()}
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    errors = []
+
+    def writer(worker):
+        try:
+            for i in range(10):
+                with EmbeddingStore(str(tmp_path), dim=DIM).lock() as store:
+                    store.load()
+                    store.put(f'{worker}/{i}', 'f1', str(worker), f'{i}.jpg', embedding(i))
+                    store.save(keep=list(store._entries) + list(store._pending))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    store = EmbeddingStore(str(tmp_path), dim=DIM).load()
+    assert len(store) == 40 and store.generation == 40
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_files_lists_the_manifest_last(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    store.save(keep=['a'])
+
+    assert [os.path.basename(path) for path in store.files()] == ['embeddings-1.npy', MANIFEST_NAME]
+
+
+def test_matrix_generation():
+    assert matrix_generation('embedding_store/embeddings-12.npy') == 12
+    assert matrix_generation('embedding_store/manifest.json') is None
+    assert matrix_generation('embeddings-3.npy.tmp') is None
+
+
+def snapshot_of(store):
+    return store._entries, np.asarray(store.matrix).tolist(), store.generation, store.token
+
+
+def test_delta_rebuilds_the_next_generation(tmp_path):
+    writer = EmbeddingStore(str(tmp_path / 'writer'), dim=DIM)
+    writer.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    writer.put('b', 'f1', 'bob', 'b.jpg', embedding(2))
+    writer.save(keep=['a', 'b'])
+    shutil.copytree(tmp_path / 'writer', tmp_path / 'reader')
+
+    writer.put('a', 'f2', 'ann', 'a.jpg', embedding(3))
+    writer.put('c', 'f1', 'cid', 'c.jpg', None)
+    writer.save(keep=['a', 'c'])
+    assert writer.write_delta(str(tmp_path / 'delta.npz')) == 1
+
+    reader = EmbeddingStore(str(tmp_path / 'reader'), dim=DIM).load()
+    reader.apply_delta(str(tmp_path / 'delta.npz'))
+
+    assert snapshot_of(reader) == snapshot_of(writer)
+    assert snapshot_of(EmbeddingStore(str(tmp_path / 'reader'), dim=DIM).load()) == snapshot_of(writer)
+
+
+def test_delta_only_applies_on_its_parent(tmp_path):
+    writer = EmbeddingStore(str(tmp_path / 'writer'), dim=DIM)
+    writer.put('a', 'f1', 'ann', 'a.jpg', embedding(1))
+    writer.save(keep=['a'])
+    writer.write_delta(str(tmp_path / 'delta.npz'))
+
+    other = EmbeddingStore(str(tmp_path / 'other'), dim=DIM)
+    other.put('b', 'f1', 'bob', 'b.jpg', embedding(2))
+    other.save(keep=['b'])
+
+    with pytest.raises(ValueError):
+        other.apply_delta(str(tmp_path / 'delta.npz'))
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def download_as_bytes(self):
+        if self.name not in self.bucket.objects:
+            self.bucket.on_missing(self.name)
+            raise BlobNotFound(self.name)
+        self.bucket.downloads.append(self.name)
+        return self.bucket.objects[self.name]
+
+    def download_to_filename(self, path):
+        data = self.download_as_bytes()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def upload_from_filename(self, path):
+        with open(path, 'rb') as f:
+            self.upload_from_string(f.read())
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.uploads.append(self.name)
+        self.bucket.objects[self.name] = data.encode() if isinstance(data, str) else data
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    """
+    In-memory stand-in for the Firebase storage bucket.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.downloads = []
+        self.on_missing = lambda name: None
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=''):
+        return [FakeBlob(self, name) for name in sorted(self.objects) if name.startswith(prefix)]
+
+    def names(self, prefix='store/'):
+        return sorted(name[len(prefix):] for name in self.objects if name.startswith(prefix))
+
+
+def add_person(store, name, value):
+    store.put(name, 'f1', name, f'{name}.jpg', embedding(value))
+    store.save(keep=list(store._entries) + [name])
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket()
+
+
+def test_push_uploads_a_snapshot_then_deltas(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/')
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    for i in range(4):
+        add_person(store, f'p{i}', i)
+    assert remote.push(store) == 'snapshot'
+
+    add_person(store, 'p4', 4)
+    bucket.uploads.clear()
+    assert remote.push(store) == 'delta'
+    assert bucket.uploads == [f'store/delta-5-{store.token}.npz', f'store/{HEAD_NAME}']
+    assert remote.push(store) is None
+
+
+def test_pull_seeds_an_empty_store_and_applies_only_missing_deltas(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/')
+    writer = EmbeddingStore(str(tmp_path / 'writer'), dim=DIM)
+    for i in range(4):
+        add_person(writer, f'p{i}', i)
+    remote.push(writer)
+    add_person(writer, 'p4', 4)
+    remote.push(writer)
+
+    reader = EmbeddingStore(str(tmp_path / 'reader'), dim=DIM).load()
+    assert remote.pull(reader)
+    assert snapshot_of(reader) == snapshot_of(writer)
+    assert not remote.pull(reader)
+
+    writer.put('p0', 'f2', 'p0', 'p0.jpg', embedding(9))
+    writer.save(keep=['p0', 'p1', 'p2', 'p3'])
+    assert remote.push(writer) == 'delta'
+    bucket.downloads.clear()
+    assert remote.pull(reader)
+    assert snapshot_of(reader) == snapshot_of(writer)
+    assert [name for name in bucket.downloads if 'snapshot' in name] == []
+
+
+def test_long_chains_and_large_deltas_push_snapshots(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/', max_deltas=2)
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    for i in range(4):
+        add_person(store, f'p{i}', i)
+    pushes = [remote.push(store)]
+    for i in range(4, 7):
+        add_person(store, f'p{i}', i)
+        pushes.append(remote.push(store))
+
+    assert pushes == ['snapshot', 'delta', 'delta', 'snapshot']
+
+    for i in range(4):
+        store.put(f'p{i}', 'f2', f'p{i}', f'p{i}.jpg', embedding(10 + i))
+    store.save(keep=store._entries)
+    assert remote.push(store) == 'snapshot'  # 4 of 7 rows changed
+
+
+def test_snapshot_push_keeps_the_previous_chain_and_drops_older_files(tmp_path, bucket):
+    bucket.objects.update({'store/manifest.json': b'{}', 'store/embeddings-3.npy': b'', 'other/keep.bin': b''})
+    remote = RemoteEmbeddingStore(bucket, 'store/', max_deltas=1)
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    for i in range(4):
+        add_person(store, f'p{i}', i)
+
+    tokens = {}
+    for i in range(4, 7):
+        remote.push(store)
+        tokens[store.generation] = store.token
+        add_person(store, f'p{i}', i)
+    remote.push(store)
+    tokens[store.generation] = store.token
+
+    # Generations 4 (snapshot), 5 (delta), 6 (snapshot), 7 (delta)
+    assert bucket.names() == sorted([HEAD_NAME, f'snapshot-6-{tokens[6]}.npy', f'snapshot-6-{tokens[6]}.json',
+                                     f'delta-7-{tokens[7]}.npz', f'snapshot-4-{tokens[4]}.npy',
+                                     f'snapshot-4-{tokens[4]}.json', f'delta-5-{tokens[5]}.npz'])
+    assert 'other/keep.bin' in bucket.objects
+
+
+def test_pull_starts_over_when_the_chain_is_pruned(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/', max_deltas=0)
+    writer = EmbeddingStore(str(tmp_path / 'writer'), dim=DIM)
+    add_person(writer, 'p0', 0)
+    remote.push(writer)
+    # The snapshot the reader is about to fetch disappears, and a newer head is published
+    stale = [name for name in bucket.objects if 'snapshot' in name]
+    for name in stale:
+        del bucket.objects[name]
+
+    def publish_newer(name):
+        bucket.on_missing = lambda name: None
+        add_person(writer, 'p1', 1)
+        remote.push(writer)
+
+    bucket.on_missing = publish_newer
+    reader = EmbeddingStore(str(tmp_path / 'reader'), dim=DIM).load()
+
+    assert remote.pull(reader)
+    assert snapshot_of(reader) == snapshot_of(writer)
+
+
+def test_pull_gives_up_on_a_broken_chain(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/')
+    writer = EmbeddingStore(str(tmp_path / 'writer'), dim=DIM)
+    for i in range(4):
+        add_person(writer, f'p{i}', i)
+    remote.push(writer)
+    add_person(writer, 'p4', 4)
+    remote.push(writer)
+    del bucket.objects[f'store/delta-5-{writer.token}.npz']
+
+    reader = EmbeddingStore(str(tmp_path / 'reader'), dim=DIM).load()
+    assert not remote.pull(reader)
+    assert reader.generation == 4 and len(reader) == 4
+    assert not [name for name in os.listdir(tmp_path / 'reader') if name.endswith('.tmp')]
+
+
+def test_pull_ignores_an_empty_or_incompatible_bucket(tmp_path, bucket):
+    remote = RemoteEmbeddingStore(bucket, 'store/')
+    store = EmbeddingStore(str(tmp_path / 'a'), dim=DIM)
+    assert not remote.pull(store)
+
+    add_person(store, 'p0', 0)
+    remote.push(store)
+    assert not remote.pull(EmbeddingStore(str(tmp_path / 'b'), dim=2 * DIM))
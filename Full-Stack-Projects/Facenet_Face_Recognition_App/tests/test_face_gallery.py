@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from face_gallery import FaceGallery, UNKNOWN_NAME, l2_normalize
+from search_index import ExactIndex, IVFIndex
+
+DIM = 4
+
+
+def known(**people):
+    return {name: [(np.asarray(sample, dtype=np.float32), f'{name}{i}.jpg') for i, sample in enumerate(samples)]
+            for name, samples in people.items()}
+
+
+GALLERY = known(
+    ann=[[1, 0, 0, 0], [0.6, 0.8, 0, 0]],
+    bob=[[0, 0, 1, 0]],
+    cid=[[0, 0, 0.9, 0.1], [0, 0, 0, 1]],
+)
+
+
+def test_max_mode_scores_the_closest_sample():
+    gallery = FaceGallery(GALLERY, dim=DIM, mode='max')
+
+    scores = gallery.identity_scores([0, 1, 0, 0])
+
+    assert gallery.names == ['ann', 'bob', 'cid']
+    np.testing.assert_allclose(scores, [[0.8, 0, 0]], atol=1e-6)
+    assert gallery.centroids is None
+
+
+def test_centroid_mode_scores_the_mean_sample():
+    gallery = FaceGallery(GALLERY, dim=DIM, mode='centroid')
+
+    expected = l2_normalize([l2_normalize(np.array([[1, 0, 0, 0], [0.6, 0.8, 0, 0]])).mean(axis=0)])
+    np.testing.assert_allclose(gallery.centroids[0], expected[0], atol=1e-6)
+    assert gallery.centroids.shape == (3, DIM)
+    assert gallery.identity_scores([1, 0, 0, 0])[0, 0] == pytest.approx(float(expected[0, 0]), abs=1e-6)
+
+
+def test_match_applies_threshold_and_margin():
+    gallery = FaceGallery(GALLERY, dim=DIM, mode='max', top_k=2)
+
+    match, = gallery.match([0, 0, 1, 0], threshold=0.9)
+    assert match.name == 'bob'
+    assert match.score == pytest.approx(1.0)
+    assert [name for name, _ in match.candidates] == ['bob', 'cid']
+    assert match.margin == pytest.approx(1.0 - match.candidates[1][1])
+
+    assert gallery.match([0, 0, 1, 0], threshold=1.1)[0].name == UNKNOWN_NAME
+
+    strict = FaceGallery(GALLERY, dim=DIM, mode='max', min_margin=0.1)
+    assert strict.match([0, 0, 1, 0], threshold=0.9)[0].name == UNKNOWN_NAME
+
+
+def test_top_k_candidates_are_sorted_best_first():
+    rng = np.random.default_rng(0)
+    people = {f'p{i:02d}': [(rng.normal(size=16), 'a.jpg'), (rng.normal(size=16), 'b.jpg')] for i in range(30)}
+    gallery = FaceGallery(people, dim=16, mode='max', top_k=5)
+    queries = rng.normal(size=(10, 16))
+
+    scores = gallery.identity_scores(queries)
+    for q, match in enumerate(gallery.match(queries, threshold=2)):
+        expected = np.argsort(-scores[q])[:5]
+        assert [name for name, _ in match.candidates] == [gallery.names[i] for i in expected]
+
+
+def test_top_k_larger_than_the_gallery():
+    gallery = FaceGallery(known(ann=[[1, 0, 0, 0]]), dim=DIM, top_k=3)
+
+    match, = gallery.match([1, 0, 0, 0], threshold=0.5)
+    assert match.name == 'ann'
+    assert match.margin == pytest.approx(2.0)
+    assert match.candidates == [('ann', pytest.approx(1.0))]
+
+
+def test_wrong_dimensions_are_skipped():
+    gallery = FaceGallery(known(ann=[[1, 0, 0, 0], [1, 0]], bob=[[1, 0]]), dim=DIM)
+
+    assert gallery.names == ['ann']
+    assert gallery.skipped == 2
+    assert len(gallery) == 1
+
+
+@pytest.mark.parametrize('mode', ['max', 'centroid'])
+def test_empty_gallery_matches_nobody(mode):
+    gallery = FaceGallery({}, dim=DIM, mode=mode)
+
+    assert [match.name for match in gallery.match(np.ones((2, DIM)), threshold=0)] == [UNKNOWN_NAME] * 2
+
+
+def test_approximate_index_matches_the_exact_scores():
+    rng = np.random.default_rng(1)
+    people = {f'p{i:03d}': [(rng.normal(size=16), 'a.jpg')] for i in range(300)}
+    exact = FaceGallery(people, dim=16, mode='max', top_k=3)
+    indexed = FaceGallery(people, dim=16, mode='max', top_k=3,
+                          index=IVFIndex(16, metric='cosine', nlist=8, nprobe=8, min_train_size=100))
+
+    queries = exact.matrix[:20] + 0.05 * rng.normal(size=(20, 16)).astype(np.float32)
+    assert indexed.index is not None and indexed.index.is_trained
+    assert [m.name for m in indexed.match(queries, 0.5)] == [m.name for m in exact.match(queries, 0.5)]
+
+
+def test_exact_index_is_not_used():
+    assert FaceGallery(GALLERY, dim=DIM, index=ExactIndex(DIM, metric='cosine')).index is None